@@ -0,0 +1,105 @@
+"""
+CLI 启动耗时基准.
+
+    python benchmarks/bench_startup.py [--runs 10] [--budget-ms 400]
+
+对每个场景启动若干次新的解释器, 报告中位数/最大耗时, 并检查不应在该场景
+加载的重量级模块 (例如 openai). 任一场景超出预算或加载了禁止的模块时
+返回非零退出码, 可以直接放进 CI.
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+from pathlib import Path
+
+import typer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (场景名, 要执行的 CLI 参数, 该场景下不应被导入的模块)
+SCENARIOS = [
+    ("import vpilot.main", None, ["openai", "yaml", "vpilot.commands.uvm"]),
+    (
+        "vpilot --help",
+        ["--help"],
+        ["openai", "dotenv", "vpilot.core.llm_handler", "vpilot.commands.uvm"],
+    ),
+    ("vpilot plan --help", ["plan", "--help"], ["openai", "vpilot.commands.uvm"]),
+    (
+        "vpilot stats --help",
+        ["stats", "--help"],
+        ["openai", "yaml", "vpilot.core.llm_handler"],
+    ),
+]
+
+# 在子进程中执行: 运行 CLI (或仅导入), 然后报告已加载的模块
+PROBE = """
+import sys, json
+import vpilot.main
+args = json.loads(sys.argv[1])
+if args is not None:
+    try:
+        vpilot.main.app(args, prog_name="vpilot")
+    except SystemExit:
+        pass
+sys.stderr.write("\\nVPILOT_MODULES=" + json.dumps(sorted(sys.modules)) + "\\n")
+"""
+
+
+def _run_once(args):
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "x"))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE, json.dumps(args)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    modules = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("VPILOT_MODULES="):
+            modules = json.loads(line[len("VPILOT_MODULES=") :])
+    return elapsed, set(modules)
+
+
+def main(
+    runs: int = typer.Option(10, "--runs", "-n", help="每个场景的运行次数"),
+    budget_ms: float = typer.Option(
+        400.0, "--budget-ms", help="每个场景的中位数耗时上限 (毫秒)"
+    ),
+):
+    failed = False
+    # 中文标题占两列, 手工对齐
+    typer.echo("场景" + " " * 22 + "中位数ms" + " " * 4 + "最大ms  结果")
+    for name, args, forbidden in SCENARIOS:
+        samples = []
+        loaded = set()
+        for _ in range(runs):
+            elapsed, modules = _run_once(args)
+            samples.append(elapsed * 1000)
+            loaded |= modules
+
+        median = statistics.median(samples)
+        problems = [f"导入了 {m}" for m in forbidden if m in loaded]
+        if median > budget_ms:
+            problems.append(f"超出预算 {budget_ms:.0f}ms")
+        failed = failed or bool(problems)
+
+        typer.secho(
+            f"{name:<24}{median:>10.1f}{max(samples):>10.1f}  "
+            + ("; ".join(problems) or "OK"),
+            fg=typer.colors.RED if problems else typer.colors.GREEN,
+        )
+
+    if failed:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
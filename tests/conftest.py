@@ -0,0 +1,112 @@
+import json
+import re
+import threading
+from pathlib import Path
+
+import pytest
+
+from vpilot.core import llm_handler
+from vpilot.core.llm_backends import usage_from_fixture
+
+SKELETON_DIR = Path(__file__).resolve().parent.parent / "vpilot" / "skeletons"
+
+SPEC = """module_name: my_dut
+design_type: sequential
+description: a counter
+ports: []
+"""
+PLAN = """uvm_topology: {agents: [in]}
+sequence_library: [{name: SanityCheckSeq}]
+coverage_points: []
+"""
+
+
+def fill_response(prompt):
+    """按提示中的 'v-pilot:fill:<文件>:' 填充该骨架文件的所有代码块."""
+    match = re.search(r"v-pilot:fill:([\w.]+):", prompt)
+    if not match or "蓝图" in prompt:
+        return "OK, ready."
+    relative_file = match.group(1)
+    content = (SKELETON_DIR / relative_file).read_text(encoding="utf-8")
+    parts = []
+    for block in re.finditer(
+        r"^([ \t]*)# LLM_GENERATED_START: (\w+)", content, re.MULTILINE
+    ):
+        indent, block_id = block.groups()
+        if not relative_file.endswith(".py"):
+            code = f"# {block_id}\nFOO := 1"
+        elif indent:
+            code = f"{indent}pass  # {block_id}"
+        else:
+            code = f"x_{block_id.lower()} = 1"
+        parts.append(f"v-pilot:fill:{relative_file}:{block_id}\n{code}\n")
+    if relative_file == "base_bfm.py":
+        parts.append("v-pilot:context:bfm_methods:['reset', 'drive']\n")
+    if relative_file == "env.py":
+        parts.append("v-pilot:context:sequencers:['env.agent.seqr']\n")
+    return "\n".join(parts)
+
+
+class FakeBackend:
+    """
+    不访问网络的 LLM 后端 (接口见 llm_handler.configure_backend).
+    fail_on: 最后一条消息包含该字符串时抛出 RuntimeError.
+    """
+
+    def __init__(self, respond=fill_response):
+        self.respond = respond
+        self.fail_on = None
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def connection_info(self):
+        return {}
+
+    def complete(self, model, messages, timeout=None):
+        prompt = messages[-1]["content"]
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError("injected failure")
+        with self._lock:
+            self.prompts.append(prompt)
+        content = self.respond(prompt)
+        usage = {"prompt_tokens": 100, "completion_tokens": len(content) // 4}
+        return content, usage_from_fixture({"usage": usage}), None
+
+    def stream(self, model, messages, on_delta, timeout=None):
+        content, usage, _ = self.complete(model, messages, timeout)
+        for i in range(0, len(content), 7):
+            on_delta(content[i : i + 7])
+        return content, usage, 0.0
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(llm_handler, "_backend", backend)
+    monkeypatch.setattr(llm_handler, "_cache", None)
+    monkeypatch.setattr(
+        llm_handler, "_cache_settings", {"enabled": False, "refresh": False}
+    )
+    # CLI 的根回调在指定 --no-cache/--refresh 时会设置它, 测试结束后还原
+    monkeypatch.setenv("VPILOT_LLM_CACHE", "off")
+    return backend
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """一个已批准 spec/plan 的项目目录 (并切换到该目录)."""
+    run_dir = tmp_path / "vpilot_run"
+    run_dir.mkdir()
+    (run_dir / "my_dut.design_spec.final.yml").write_text(SPEC, encoding="utf-8")
+    (run_dir / "my_dut.verif_plan.final.yml").write_text(PLAN, encoding="utf-8")
+    state = {
+        "current_stage": "uvm_build",
+        "spec_approved": True,
+        "plan_approved": True,
+        "final_spec_file": "vpilot_run/my_dut.design_spec.final.yml",
+        "final_plan_file": "vpilot_run/my_dut.verif_plan.final.yml",
+        "module_name": "my_dut",
+    }
+    (run_dir / ".vpilot.state.json").write_text(json.dumps(state), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,118 @@
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import yaml
+from typer.testing import CliRunner
+
+from vpilot.commands.batch import _load_modules
+from vpilot.core import llm_handler
+from vpilot.main import app
+
+PLAN = "uvm_topology: {agents: [in]}\nsequence_library: []\ncoverage_points: []\n"
+
+
+def _respond_by_stage(fill_response):
+    """spec/plan 阶段返回 YAML, uvm 阶段按骨架填充."""
+
+    def respond(prompt):
+        rtl = re.search(r"RTL代码 \(`(\w+)\.s?v`\)", prompt)
+        if rtl:
+            return f"module_name: {rtl.group(1)}\ndesign_type: sequential\nports: []\n"
+        if "<验证计划>YAML模板" in prompt:
+            return PLAN
+        return fill_response(prompt)
+
+    return respond
+
+
+def test_modules_come_from_a_manifest_or_an_rtl_dir(tmp_path):
+    (tmp_path / "rtl").mkdir()
+    for name in ("fifo.v", "alu.sv", "notes.txt"):
+        (tmp_path / "rtl" / name).write_text("module m; endmodule\n")
+    modules = _load_modules(None, tmp_path / "rtl", "RTL 模块 {name}")
+    assert [(m["name"], m["desc"]) for m in modules] == [
+        ("alu", "RTL 模块 alu"),
+        ("fifo", "RTL 模块 fifo"),
+    ]
+
+    manifest = tmp_path / "modules.yml"
+    manifest.write_text(
+        yaml.safe_dump(
+            {"modules": [{"rtl": "rtl/fifo.v"}, {"name": "a", "rtl": "rtl/alu.sv"}]}
+        )
+    )
+    modules = _load_modules(manifest, None, "{name}")
+    assert [m["name"] for m in modules] == ["fifo", "a"]
+    assert modules[0]["rtl"] == tmp_path / "rtl" / "fifo.v"
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="工作进程需要继承测试中替换的 LLM 后端",
+)
+def test_batch_runs_each_module_in_its_own_directory(
+    tmp_path, fake_backend, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    fake_backend.respond = _respond_by_stage(fake_backend.respond)
+    (tmp_path / "rtl").mkdir()
+    for name in ("fifo", "alu"):
+        (tmp_path / "rtl" / f"{name}.v").write_text(f"module {name}; endmodule\n")
+
+    result = CliRunner().invoke(
+        app, ["batch", "--rtl-dir", "rtl", "--workers", "2", "--llm-concurrency", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "完成 2/2 个模块" in result.output
+    for name in ("fifo", "alu"):
+        module_dir = tmp_path / "vpilot_batch" / name
+        assert (module_dir / "rtl" / f"{name}.v").exists()
+        assert (module_dir / "vpilot_run" / f"{name}.design_spec.final.yml").exists()
+        assert (module_dir / "uvm_tb" / "env.py").exists()
+
+
+def test_batch_reports_a_failing_module(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "rtl").mkdir()
+    (tmp_path / "rtl" / "fifo.v").write_text("module fifo; endmodule\n")
+    # LLM 不返回有效的 YAML: spec 阶段失败
+    fake_backend.respond = lambda prompt: "not: [valid"
+
+    result = CliRunner().invoke(app, ["batch", "--rtl-dir", "rtl"])
+    assert result.exit_code == 1
+    assert "完成 0/1 个模块" in result.output
+    assert "fifo: spec:" in result.output
+
+
+def test_llm_concurrency_limit_bounds_in_flight_requests(
+    tmp_path, fake_backend, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def respond(prompt):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return "ok"
+
+    fake_backend.respond = respond
+    with multiprocessing.Manager() as manager:
+        monkeypatch.setattr(
+            llm_handler, "_request_limiter", manager.BoundedSemaphore(2)
+        )
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(
+                pool.map(
+                    lambda i: llm_handler.generate_text(f"p{i}", model="m"), range(8)
+                )
+            )
+    assert in_flight[1] == 2
@@ -0,0 +1,36 @@
+import pytest
+
+from vpilot.core.code_manager import BlockMarkerError, index_blocks
+
+SKELETON = """class MyEnv:
+    def build_phase(self):
+        # LLM_GENERATED_START: BUILD
+        pass
+        # LLM_GENERATED_END: BUILD
+"""
+
+
+def test_index_blocks_records_offsets_and_indent():
+    index = index_blocks(SKELETON)
+    entry = index["BUILD"]
+    assert entry["indent"] == "        "
+    assert entry["line"] == 3
+    assert SKELETON[entry["body_start"] : entry["body_end"]].strip() == "pass"
+    assert SKELETON[: entry["end"]].endswith("# LLM_GENERATED_END: BUILD")
+
+
+@pytest.mark.parametrize(
+    "content, message",
+    [
+        ("# LLM_GENERATED_START: A\n# LLM_GENERATED_START: B\n", "嵌套"),
+        ("# LLM_GENERATED_END: A\n", "没有对应的 START"),
+        ("# LLM_GENERATED_START: A\n", "缺少 END"),
+        (
+            "# LLM_GENERATED_START: A\n# LLM_GENERATED_END: A\n" * 2,
+            "重复",
+        ),
+    ],
+)
+def test_index_blocks_rejects_broken_markers(content, message):
+    with pytest.raises(BlockMarkerError, match=message):
+        index_blocks(content)
@@ -0,0 +1,110 @@
+from vpilot.core.code_manager import CodeManager, check_content, reindent
+
+SKELETON = """class MyEnv:
+    def build_phase(self):
+        # LLM_GENERATED_START: BUILD
+        pass
+        # LLM_GENERATED_END: BUILD
+"""
+
+
+def test_reindent_shifts_block_to_marker_indent():
+    code = "if x:\n    y = 1\nz = 2"
+    assert reindent(code, "    ") == "    if x:\n        y = 1\n    z = 2"
+
+
+def test_reindent_ignores_less_indented_leading_comment():
+    body = "            seq_item = await self.seq_item_port.get_next_item()\n"
+    body += "            self.seq_item_port.item_done()"
+    code = "        # 驱动一个事务\n" + body
+    # 代码行已经对齐到标签的缩进, 注释行不影响基准
+    reindented = reindent(code, "            ")
+    assert reindented == code
+    source = "async def run(self):\n    while True:\n        if True:\n"
+    assert check_content("driver.py", source + reindented) is None
+    assert reindent(code, "        ").split("\n") == [
+        "        # 驱动一个事务",
+        "        seq_item = await self.seq_item_port.get_next_item()",
+        "        self.seq_item_port.item_done()",
+    ]
+
+
+def test_reindent_keeps_multiline_string_contents(tmp_path):
+    code = '''def helper():
+    """Docstring.
+
+  indented by two
+    """
+    return """line one
+  line two
+"""
+query = f"""select *
+from {helper()}"""'''
+    spliced = CodeManager(tmp_path).splice_blocks(
+        SKELETON, {"BUILD": code}, relative_file="env.py"
+    )
+
+    assert "        def helper():\n" in spliced
+    assert "            return " in spliced
+    # 字符串内部的行不随代码块平移
+    assert '\n  indented by two\n    """\n' in spliced
+    assert '"""line one\n  line two\n"""' in spliced
+    assert "\nfrom {helper()}" in spliced
+    assert check_content("env.py", spliced) is None
+
+
+def _env_file(tmp_path):
+    content = SKELETON + (
+        "\n    def connect_phase(self):\n"
+        "        # LLM_GENERATED_START: CONNECT\n"
+        "        pass\n"
+        "        # LLM_GENERATED_END: CONNECT\n"
+    )
+    (tmp_path / "env.py").write_text(content, encoding="utf-8")
+    return content
+
+
+def test_update_blocks_keeps_original_when_candidate_is_invalid(tmp_path):
+    original = _env_file(tmp_path)
+    manager = CodeManager(tmp_path)
+
+    assert not manager.update_blocks("env.py", {"BUILD": "self.x = (\n"})
+    assert (tmp_path / "env.py").read_text(encoding="utf-8") == original
+
+
+def test_update_blocks_applies_only_the_valid_blocks(tmp_path):
+    _env_file(tmp_path)
+    manager = CodeManager(tmp_path)
+
+    applied = manager.update_blocks(
+        "env.py", {"BUILD": "self.agent = Agent()", "CONNECT": "self.x = (\n"}
+    )
+    assert not applied
+    assert manager.read_block("env.py", "BUILD") == "self.agent = Agent()"
+    assert manager.read_block("env.py", "CONNECT") == "pass"
+    assert check_content("env.py", (tmp_path / "env.py").read_text()) is None
+
+
+def test_check_content_reports_compile_time_errors():
+    # ast.parse 能解析, 但编译时才报错的代码
+    cases = {
+        "return 1\n": "'return' outside function",
+        "def f():\n    nonlocal x\n": "no binding for nonlocal 'x' found",
+        "def f():\n    await g()\n": "'await' outside async function",
+        "for i in range(3):\n    pass\nbreak\n": "'break' outside loop",
+    }
+    for source, message in cases.items():
+        error = check_content("driver.py", source)
+        assert error is not None and message in error, (source, error)
+    assert check_content("driver.py", "async def f():\n    await g()\n") is None
+
+
+def test_check_makefile_ignores_parentheses_in_quoted_strings():
+    content = (
+        'CLOSE := $(shell echo ")")\n'
+        "all:\n"
+        "\techo \"(\" '{'\n"
+        '\techo "a \\" (" # )\n'
+    )
+    assert check_content("Makefile", content) is None
+    assert "括号不配对" in check_content("Makefile", "FOO := $(shell echo x\n")
@@ -0,0 +1,75 @@
+import pytest
+
+from vpilot.commands.uvm import SKELETON_DIR, UVM_BUILD_TASKS
+from vpilot.core.context_extractor import (
+    block_texts,
+    extract,
+    extract_files,
+    referenced_symbols,
+)
+
+
+def _dependency_context(task_id):
+    """与 uvm build 相同的方式生成任务的依赖文件上下文."""
+    task = next(t for t in UVM_BUILD_TASKS if t["id"] == task_id)
+    content = (SKELETON_DIR / task["file"]).read_text(encoding="utf-8")
+    symbols = referenced_symbols(task["prompt"], *block_texts(content))
+    files = {
+        dep: (SKELETON_DIR / dep).read_text(encoding="utf-8") for dep in task["deps"]
+    }
+    extracted, before, after = extract_files(files, symbols)
+    assert after < before
+    return extracted
+
+
+@pytest.mark.parametrize(
+    "task_id, dep, assignments",
+    [
+        (
+            "env",
+            "agent.py",
+            [
+                'self.monitor = Monitor.create("monitor", self)',
+                'self.driver = Driver.create("driver", self)',
+                'self.sequencer = uvm_sequencer.create("sequencer", self)',
+            ],
+        ),
+        (
+            "test_lib",
+            "base_test.py",
+            ['self.env = TestEnv.create("env", self)', "self.bfm = BaseBfm()"],
+        ),
+    ],
+)
+def test_dependency_context_keeps_component_assignments(task_id, dep, assignments):
+    context = _dependency_context(task_id)[dep]
+    for assignment in assignments:
+        assert assignment in context
+
+
+def test_unreferenced_method_bodies_are_elided():
+    content = """import os
+
+
+class Bfm:
+    def __init__(self):
+        self.queue = Queue()
+        self.count = 0
+
+    def helper(self):
+        x = os.getcwd()
+        return x
+
+    def used(self):
+        return 1
+"""
+    extracted = extract(content, "bfm.py", {"used"})
+    assert "self.queue = Queue()" in extracted
+    assert "self.count = 0" not in extracted
+    assert "os.getcwd()" not in extracted
+    assert "    def helper(self):\n        ...\n" in extracted
+    assert "    def used(self):\n        return 1\n" in extracted
+
+
+def test_non_python_files_are_returned_unchanged():
+    assert extract("TOPLEVEL = dut\n", "Makefile") == "TOPLEVEL = dut\n"
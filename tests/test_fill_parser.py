@@ -0,0 +1,40 @@
+from vpilot.core.fill_parser import BLOCK_MARKER, FillStreamParser
+
+RESPONSE = (
+    "好的, 以下是代码.\n"
+    "v-pilot:fill:env.py:BUILD\n        self.agent = Agent()\n"
+    "v-pilot:context:sequencers:['env.agent.seqr']\n"
+    "v-pilot:fill:env.py:CONNECT\n        pass\n"
+)
+
+
+def _feed(chunks):
+    blocks = []
+    parser = FillStreamParser(blocks.append)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser, blocks
+
+
+def test_blocks_match_split_for_every_chunk_size():
+    expected = [block for block in RESPONSE.split(BLOCK_MARKER)[1:] if block.strip()]
+    for size in range(1, len(RESPONSE) + 1):
+        chunks = [RESPONSE[i : i + size] for i in range(0, len(RESPONSE), size)]
+        parser, blocks = _feed(chunks)
+        parser.close()
+        assert blocks == expected, size
+
+
+def test_marker_split_across_chunks_is_recognized():
+    parser, blocks = _feed(
+        ["v-", "pilot:fill:a.py:X\nx = 1\nv-pil", "ot:fill:a.py:Y\n"]
+    )
+    assert blocks == ["fill:a.py:X\nx = 1\n"]
+    assert parser.blocks_emitted == 1
+
+
+def test_last_block_is_emitted_only_on_close():
+    parser, blocks = _feed(["v-pilot:fill:a.py:X\nx = 1\n"])
+    assert blocks == []
+    parser.close()
+    assert blocks == ["fill:a.py:X\nx = 1\n"]
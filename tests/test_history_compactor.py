@@ -0,0 +1,45 @@
+from vpilot.core.history_compactor import compact_messages, stable_prefix_length
+
+SYSTEM = {"role": "system", "content": "你是 UVM 专家. " * 50}
+BLUEPRINT = {"role": "user", "content": "spec.yml 和 plan.yml 蓝图 " * 200}
+ACK = {"role": "assistant", "content": "OK, ready."}
+
+
+def _turn(n):
+    return [
+        {
+            "role": "user",
+            "content": f"[!!] 依赖文件: a.py\n--- (内容开始) ---\n{'x = 1' * 300}\n"
+            f"--- (内容结束) ---\n任务 {n}: 填充 env.py",
+        },
+        {"role": "assistant", "content": f"v-pilot:fill:env.py:BUILD\n{'y' * 400}\n"},
+    ]
+
+
+def test_stable_prefix_is_system_prompt_and_blueprint_turn():
+    assert stable_prefix_length([SYSTEM, BLUEPRINT, ACK, *_turn(1)]) == 3
+    assert stable_prefix_length([SYSTEM, BLUEPRINT]) == 1
+    assert stable_prefix_length([BLUEPRINT, ACK]) == 2
+
+
+def test_compaction_only_rewrites_the_tail_after_the_prefix():
+    messages = [SYSTEM, BLUEPRINT, ACK]
+    for n in range(1, 6):
+        messages += _turn(n)
+    current = {"role": "user", "content": "任务 6: 填充 test_lib.py"}
+    messages.append(current)
+
+    compacted, stats = compact_messages(messages, token_budget=1500)
+    assert stats["tokens_saved"] > 0
+    assert compacted[:3] == [SYSTEM, BLUEPRINT, ACK]
+    assert compacted[-1] == current
+    assert compacted[3] != messages[3]
+    # 历史本身不被修改
+    assert messages[3] == _turn(1)[0]
+
+
+def test_history_within_budget_is_unchanged():
+    messages = [SYSTEM, BLUEPRINT, ACK, *_turn(1)]
+    compacted, stats = compact_messages(messages, token_budget=10**6)
+    assert compacted is messages
+    assert stats["tokens_saved"] == 0
@@ -0,0 +1,58 @@
+import json
+
+from vpilot.core import history_store
+
+
+def _message(n):
+    return {"role": "user", "content": f"m{n}"}
+
+
+def test_append_goes_to_journal_until_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, "COMPACT_EVERY", 4)
+    history = tmp_path / "h.json"
+    history_store.write(history, [_message(0)])
+
+    history_store.append(history, [_message(1), _message(2)])
+    journal = history_store.journal_path(history)
+    assert journal.exists()
+    assert len(json.loads(history.read_text(encoding="utf-8"))) == 1
+    assert history_store.load(history) == [_message(n) for n in range(3)]
+
+    # 日志累计到 COMPACT_EVERY 条: 合并回快照并删除日志
+    history_store.append(history, [_message(3), _message(4)])
+    assert not journal.exists()
+    assert json.loads(history.read_text(encoding="utf-8")) == [
+        _message(n) for n in range(5)
+    ]
+
+
+def test_truncated_last_journal_line_is_ignored_and_overwritten(tmp_path):
+    history = tmp_path / "h.json"
+    history_store.write(history, [_message(0)])
+    history_store.append(history, [_message(1)])
+    # 模拟追加日志时中断: 最后一行只写了一半
+    journal = history_store.journal_path(history)
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"i": 2, "message": {"role": "us')
+
+    history_store._cache.clear()
+    assert history_store.load(history) == [_message(0), _message(1)]
+
+    # 下一次追加截掉写了一半的行, 不会与新行拼接在一起
+    history_store.append(history, [_message(2)])
+    history_store._cache.clear()
+    assert history_store.load(history) == [_message(n) for n in range(3)]
+
+
+def test_journal_entries_already_in_snapshot_are_skipped(tmp_path):
+    history = tmp_path / "h.json"
+    history_store.write(history, [_message(0)])
+    history_store.append(history, [_message(1)])
+    journal_text = history_store.journal_path(history).read_text(encoding="utf-8")
+
+    # 合并进快照之后, 删除日志之前中断
+    history_store.compact(history)
+    history_store.journal_path(history).write_text(journal_text, encoding="utf-8")
+
+    history_store._cache.clear()
+    assert history_store.load(history) == [_message(0), _message(1)]
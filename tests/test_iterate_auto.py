@@ -0,0 +1,61 @@
+import json
+import shutil
+
+import pytest
+from typer.testing import CliRunner
+
+from vpilot.commands.uvm import UVM_ITERATE_RECORD
+from vpilot.main import app
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="需要 make")
+
+# 代替 cocotb 的 Makefile: env.py 被修复之前测试失败
+MAKEFILE = """all:
+\t@grep -q FIXED env.py || (echo 'env.py:30: NameError: name "agent" is not defined'; exit 1)
+\t@echo '<testsuites><testsuite><testcase name="t1"/></testsuite></testsuites>' > results.xml
+"""
+FIX = "v-pilot:fill:env.py:ENV_CONNECTIONS\n        pass  # FIXED\n"
+
+
+def _iterate(*args):
+    return CliRunner().invoke(
+        app, ["uvm", "iterate-build", "--auto", "--no-check", *args]
+    )
+
+
+@pytest.fixture
+def built(project, fake_backend):
+    assert CliRunner().invoke(app, ["uvm", "build", "-j4"]).exit_code == 0
+    (project / "uvm_tb" / "Makefile").write_text(MAKEFILE, encoding="utf-8")
+    return project
+
+
+def test_auto_loop_feeds_make_failures_back_until_green(built, fake_backend):
+    fill_response = fake_backend.respond
+    fake_backend.respond = lambda p: FIX if "迭代修复任务" in p else fill_response(p)
+
+    result = _iterate()
+    assert result.exit_code == 0, result.output
+    assert "测试通过! 共 2 次迭代" in result.output
+    fix_prompt = fake_backend.prompts[-1]
+    # 'make' 的失败日志 (精简后) 被提交给 LLM
+    assert "--- MAKE LOG START ---" in fix_prompt
+    assert "NameError" in fix_prompt
+    assert "FIXED" in (built / "uvm_tb" / "env.py").read_text(encoding="utf-8")
+
+    record = json.loads(UVM_ITERATE_RECORD.read_text(encoding="utf-8"))
+    assert record["passed"]
+    first, second = record["iterations"]
+    assert not first["passed"] and first["returncode"] != 0
+    assert "fix_s" in first and "snapshot" in first
+    assert second["passed"] and second["results"]["tests"] == 1
+
+
+def test_auto_loop_stops_when_iterations_run_out(built, fake_backend):
+    result = _iterate("--max-iterations", "2")
+    assert result.exit_code == 1
+    assert "测试仍未通过 (已用完 2 次迭代)" in result.output
+    record = json.loads(UVM_ITERATE_RECORD.read_text(encoding="utf-8"))
+    assert [entry["passed"] for entry in record["iterations"]] == [False, False]
+    # 最后一次 'make' 之后不再请求修复
+    assert "fix_s" not in record["iterations"][-1]
@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from vpilot.core import llm_handler
+from vpilot.core.llm_backends import (
+    FixtureMissingError,
+    OpenAIBackend,
+    RecordingBackend,
+    ReplayBackend,
+)
+from vpilot.core.replay_server import make_server
+
+MESSAGES = [
+    {"role": "system", "content": "sys"},
+    {"role": "user", "content": "v-pilot:fill:env.py: 请填充"},
+]
+
+
+@pytest.fixture
+def recorded(tmp_path, fake_backend):
+    """用 FakeBackend 录制一次请求, 返回 (fixture 目录, 录制的响应)."""
+    fake_backend.respond = lambda prompt: "v-pilot:fill:env.py:ENV\n" + "x = 1\n" * 40
+    recorder = RecordingBackend(fake_backend, tmp_path / "fixtures")
+    content, _, _ = recorder.complete("m", MESSAGES)
+    return tmp_path / "fixtures", content
+
+
+@pytest.fixture
+def replay_url(recorded):
+    server = make_server(recorded[0], port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_replay_backend_returns_the_recorded_response(recorded):
+    fixture_dir, content = recorded
+    backend = ReplayBackend(fixture_dir, chunk_size=16)
+    assert backend.complete("m", MESSAGES)[0] == content
+
+    deltas = []
+    text, usage, _ = backend.stream("m", MESSAGES, deltas.append)
+    assert text == "".join(deltas) == content
+    assert usage.prompt_tokens == 100
+
+    with pytest.raises(FixtureMissingError):
+        backend.complete("other-model", MESSAGES)
+
+
+def test_replay_server_round_trip_without_api_key(recorded, replay_url, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    _, content = recorded
+    backend = OpenAIBackend(base_url=replay_url)
+
+    text, usage, _ = backend.complete("m", MESSAGES)
+    assert text == content.strip()
+    assert usage.prompt_tokens == 100
+
+    deltas = []
+    text, usage, ttfb = backend.stream("m", MESSAGES, deltas.append)
+    assert text == "".join(deltas) == content
+    assert usage.prompt_tokens == 100
+    assert ttfb is not None
+
+
+def test_remote_base_url_still_requires_an_api_key(monkeypatch):
+    import openai
+
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with pytest.raises(openai.OpenAIError):
+        OpenAIBackend(base_url="https://api.example.com")
+
+
+def test_requests_reuse_pooled_connections(recorded, replay_url, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    backend = OpenAIBackend(base_url=replay_url)
+
+    backend.complete("m", MESSAGES)
+    assert backend.connection_info() == {
+        "conn_reused": False,
+        "http_version": "HTTP/1.1",
+    }
+    backend.complete("m", MESSAGES)
+    assert backend.connection_info()["conn_reused"] is True
+    backend.stream("m", MESSAGES, lambda delta: None)
+    assert backend.connection_info()["conn_reused"] is True
+
+
+def test_concurrent_tasks_share_one_backend(monkeypatch):
+    created = []
+    start = threading.Barrier(8)
+
+    def create_backend():
+        created.append(object())
+        return created[-1]
+
+    monkeypatch.setattr(llm_handler, "_backend", None)
+    monkeypatch.setattr(llm_handler, "create_backend", create_backend)
+
+    def get(_):
+        start.wait()
+        return llm_handler.get_backend()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        backends = set(map(id, pool.map(get, range(8))))
+    assert len(created) == 1
+    assert backends == {id(created[0])}
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+
+from vpilot.core.llm_cache import LLMCache
+
+
+def _entry(content, created=None):
+    entry = {"model": "m", "content": content}
+    if created is not None:
+        entry["created"] = created
+    return entry
+
+
+def test_put_then_get_round_trips(tmp_path):
+    cache = LLMCache(tmp_path)
+    key = LLMCache.make_key("m", [{"role": "user", "content": "hi"}])
+    cache.put(key, _entry("hello"))
+    entry = cache.get(key)
+    assert entry["content"] == "hello"
+    assert entry["created"] <= time.time()
+
+
+def test_age_is_measured_from_creation_not_last_hit(tmp_path):
+    cache = LLMCache(tmp_path, max_age=60)
+    cache.put("aa1", _entry("old", created=time.time() - 120))
+    # 命中会刷新 mtime, 但不能延长条目的寿命
+    os.utime(cache._entry_path("aa1"), None)
+    assert cache.get("aa1") is None
+    assert not cache._entry_path("aa1").exists()
+
+    cache.put("aa2", _entry("fresh"))
+    assert cache.get("aa2")["content"] == "fresh"
+
+
+def test_concurrent_puts_of_the_same_key_do_not_collide(tmp_path):
+    cache = LLMCache(tmp_path)
+    errors = []
+
+    def put(i):
+        try:
+            for _ in range(20):
+                cache.put("bb", _entry(f"content {i}" * 100))
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.get("bb")["content"].startswith("content ")
+    assert list(tmp_path.glob("*/*.tmp")) == []
+
+
+def test_eviction_scans_only_after_enough_bytes_are_written(tmp_path, monkeypatch):
+    cache = LLMCache(tmp_path, max_bytes=1_000_000)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+
+    cache.put("cc0", _entry("x"))
+    assert len(scans) == 1
+    for i in range(1, 20):
+        cache.put(f"cc{i}", _entry("x"))
+    assert len(scans) == 1
+
+    # 累计写入超过 max_bytes 的 EVICT_FRACTION 后再次扫描
+    cache.put("dd", _entry("y" * 60_000))
+    assert len(scans) == 2
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path):
+    cache = LLMCache(tmp_path, max_bytes=10**9)
+    now = time.time()
+    for i, key in enumerate(["ee1", "ee2", "ee3"]):
+        cache.put(key, _entry("z" * 1000, created=now))
+        os.utime(cache._entry_path(key), (now - 100 + i, now - 100 + i))
+    size = cache._entry_path("ee1").stat().st_size
+
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert not cache._entry_path("ee1").exists()
+    assert cache._entry_path("ee2").exists()
+    assert cache._entry_path("ee3").exists()
+    assert json.loads(cache._entry_path("ee3").read_text())["content"] == "z" * 1000
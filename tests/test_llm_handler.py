@@ -0,0 +1,142 @@
+import collections
+import threading
+
+import httpx
+import openai
+import pytest
+from typer.testing import CliRunner
+
+from vpilot.core import llm_handler, model_router, telemetry
+from vpilot.core.llm_backends import usage_from_fixture
+from vpilot.main import app
+
+REQUEST = httpx.Request("POST", "https://api.example.com/chat/completions")
+
+
+class ScriptedBackend:
+    """按顺序执行 steps 中的动作: 异常实例被抛出, 可调用对象被调用后返回其结果."""
+
+    def __init__(self, *steps):
+        self.steps = collections.deque(steps)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def connection_info(self):
+        return {}
+
+    def complete(self, model, messages, timeout=None):
+        with self._lock:
+            self.calls += 1
+            step = self.steps.popleft() if self.steps else "ok"
+        if isinstance(step, Exception):
+            raise step
+        content = step() if callable(step) else step
+        usage = usage_from_fixture({"usage": {"prompt_tokens": 10}})
+        return content, usage, None
+
+
+@pytest.fixture
+def scripted(fake_backend, monkeypatch, tmp_path):
+    """安装一个 ScriptedBackend, 并记录 (而不真正执行) 退避等待."""
+    monkeypatch.chdir(tmp_path)
+    sleeps = []
+    monkeypatch.setattr(llm_handler.time, "sleep", sleeps.append)
+    monkeypatch.setattr(llm_handler, "MAX_RETRIES", 3)
+    monkeypatch.setattr(llm_handler, "HEDGE_PERCENTILE", 0)
+
+    def install(*steps):
+        backend = ScriptedBackend(*steps)
+        monkeypatch.setattr(llm_handler, "_backend", backend)
+        return backend
+
+    install.sleeps = sleeps
+    return install
+
+
+def test_transient_errors_are_retried_with_backoff(scripted):
+    backend = scripted(
+        openai.APIConnectionError(request=REQUEST),
+        openai.InternalServerError(
+            "boom", response=httpx.Response(503, request=REQUEST), body=None
+        ),
+        "ok",
+    )
+    assert llm_handler.generate_text("hi", model="m") == "ok"
+    assert backend.calls == 3
+    assert len(scripted.sleeps) == 2
+    # full jitter: 第 n 次重试前等待 [0, BACKOFF_BASE * 2^n]
+    for n, delay in enumerate(scripted.sleeps):
+        assert 0 <= delay <= llm_handler.BACKOFF_BASE * 2**n
+    assert telemetry.load_records()[-1]["retries"] == 2
+
+
+def test_retry_after_header_wins_over_backoff(scripted):
+    response = httpx.Response(429, headers={"retry-after": "3"}, request=REQUEST)
+    scripted(openai.RateLimitError("slow down", response=response, body=None), "ok")
+    assert llm_handler.generate_text("hi", model="m") == "ok"
+    assert scripted.sleeps == [3.0]
+
+
+def test_non_retryable_errors_fail_immediately(scripted):
+    response = httpx.Response(400, request=REQUEST)
+    backend = scripted(openai.BadRequestError("bad", response=response, body=None))
+    with pytest.raises(llm_handler.LLMRequestError, match="调用LLM API失败"):
+        llm_handler.generate_text("hi", model="m")
+    assert backend.calls == 1
+    assert scripted.sleeps == []
+
+
+def test_retries_give_up_after_max_retries(scripted):
+    backend = scripted(*[openai.APIConnectionError(request=REQUEST)] * 10)
+    with pytest.raises(llm_handler.LLMRequestError):
+        llm_handler.generate_text("hi", model="m")
+    assert backend.calls == llm_handler.MAX_RETRIES + 1
+
+
+def test_slow_request_is_hedged(scripted, monkeypatch):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    scripted(slow, "fast")
+    monkeypatch.setattr(llm_handler, "HEDGE_PERCENTILE", 0.9)
+    monkeypatch.setattr(llm_handler, "_latencies_seeded", True)
+    monkeypatch.setattr(
+        llm_handler, "_latencies", collections.deque([0.01] * 5, maxlen=200)
+    )
+    try:
+        assert llm_handler.generate_text("hi", model="m") == "fast"
+    finally:
+        release.set()
+    assert telemetry.load_records()[-1]["hedged"] is True
+
+
+def test_router_raises_when_every_attempt_fails():
+    def attempt(model, timeout, candidate):
+        raise llm_handler.LLMRequestError("调用LLM API失败: down")
+
+    with pytest.raises(llm_handler.LLMRequestError):
+        model_router.run({"tier": "fast", "escalate": True}, attempt, label="t")
+
+
+def test_router_escalates_after_a_failed_attempt(monkeypatch):
+    monkeypatch.setenv("VPILOT_FAST_MODEL", "fast-model")
+    monkeypatch.setenv("VPILOT_STRONG_MODEL", "strong-model")
+
+    def attempt(model, timeout, candidate):
+        if model == "fast-model":
+            raise llm_handler.LLMRequestError("调用LLM API失败: timeout")
+        return "ok"
+
+    route = {"tier": "fast", "escalate": True}
+    assert model_router.run(route, attempt, label="t") == "ok"
+
+
+def test_command_exits_non_zero_when_the_backend_fails(project, fake_backend):
+    fake_backend.fail_on = "验证计划"
+    result = CliRunner().invoke(app, ["plan", "init"])
+    assert result.exit_code == 1
+    assert "调用LLM API失败: injected failure" in result.output
+    assert not (project / "vpilot_run" / "verif_plan.v1.yml").exists()
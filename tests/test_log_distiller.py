@@ -0,0 +1,63 @@
+from vpilot.core.log_distiller import BlockLocator, distill, iter_log_lines
+
+SCOREBOARD = """import pyuvm
+
+
+class Scoreboard:
+    def check_phase(self):
+        # LLM_GENERATED_START: CHECK
+        expected = 1
+        actual = 2
+        assert expected == actual
+        # LLM_GENERATED_END: CHECK
+"""
+
+
+def _traceback(path, line):
+    return [
+        "     0.00ns ERROR    cocotb.regression  test_sanity failed",
+        "                                        Traceback (most recent call last):",
+        f'                                          File "{path}", line {line}, '
+        "in check_phase",
+        "                                            assert expected == actual",
+        "                                        AssertionError",
+        "     0.00ns INFO     cocotb.regression  done",
+    ]
+
+
+def test_traceback_is_mapped_to_the_enclosing_block(tmp_path):
+    (tmp_path / "scoreboard.py").write_text(SCOREBOARD, encoding="utf-8")
+    path = tmp_path / "scoreboard.py"
+
+    locator = BlockLocator(tmp_path)
+    assert locator.block_at(str(path), 9) == "scoreboard.py:CHECK"
+    assert locator.block_at("scoreboard.py", 5) is None
+    assert locator.block_at("/usr/lib/python3/site-packages/pyuvm.py", 9) is None
+
+    text, stats = distill(_traceback(path, 9), root=tmp_path)
+    assert stats["blocks"] == ["scoreboard.py:CHECK"]
+    assert text.startswith("[v-pilot] 可能需要修改的代码块: scoreboard.py:CHECK")
+    assert "AssertionError" in text
+    assert "INFO" not in text
+
+
+def test_repeated_errors_differing_only_in_numbers_are_deduplicated():
+    lines = [
+        f"{n * 10}.00ns ERROR scoreboard FAIL: expected {n} got {n + 1}"
+        for n in range(50)
+    ]
+    lines.append("make: *** [Makefile:12: results.xml] Error 1")
+
+    text, stats = distill(lines)
+    assert stats == {"lines": 51, "entries": 2, "duplicates": 49, "blocks": []}
+    assert "(重复 50 次)" in text
+    assert text.count("FAIL:") == 1
+
+
+def test_log_without_errors_keeps_the_tail(tmp_path):
+    log = tmp_path / "make.log"
+    log.write_text("".join(f"line {n}\n" for n in range(10)), encoding="utf-8")
+
+    text, stats = distill(iter_log_lines(log), tail_lines=3)
+    assert stats["entries"] == 0
+    assert text.splitlines()[1:] == ["line 7", "line 8", "line 9"]
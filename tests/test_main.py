@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+from typer.testing import CliRunner
+
+from vpilot.main import app
+
+
+def test_cache_flags_are_passed_through_the_environment(monkeypatch):
+    monkeypatch.setenv("VPILOT_LLM_CACHE", "on")
+    runner = CliRunner()
+
+    runner.invoke(app, ["--no-cache", "stats", "--help"])
+    assert os.environ["VPILOT_LLM_CACHE"] == "off"
+    runner.invoke(app, ["--refresh", "stats", "--help"])
+    assert os.environ["VPILOT_LLM_CACHE"] == "refresh"
+
+
+def test_cache_mode_from_the_environment_is_kept_without_flags(monkeypatch):
+    monkeypatch.setenv("VPILOT_LLM_CACHE", "off")
+    CliRunner().invoke(app, ["stats", "--help"])
+    assert os.environ["VPILOT_LLM_CACHE"] == "off"
+
+
+def test_cache_mode_is_read_when_the_cache_is_first_used(monkeypatch):
+    from vpilot.core import llm_handler
+
+    monkeypatch.setattr(llm_handler, "_cache_settings", None)
+    monkeypatch.setenv("VPILOT_LLM_CACHE", "off")
+    assert llm_handler._get_cache() is None
+    monkeypatch.setenv("VPILOT_LLM_CACHE", "refresh")
+    assert llm_handler._cache_mode() == {"enabled": True, "refresh": True}
+
+
+def test_importing_the_llm_handler_does_not_load_dotenv():
+    code = "import sys, vpilot.core.llm_handler; " "print('dotenv' in sys.modules)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "False"
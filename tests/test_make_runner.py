@@ -0,0 +1,75 @@
+import shutil
+import time
+
+import pytest
+
+from vpilot.core import make_runner
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="需要 make")
+
+MAKEFILE = """all:
+\t@echo compiling
+\t@echo '%Error: top.sv:3:1: syntax error'
+\t@echo '    3 | module'
+\t@sleep 30
+\t@echo done
+"""
+
+PASSING = """all:
+\t@echo '<testsuites><testsuite><testcase name="t1"/></testsuite></testsuites>' > results.xml
+"""
+
+
+def test_fatal_pattern_aborts_make_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(make_runner, "ABORT_GRACE_S", 0.2)
+    (tmp_path / "Makefile").write_text(MAKEFILE, encoding="utf-8")
+
+    start = time.monotonic()
+    result = make_runner.run_make(tmp_path, patterns=make_runner.abort_patterns())
+    assert time.monotonic() - start < 10
+    assert result["aborted"] == {
+        "pattern": "verilator",
+        "line": "%Error: top.sv:3:1: syntax error",
+    }
+    assert not result["passed"]
+    # 匹配之后的一小段上下文仍然保留
+    assert "3 | module" in result["output"]
+    assert "done" not in result["output"]
+
+
+def test_custom_and_fail_fast_patterns():
+    patterns = make_runner.abort_patterns(fail_fast=True, extra=[r"UVM_FATAL"])
+    assert {"verilator", "import", "scoreboard", "assertion", "custom1"} <= set(
+        patterns
+    )
+    assert "scoreboard" not in make_runner.abort_patterns()
+
+
+def test_passing_run_reads_results(tmp_path):
+    (tmp_path / "Makefile").write_text(PASSING, encoding="utf-8")
+    (tmp_path / make_runner.RESULTS_FILE).write_text("stale", encoding="utf-8")
+
+    result = make_runner.run_make(tmp_path, patterns=make_runner.abort_patterns())
+    assert result["aborted"] is None
+    assert result["results"] == {"tests": 1, "failures": 0, "failed": []}
+    assert result["passed"]
+
+
+def test_import_pattern_matches_module_level_errors():
+    pattern = make_runner.abort_patterns()["import"]
+    traceback = [
+        "Traceback (most recent call last):",
+        '  File "/tb/test_my_dut.py", line 7, in <module>',
+        "    from env import MyEnv",
+        '  File "/tb/env.py", line 12, in <module>',
+        "    WIDTH = int(WIDHT)",
+        "NameError: name 'WIDHT' is not defined",
+    ]
+    assert [line for line in traceback if pattern.search(line)] == traceback[1:4:2]
+    # 测试运行期间 (函数帧内) 的 NameError/TypeError 不算导入失败
+    for line in (
+        '  File "/tb/test_my_dut.py", line 30, in test_sanity',
+        "TypeError: drive() missing 1 required positional argument: 'item'",
+        "NameError: name 'item' is not defined",
+    ):
+        assert not pattern.search(line)
@@ -0,0 +1,47 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vpilot.core import model_router
+
+
+def test_first_valid_candidate_wins(capsys):
+    def attempt(model, timeout, candidate):
+        # 候选 1 最先返回但无效, 候选 2 随后返回且有效
+        time.sleep({0: 0.0, 1: 0.05, 2: 0.5}[candidate])
+        return "bad" if candidate == 0 else f"good {candidate}"
+
+    response = model_router.run(
+        {"tier": "strong"},
+        attempt,
+        validate=lambda r: "无效" if r == "bad" else None,
+        label="env",
+        candidates=3,
+    )
+    assert response == "good 1"
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [
+        "  > [Candidates] env: 候选 1/3 未通过 (无效)",
+        "  > [Candidates] env: 候选 2/3 通过校验",
+    ]
+
+
+def test_concurrent_tasks_log_whole_lines(capsys):
+    start = threading.Barrier(8)
+
+    def sample(task):
+        def attempt(model, timeout, candidate):
+            return "bad"
+
+        start.wait()
+        return model_router.run(
+            {"tier": "strong"}, attempt, lambda r: "无效", f"task{task}", 4
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(sample, range(8)))
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 32
+    assert all(line.startswith("  > [Candidates] task") for line in lines)
+    assert all(line.endswith("未通过 (无效)") for line in lines)
@@ -0,0 +1,50 @@
+import sys
+
+from vpilot.core.preflight import check_testbench
+
+SEQ_LIB = """import pyuvm
+
+
+class SanitySeq(pyuvm.uvm_sequence):
+    async def body(self):
+        pass
+"""
+
+TEST_LIB = """import pyuvm
+import seq_lib
+
+
+class MyTest(pyuvm.uvm_test):
+    async def run_phase(self):
+        # LLM_GENERATED_START: TESTS
+        seq = seq_lib.MissingSeq()
+        await undefined_helper(seq)
+        ok = seq_lib.SanitySeq("s")
+        # LLM_GENERATED_END: TESTS
+"""
+
+
+def test_cross_file_and_import_problems_are_reported_per_block(tmp_path):
+    (tmp_path / "seq_lib.py").write_text(SEQ_LIB, encoding="utf-8")
+    (tmp_path / "test_lib.py").write_text(TEST_LIB, encoding="utf-8")
+    (tmp_path / "broken.py").write_text("import not_a_module\n", encoding="utf-8")
+    modules = set(sys.modules)
+
+    problems = check_testbench(tmp_path)
+
+    assert [(p["file"], p["line"], p["block"]) for p in problems] == [
+        ("broken.py", 1, None),
+        ("test_lib.py", 8, "test_lib.py:TESTS"),
+        ("test_lib.py", 9, "test_lib.py:TESTS"),
+    ]
+    assert "not_a_module" in problems[0]["message"]
+    assert "MissingSeq" in problems[1]["message"]
+    assert "undefined_helper" in problems[2]["message"]
+    # 占位的 pyuvm 和 tb 模块不会留在 sys.modules 中, 也不会写出 __pycache__
+    assert set(sys.modules) - modules == set()
+    assert not (tmp_path / "__pycache__").exists()
+
+
+def test_clean_testbench_has_no_problems(tmp_path):
+    (tmp_path / "seq_lib.py").write_text(SEQ_LIB, encoding="utf-8")
+    assert check_testbench(tmp_path) == []
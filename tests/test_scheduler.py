@@ -0,0 +1,38 @@
+import pytest
+
+from vpilot.core.scheduler import plan_waves, run_waves
+
+
+def _task(task_id, *after):
+    return {"id": task_id, "after": list(after)}
+
+
+def test_plan_waves_groups_independent_tasks():
+    tasks = [_task("a"), _task("b", "a"), _task("c"), _task("d", "b", "c")]
+    waves = plan_waves(tasks)
+    assert [[t["id"] for t in wave] for wave in waves] == [["a", "c"], ["b"], ["d"]]
+
+
+def test_plan_waves_rejects_cycles():
+    with pytest.raises(ValueError):
+        plan_waves([_task("a", "b"), _task("b", "a")])
+
+
+def test_run_waves_merges_finished_siblings_before_raising():
+    tasks = [_task("a"), _task("b"), _task("c"), _task("d", "a")]
+    merged, flushed = [], []
+
+    def worker(task):
+        if task["id"] == "b":
+            raise RuntimeError("b failed")
+        return task["id"].upper()
+
+    with pytest.raises(RuntimeError, match="b failed"):
+        run_waves(
+            tasks,
+            worker,
+            lambda task, result: merged.append(result),
+            after_wave=lambda wave: flushed.append([t["id"] for t in wave]),
+        )
+    assert merged == ["A", "C"]
+    assert flushed == [["a", "b", "c"]]
@@ -0,0 +1,74 @@
+from typer.testing import CliRunner
+
+from vpilot.core.snapshot_store import SnapshotStore
+from vpilot.main import app
+
+
+def test_unchanged_content_is_stored_once(tmp_path):
+    store = SnapshotStore(tmp_path)
+    first, created = store.commit({"a.py": "x = 1\n", "b.py": "y = 2\n"}, "one")
+    assert created and first["id"] == 1
+
+    same, created = store.commit({"a.py": "x = 1\n", "b.py": "y = 2\n"}, "again")
+    assert not created and same["id"] == 1
+
+    second, created = store.commit({"a.py": "x = 1\n", "b.py": "y = 3\n"}, "two")
+    assert created and second["id"] == 2
+    assert second["files"]["a.py"] == first["files"]["a.py"]
+    # a.py 的内容两个快照共用一个对象
+    assert len(list((tmp_path / "objects").glob("*/*"))) == 3
+
+
+def test_checkout_rewrites_only_changed_files(tmp_path):
+    store = SnapshotStore(tmp_path / "snapshots")
+    tb = tmp_path / "tb"
+    tb.mkdir()
+    store.commit({"a.py": "x = 1\n", "b.py": "y = 1\n"}, "one")
+    store.commit({"a.py": "x = 1\n", "b.py": "y = 2\n", "c.py": "z\n"}, "two")
+    for name, content in {"a.py": "x = 1\n", "b.py": "y = 2\n", "c.py": "z\n"}.items():
+        (tb / name).write_text(content)
+
+    written, removed = store.checkout(1, tb)
+    assert written == ["b.py"]
+    assert removed == ["c.py"]
+    assert (tb / "b.py").read_text() == "y = 1\n"
+    assert not (tb / "c.py").exists()
+
+
+def test_log_diff_and_checkout_commands(project, fake_backend):
+    runner = CliRunner()
+    assert runner.invoke(app, ["uvm", "build", "-j4"]).exit_code == 0
+    store = SnapshotStore()
+    built = store.latest()
+
+    result = runner.invoke(app, ["uvm", "log"])
+    assert result.exit_code == 0
+    assert "#1    " in result.output and "build: 骨架" in result.output
+    assert "build: env  [env.py]" in result.output
+
+    env = project / "uvm_tb" / "env.py"
+    original = env.read_text(encoding="utf-8")
+    env.write_text(
+        original.replace("pass  # ENV_INSTANTIATION", "self.extra = 1"),
+        encoding="utf-8",
+    )
+
+    result = runner.invoke(app, ["uvm", "diff", str(built["id"])])
+    assert result.exit_code == 0
+    assert "=== env.py (代码块: ENV_INSTANTIATION)" in result.output
+    assert "+        self.extra = 1" in result.output
+
+    result = runner.invoke(app, ["uvm", "checkout", str(built["id"])])
+    assert result.exit_code == 0, result.output
+    assert "恢复: env.py" in result.output
+    assert env.read_text(encoding="utf-8") == original
+    # 手工修改在回滚前被记录下来, 回滚本身也可以撤销
+    labels = [store.get(i)["label"] for i in store.ids()[-2:]]
+    assert labels == ["checkout 之前", f"checkout #{built['id']}"]
+
+    result = runner.invoke(app, ["uvm", "diff", "1", str(built["id"])])
+    assert "=== env.py" in result.output
+
+    result = runner.invoke(app, ["uvm", "checkout", "999"])
+    assert result.exit_code == 1
+    assert "快照 #999 不存在" in result.output
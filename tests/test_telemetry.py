@@ -0,0 +1,75 @@
+import json
+from types import SimpleNamespace
+
+from typer.testing import CliRunner
+
+from vpilot.core import telemetry
+from vpilot.main import app
+
+
+def test_extract_usage_supports_both_cache_fields():
+    deepseek = SimpleNamespace(
+        prompt_tokens=100, completion_tokens=20, prompt_cache_hit_tokens=64
+    )
+    openai_style = SimpleNamespace(
+        prompt_tokens=100,
+        completion_tokens=20,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=32),
+    )
+    assert telemetry.extract_usage(deepseek)["cached_tokens"] == 64
+    assert telemetry.extract_usage(openai_style)["cached_tokens"] == 32
+    assert telemetry.extract_usage(None) == {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+    }
+
+
+def test_cached_prompt_tokens_are_billed_at_the_cached_price():
+    full = telemetry.estimate_cost(1_000_000, 0, 0)
+    cached = telemetry.estimate_cost(1_000_000, 0, 1_000_000)
+    assert full == telemetry.PRICE_INPUT
+    assert cached == telemetry.PRICE_CACHED_INPUT
+
+
+def test_load_records_skips_truncated_lines(tmp_path):
+    path = tmp_path / "telemetry.jsonl"
+    path.write_text('{"task": "a"}\n{"task": "b", "lat\n{"task": "c"}\n')
+    assert [r["task"] for r in telemetry.load_records(path)] == ["a", "c"]
+
+
+def test_build_records_every_call_and_stats_aggregates_them(project, fake_backend):
+    runner = CliRunner()
+    assert runner.invoke(app, ["uvm", "build", "-j4"]).exit_code == 0
+
+    records = telemetry.load_records()
+    # 初始上下文 + 10 个任务
+    assert len(records) == 11
+    assert {r["command"] for r in records} == {"uvm build"}
+    assert "env" in {r["task"] for r in records}
+    for r in records:
+        assert "model" in r
+        assert r["prompt_tokens"] == 100
+        assert r["retries"] == 0
+        assert r["latency"] >= r["ttfb"] >= 0
+        assert not r["cache_hit"]
+
+    result = runner.invoke(app, ["stats"])
+    assert result.exit_code == 0, result.output
+    assert "按阶段汇总" in result.output
+    assert "uvm build / env" in result.output
+    assert "合计: 11 次调用" in result.output
+
+    result = runner.invoke(app, ["stats", "--command", "spec init"])
+    assert result.exit_code == 1
+    assert "没有可用的 telemetry 记录" in result.output
+
+
+def test_stats_reads_an_explicit_file(tmp_path):
+    path = tmp_path / "t.jsonl"
+    record = {"command": "plan init", "task": "init", "latency": 2.0, "cost": 0.5}
+    path.write_text(json.dumps(record) + "\n")
+    result = CliRunner().invoke(app, ["stats", "--file", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "plan init / init" in result.output
+    assert "合计: 1 次调用, 2.0s, $0.5000" in result.output
@@ -0,0 +1,185 @@
+import json
+import re
+import threading
+
+from typer.testing import CliRunner
+
+from vpilot.commands.uvm import UVM_BUILD_RECORD
+from vpilot.core.code_manager import CodeManager
+from vpilot.core.snapshot_store import SnapshotStore
+from vpilot.main import app
+
+
+def _build(*args):
+    return CliRunner().invoke(app, ["uvm", "build", "-j4", *args])
+
+
+def _checkpoint():
+    state = json.loads(open("vpilot_run/.vpilot.state.json", encoding="utf-8").read())
+    return state["uvm_build_checkpoint"]
+
+
+def test_fresh_build_then_incremental_reuses_everything(project, fake_backend):
+    result = _build()
+    assert result.exit_code == 0, result.output
+
+    result = _build("--incremental")
+    assert result.exit_code == 0, result.output
+    assert "重新生成 0 个任务" in result.output
+
+
+def test_resume_then_incremental_reuses_everything(project, fake_backend):
+    # 在 monitor 任务失败, 此时它的上游任务已经完成
+    fake_backend.fail_on = "--- monitor.py ---"
+    result = _build()
+    assert result.exit_code != 0
+    assert "seq_item" in _checkpoint()["completed"]
+    assert "monitor" not in _checkpoint()["completed"]
+
+    fake_backend.fail_on = None
+    result = _build("--resume")
+    assert result.exit_code == 0, result.output
+    assert _checkpoint()["finished"]
+
+    # 恢复时记录的输入哈希必须包含已完成的上游任务的输出
+    result = _build("--incremental")
+    assert result.exit_code == 0, result.output
+    assert "重新生成 0 个任务" in result.output
+
+
+def test_incremental_build_ignores_simulation_artifacts(project, fake_backend):
+    assert _build().exit_code == 0
+    # 'make' 之后 uvm_tb/ 中多出的仿真产物
+    (project / "uvm_tb" / "sim_build").mkdir()
+    (project / "uvm_tb" / "sim_build" / "Vtop.mk").write_text("all:\n")
+    (project / "uvm_tb" / "results.xml").write_text("<testsuites/>")
+
+    result = _build("--incremental")
+    assert result.exit_code == 0, result.output
+    files = SnapshotStore().latest()["files"]
+    assert "results.xml" not in files
+    assert not any(path.startswith("sim_build/") for path in files)
+    assert (project / "uvm_tb" / "results.xml").exists()
+
+
+def _break_env(fake_backend):
+    """env 任务的响应 (包括修正回合) 始终有语法错误."""
+    fill_response = fake_backend.respond
+
+    def respond(prompt):
+        if "v-pilot:fill:env.py:" in prompt or "修正" in prompt:
+            return "v-pilot:fill:env.py:ENV_CONNECTIONS\n        x = (\n"
+        return fill_response(prompt)
+
+    fake_backend.respond = respond
+    return fill_response
+
+
+def test_task_failing_validation_is_reported(project, fake_backend):
+    _break_env(fake_backend)
+    result = _build()
+    assert result.exit_code == 0, result.output
+    assert "✅" not in result.output
+    assert "1 个任务未通过本地校验" in result.output
+    assert "  - env: " in result.output
+
+
+def test_invalid_task_and_its_dependents_are_not_checkpointed(project, fake_backend):
+    fill_response = _break_env(fake_backend)
+    result = _build()
+    assert result.exit_code == 0, result.output
+    checkpoint = _checkpoint()
+    assert "env" not in checkpoint["completed"]
+    # test_lib 依赖 env, 基于错误的输出生成, 同样不算完成
+    assert "test_lib" not in checkpoint["completed"]
+    assert "sequence_lib" in checkpoint["completed"]
+    assert not checkpoint["finished"]
+
+    # '--resume' 重新生成未通过校验的任务及其下游任务
+    fake_backend.respond = fill_response
+    fake_backend.prompts.clear()
+    result = _build("--resume")
+    assert result.exit_code == 0, result.output
+    assert "✅" in result.output
+    # 每个任务的提示中只有一个 "--- <正在编辑的文件> ---" 标题
+    edited = [re.search(r"--- (\w+\.py) ---", p).group(1) for p in fake_backend.prompts]
+    assert sorted(edited) == ["env.py", "test_lib.py"]
+    assert _checkpoint()["finished"]
+
+
+def test_invalid_task_is_left_out_of_the_build_record(project, fake_backend):
+    _break_env(fake_backend)
+    assert _build().exit_code == 0
+    record = json.loads(open(UVM_BUILD_RECORD, encoding="utf-8").read())
+    assert "env" not in record["tasks"]
+    assert "test_lib" not in record["tasks"]
+    assert "seq_item" in record["tasks"]
+
+
+def test_streamed_blocks_are_injected_after_validation(
+    project, fake_backend, monkeypatch
+):
+    fill_response = fake_backend.respond
+    broken = "        x = (  # BROKEN"
+
+    def respond(prompt):
+        if "未通过 v-pilot 的本地校验" in prompt:
+            return "v-pilot:fill:env.py:ENV_CONNECTIONS\n        pass  # FIXED\n"
+        response = fill_response(prompt)
+        if "v-pilot:fill:env.py:" in prompt:
+            response = response.replace("        pass  # ENV_CONNECTIONS", broken)
+        return response
+
+    fake_backend.respond = respond
+    injected_from = set()
+    update_blocks = CodeManager.update_blocks
+
+    def record_thread(self, *args, **kwargs):
+        injected_from.add(threading.current_thread() is threading.main_thread())
+        return update_blocks(self, *args, **kwargs)
+
+    monkeypatch.setattr(CodeManager, "update_blocks", record_thread)
+
+    result = _build("--stream")
+    assert result.exit_code == 0, result.output
+    assert "[Stream]" in result.output
+    assert "[Correction] env" in result.output
+    assert injected_from == {True}
+    env = (project / "uvm_tb" / "env.py").read_text(encoding="utf-8")
+    assert "# FIXED" in env
+    assert "BROKEN" not in env
+    assert _checkpoint()["finished"]
+
+
+def _regenerated(output):
+    match = re.search(r"重新生成 \d+ 个任务 \(([^)]*)\)", output)
+    return match.group(1).split(", ")
+
+
+def test_incremental_build_regenerates_only_tasks_whose_inputs_changed(
+    project, fake_backend
+):
+    assert _build().exit_code == 0
+    run_dir = project / "vpilot_run"
+
+    # 计划新增一个序列: 只影响使用 sequence_library 的任务
+    plan = run_dir / "my_dut.verif_plan.final.yml"
+    plan.write_text(
+        plan.read_text().replace(
+            "[{name: SanityCheckSeq}]", "[{name: SanityCheckSeq}, {name: BurstSeq}]"
+        )
+    )
+    result = _build("--incremental")
+    assert result.exit_code == 0, result.output
+    assert _regenerated(result.output) == ["sequence_lib", "test_lib"]
+    assert "BurstSeq" in fake_backend.prompts[-1]
+
+    # 规范的描述变化: 只影响读取整个 spec 的任务
+    spec = run_dir / "my_dut.design_spec.final.yml"
+    spec.write_text(spec.read_text().replace("a counter", "an up counter"))
+    result = _build("--incremental")
+    assert result.exit_code == 0, result.output
+    assert _regenerated(result.output) == ["seq_item", "base_bfm", "scoreboard"]
+
+    result = _build("--incremental")
+    assert "重新生成 0 个任务" in result.output
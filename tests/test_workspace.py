@@ -0,0 +1,28 @@
+from vpilot.core.workspace import Workspace
+
+
+def test_workspace_loads_only_the_given_files(tmp_path):
+    (tmp_path / "env.py").write_text("x = 1\n", encoding="utf-8")
+    (tmp_path / "sim_build").mkdir()
+    (tmp_path / "sim_build" / "Vtop.mk").write_text("all:\n", encoding="utf-8")
+    (tmp_path / "results.xml").write_text("<testsuites/>", encoding="utf-8")
+
+    workspace = Workspace(tmp_path, files=["env.py", "missing.py"])
+
+    assert workspace.snapshot() == {"env.py": "x = 1\n"}
+    assert not workspace.exists("results.xml")
+
+
+def test_workspace_flushes_only_modified_files(tmp_path):
+    (tmp_path / "env.py").write_text("x = 1\n", encoding="utf-8")
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "env.cpython-311.pyc").write_bytes(b"\x00\xff")
+
+    workspace = Workspace(tmp_path)
+    assert list(workspace.snapshot()) == ["env.py"]
+
+    workspace.write("env.py", "x = 2\n")
+    workspace.write("new.py", "y = 1\n")
+    assert workspace.flush() == ["env.py", "new.py"]
+    assert (tmp_path / "env.py").read_text(encoding="utf-8") == "x = 2\n"
+    assert workspace.dirty == []
@@ -0,0 +1,232 @@
+import os
+import time
+import shutil
+import contextlib
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import typer
+import yaml
+
+# 每个模块的独立工作目录: <out>/<module>/{rtl/, vpilot_run/, uvm_tb/}
+# (骨架 Makefile 通过 '../rtl' 查找 RTL, 与 uvm_tb/ 同级放置即可)
+DEFAULT_OUT_DIR = Path("./vpilot_batch")
+RTL_SUFFIXES = (".v", ".sv")
+STAGES = ["spec", "plan", "uvm"]
+
+
+def _load_modules(manifest, rtl_dir, desc):
+    """
+    返回 [{"name", "rtl", "desc"}]. 清单格式:
+        modules:
+          - name: fifo          # 可选, 默认取 RTL 文件名
+            rtl: rtl/fifo.v     # 相对于清单文件
+            desc: "同步 FIFO"    # 可选, 默认使用 --desc
+    """
+    modules = []
+    if manifest:
+        data = yaml.safe_load(manifest.read_text(encoding="utf-8")) or {}
+        entries = data.get("modules", []) if isinstance(data, dict) else data
+        for entry in entries:
+            rtl = Path(entry["rtl"])
+            if not rtl.is_absolute():
+                rtl = manifest.parent / rtl
+            name = entry.get("name") or rtl.stem
+            modules.append(
+                {
+                    "name": name,
+                    "rtl": rtl,
+                    "desc": entry.get("desc") or desc.format(name=name),
+                }
+            )
+    else:
+        for rtl in sorted(rtl_dir.iterdir()):
+            if rtl.suffix in RTL_SUFFIXES:
+                modules.append(
+                    {"name": rtl.stem, "rtl": rtl, "desc": desc.format(name=rtl.stem)}
+                )
+    return modules
+
+
+def _init_worker(limiter):
+    from vpilot.core import llm_handler
+
+    llm_handler.configure_concurrency(limiter)
+
+
+def _run_module(module, work_dir, global_args, jobs):
+    """
+    在子进程中执行一个模块的完整流程. 各阶段命令按 CLI 的方式调用,
+    子进程的工作目录切换到模块目录, 因此所有相对路径 (vpilot_run/, uvm_tb/)
+    天然相互隔离. 输出写入 <模块目录>/batch.log.
+
+    返回 {"name", "stages": {阶段: (状态, 耗时)}, "error"}.
+    """
+    import typer.main
+    from vpilot.main import app
+
+    command = typer.main.get_command(app)
+    rtl_file = Path("rtl") / module["rtl"].name
+    steps = {
+        "spec": [
+            ["spec", "init", "--rtl", str(rtl_file), "--desc", module["desc"]],
+            ["spec", "approve", "--version", "1"],
+        ],
+        "plan": [["plan", "init"], ["plan", "approve", "--version", "1"]],
+        "uvm": [["uvm", "build", "--jobs", str(jobs)]],
+    }
+
+    result = {"name": module["name"], "stages": {}, "error": None}
+    os.chdir(work_dir)
+    with open("batch.log", "a", encoding="utf-8") as log, contextlib.redirect_stdout(
+        log
+    ), contextlib.redirect_stderr(log):
+        for stage in STAGES:
+            start = time.monotonic()
+            try:
+                for args in steps[stage]:
+                    code = command.main(
+                        global_args + args, prog_name="vpilot", standalone_mode=False
+                    )
+                    if code:
+                        raise RuntimeError(f"'vpilot {' '.join(args[:2])}' 失败")
+            except Exception as e:
+                result["stages"][stage] = ("FAIL", time.monotonic() - start)
+                result["error"] = f"{stage}: {e}"
+                print(f"[batch] {result['error']}")
+                break
+            result["stages"][stage] = ("ok", time.monotonic() - start)
+    return result
+
+
+def _print_summary(results, out_dir):
+    typer.echo("")
+    # 中文标题占两列, 手工对齐
+    header = "模块" + " " * 20 + "".join(f"{s:>14}" for s in STAGES) + "   总耗时s"
+    typer.secho(header, bold=True)
+    typer.echo("-" * (24 + 14 * len(STAGES) + 10))
+    for r in sorted(results, key=lambda r: r["name"]):
+        cells = []
+        total = 0.0
+        for stage in STAGES:
+            status, elapsed = r["stages"].get(stage, ("-", None))
+            if elapsed is None:
+                cells.append(f"{status:>14}")
+            else:
+                total += elapsed
+                cells.append(f"{status + f' {elapsed:.1f}s':>14}")
+        typer.secho(
+            f"{r['name'][:22]:<24}" + "".join(cells) + f"{total:>10.1f}",
+            fg=typer.colors.RED if r["error"] else None,
+        )
+    failed = [r for r in results if r["error"]]
+    for r in failed:
+        typer.echo(
+            f"  > {r['name']}: {r['error']} (日志: {out_dir / r['name']}/batch.log)"
+        )
+    typer.secho(
+        f"完成 {len(results) - len(failed)}/{len(results)} 个模块.",
+        fg=typer.colors.RED if failed else typer.colors.GREEN,
+    )
+
+
+def batch(
+    ctx: typer.Context,
+    manifest: Path = typer.Option(
+        None, "--manifest", "-m", help="模块清单 (YAML: modules: [{name, rtl, desc}])"
+    ),
+    rtl_dir: Path = typer.Option(
+        None, "--rtl-dir", "-r", help="RTL 目录, 其中每个 .v/.sv 文件作为一个模块"
+    ),
+    desc: str = typer.Option(
+        "RTL 模块 {name}", "--desc", "-d", help="默认设计描述 ({name} 替换为模块名)"
+    ),
+    out_dir: Path = typer.Option(DEFAULT_OUT_DIR, "--out", "-o", help="输出目录"),
+    workers: int = typer.Option(4, "--workers", "-w", help="同时处理的模块数"),
+    llm_concurrency: int = typer.Option(
+        8, "--llm-concurrency", help="所有模块合计同时进行的 LLM 请求数上限"
+    ),
+    jobs: int = typer.Option(
+        2, "--jobs", "-j", help="每个模块 'uvm build' 的并发任务数"
+    ),
+):
+    """
+    批量处理多个模块: 每个模块在独立目录中依次执行
+    spec init/approve -> plan init/approve -> uvm build (自动批准 V1).
+    """
+    if bool(manifest) == bool(rtl_dir):
+        typer.secho(
+            "错误: 必须且只能提供 --manifest 或 --rtl-dir 之一.", fg=typer.colors.RED
+        )
+        raise typer.Exit(code=1)
+    source = manifest or rtl_dir
+    if not source.exists():
+        typer.secho(f"错误: '{source}' 不存在.", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    modules = _load_modules(manifest, rtl_dir, desc)
+    if not modules:
+        typer.secho(f"错误: 在 '{source}' 中没有找到模块.", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    names = [m["name"] for m in modules]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        typer.secho(f"错误: 模块名重复: {', '.join(duplicates)}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    # 准备每个模块的目录
+    for module in modules:
+        if not module["rtl"].exists():
+            typer.secho(
+                f"错误: RTL 文件 '{module['rtl']}' 不存在.", fg=typer.colors.RED
+            )
+            raise typer.Exit(code=1)
+        module_dir = out_dir / module["name"]
+        (module_dir / "rtl").mkdir(parents=True, exist_ok=True)
+        shutil.copy2(module["rtl"], module_dir / "rtl" / module["rtl"].name)
+
+    # 全局选项 (--no-cache / --refresh) 传递给每个模块
+    parent_params = ctx.parent.params if ctx.parent else {}
+    global_args = [
+        flag
+        for flag, key in (("--no-cache", "no_cache"), ("--refresh", "refresh"))
+        if parent_params.get(key)
+    ]
+
+    typer.echo(
+        f"开始批量处理 {len(modules)} 个模块 "
+        f"(workers={workers}, LLM 并发上限={llm_concurrency}), 输出目录: {out_dir}/"
+    )
+    results = []
+    with multiprocessing.Manager() as manager:
+        limiter = manager.BoundedSemaphore(llm_concurrency)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(limiter,)
+        ) as pool:
+            futures = {
+                pool.submit(
+                    _run_module,
+                    module,
+                    (out_dir / module["name"]).resolve(),
+                    global_args,
+                    jobs,
+                ): module
+                for module in modules
+            }
+            for future in as_completed(futures):
+                module = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"name": module["name"], "stages": {}, "error": str(e)}
+                results.append(result)
+                typer.secho(
+                    f"  > [{len(results)}/{len(modules)}] {module['name']}: "
+                    + ("失败" if result["error"] else "完成"),
+                    fg=typer.colors.RED if result["error"] else typer.colors.GREEN,
+                )
+
+    _print_summary(results, out_dir)
+    if any(r["error"] for r in results):
+        raise typer.Exit(code=1)
@@ -6,7 +6,8 @@ import json
 import yaml
 import shutil
 import os
-from vpilot.core.llm_handler import execute_conversation_turn
+from vpilot.core import history_store, telemetry
+from vpilot.core.llm_handler import LLMRequestError, execute_routed_turn
 
 app = typer.Typer(help="管理<验证计划>的生成和迭代")
 
@@ -32,6 +33,19 @@ PLAN_SYSTEM_PROMPT = """
 # 'plan' 阶段专属的模板文件路径
 PLAN_TEMPLATE_PATH = Path(__file__).parent.parent / "templates/plan/verif_plan.tpl.yml"
 
+# 模型路由 (见 vpilot/core/model_router.py): 设计验证策略需要较强的推理能力;
+# 按反馈修改已有 YAML 是机械性的, 先用 fast 档位, YAML 无效时升级.
+PLAN_MODEL_ROUTES = {
+    "init": {"tier": "strong"},
+    "iterate": {"tier": "fast", "timeout": 120, "escalate": True},
+}
+
+
+@app.callback()
+def track_command(ctx: typer.Context):
+    # 为本组的所有 LLM 调用标注 telemetry 中的命令名 (例如 'plan init')
+    telemetry.set_command(f"plan {ctx.invoked_subcommand}")
+
 
 def load_state():
     """加载并返回中央状态文件内容"""
@@ -57,8 +71,23 @@ def write_state(state_data: dict):
         typer.secho(f"警告: 归档已完成,但更新状态文件失败: {e}", fg=typer.colors.YELLOW)
 
 
+def _validate_plan_yaml(text):
+    """模型路由的校验: 输出必须是 YAML 映射."""
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        return f"YAML 无效: {e}"
+    if not isinstance(data, dict):
+        return "输出不是 YAML 映射"
+    return None
+
+
 @app.command("init", help="基于已批准的<设计规范>,生成<验证计划>初稿.")
-def init():
+def init(
+    candidates: int = typer.Option(
+        1, "--candidates", help="并发请求的候选数, 采用第一个有效的 YAML"
+    ),
+):
     """
     1. 检查 'spec' 阶段是否已批准 (门控).
     2. 检查 'plan' 会话是否已存在 (安全).
@@ -116,23 +145,32 @@ def init():
         raise typer.Exit(code=1)
 
     # --- 4. 构建Prompt并调用LLM ---
+    # (模板在前: 所有模块共享同一段字节级相同的前缀, 可以命中 API 的前缀缓存)
     user_prompt = f"""
-    请基于以下已批准的<设计规范>,为我生成<验证计划>V1版本.
-    请严格按照所提供的YAML模板进行填充.
+    --- <验证计划>YAML模板 ---
+    {plan_template}
 
     --- 已批准的<设计规范> ({final_spec_file.name}) ---
     {spec_content}
 
-    --- <验证计划>YAML模板 ---
-    {plan_template}
+    请基于以上已批准的<设计规范>,为我生成<验证计划>V1版本.
+    请严格按照所提供的YAML模板进行填充.
     """
 
     typer.echo("🧠 正在调用LLM生成计划初稿 (V1)...")
-    generated_plan_str = execute_conversation_turn(
-        history_file=PLAN_HISTORY_FILE,
-        system_prompt=PLAN_SYSTEM_PROMPT,
-        user_prompt=user_prompt,
-    )
+    try:
+        generated_plan_str = execute_routed_turn(
+            history_file=PLAN_HISTORY_FILE,
+            system_prompt=PLAN_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            route=PLAN_MODEL_ROUTES["init"],
+            validate=_validate_plan_yaml,
+            task_id="init",
+            candidates=candidates,
+        )
+    except LLMRequestError as e:
+        typer.secho(f"错误: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
 
     if not generated_plan_str:
         typer.secho("生成失败.", fg=typer.colors.RED)
@@ -168,6 +206,9 @@ def iterate(
         help="直接从命令行传入的反馈字符串.",
     ),
     version: int = typer.Option(2, "--version", "-v", help="要生成的新版本号"),
+    candidates: int = typer.Option(
+        1, "--candidates", help="并发请求的候选数, 采用第一个有效的 YAML"
+    ),
 ):
     """
     1. 检查会话历史是否存在.
@@ -209,11 +250,19 @@ def iterate(
     """
 
     typer.echo("🧠 正在调用LLM进行迭代...")
-    generated_plan_str = execute_conversation_turn(
-        history_file=PLAN_HISTORY_FILE,
-        system_prompt=PLAN_SYSTEM_PROMPT,  # 处理器会自动忽略
-        user_prompt=user_prompt,
-    )
+    try:
+        generated_plan_str = execute_routed_turn(
+            history_file=PLAN_HISTORY_FILE,
+            system_prompt=PLAN_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            route=PLAN_MODEL_ROUTES["iterate"],
+            validate=_validate_plan_yaml,
+            task_id=f"v{version}",
+            candidates=candidates,
+        )
+    except LLMRequestError as e:
+        typer.secho(f"错误: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
 
     if not generated_plan_str:
         typer.secho("迭代失败.", fg=typer.colors.RED)
@@ -280,6 +329,8 @@ def approve(
 
     try:
         shutil.move(str(plan_file_to_approve), str(archive_plan_file))
+        # 先把追加日志合并进历史文件, 再整体归档
+        history_store.compact(PLAN_HISTORY_FILE)
         shutil.move(str(PLAN_HISTORY_FILE), str(archive_history_file))
         typer.echo(f"  > 归档计划: {archive_plan_file}")
         typer.echo(f"  > 归档日志: {archive_history_file}")
@@ -5,7 +5,8 @@ import shutil
 import os
 
 from pathlib import Path
-from vpilot.core.llm_handler import execute_conversation_turn
+from vpilot.core import history_store, telemetry
+from vpilot.core.llm_handler import LLMRequestError, execute_routed_turn
 
 app = typer.Typer(help="管理<设计规范>的生成和迭代")
 
@@ -22,6 +23,19 @@ SPEC_SYSTEM_PROMPT = """
 在后续的迭代中,你将根据用户的反馈逐步完善这份YAML.
 """
 
+# 模型路由 (见 vpilot/core/model_router.py): 从 RTL 推导规范需要较强的推理能力;
+# 按反馈修改已有 YAML 是机械性的, 先用 fast 档位, YAML 无效时升级.
+SPEC_MODEL_ROUTES = {
+    "init": {"tier": "strong"},
+    "iterate": {"tier": "fast", "timeout": 120, "escalate": True},
+}
+
+
+@app.callback()
+def track_command(ctx: typer.Context):
+    # 为本组的所有 LLM 调用标注 telemetry 中的命令名 (例如 'spec init')
+    telemetry.set_command(f"spec {ctx.invoked_subcommand}")
+
 
 def get_module_name_from_spec(spec_file: Path) -> str:
     """辅助函数:从YAML文件中解析出 'module_name'"""
@@ -41,10 +55,24 @@ def get_module_name_from_spec(spec_file: Path) -> str:
         raise typer.Exit(code=1)
 
 
+def _validate_spec_yaml(text):
+    """模型路由的校验: 输出必须是带 'module_name' 的 YAML 映射."""
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        return f"YAML 无效: {e}"
+    if not isinstance(data, dict) or not data.get("module_name"):
+        return "缺少 'module_name'"
+    return None
+
+
 @app.command("init", help="根据RTL和自然语言描述,初始化一份<设计规范>初稿.")
 def init(
     rtl_file: Path = typer.Option(..., "--rtl", "-r", help="RTL源文件路径"),
     desc: str = typer.Option(..., "--desc", "-d", help="设计的核心自然语言描述"),
+    candidates: int = typer.Option(
+        1, "--candidates", help="并发请求的候选数, 采用第一个有效的 YAML"
+    ),
 ):
     """
     初始化设计规范流程
@@ -93,29 +121,39 @@ def init(
         raise typer.Exit(code=1)
 
     # 3. 构建Prompt
+    # (模板在前: 所有模块共享同一段字节级相同的前缀, 可以命中 API 的前缀缓存;
+    #  RTL 和设计描述等可变内容放在后面.)
     user_prompt = f"""
-    请基于以下RTL代码和设计描述,填充所提供的YAML模板.
-    只输出填充后的YAML内容,不要包含任何额外的解释或代码块标记.
-
-    --- 设计描述 ---
-    {desc}
+    --- YAML模板 ---
+    {spec_template}
 
     --- RTL代码 (`{rtl_file.name}`) ---
     ```verilog
     {rtl_code}
     ```
 
-    --- YAML模板 ---
-    {spec_template}
+    --- 设计描述 ---
+    {desc}
+
+    请基于以上RTL代码和设计描述,填充所提供的YAML模板.
+    只输出填充后的YAML内容,不要包含任何额外的解释或代码块标记.
     """
 
     # 4. 调用LLM
     typer.echo("正在调用LLM生成规范初稿(V1), 请稍候...")
-    generated_spec_str = execute_conversation_turn(
-        history_file=SPEC_HISTORY_FILE,
-        system_prompt=SPEC_SYSTEM_PROMPT,
-        user_prompt=user_prompt,
-    )
+    try:
+        generated_spec_str = execute_routed_turn(
+            history_file=SPEC_HISTORY_FILE,
+            system_prompt=SPEC_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            route=SPEC_MODEL_ROUTES["init"],
+            validate=_validate_spec_yaml,
+            task_id="init",
+            candidates=candidates,
+        )
+    except LLMRequestError as e:
+        typer.secho(f"错误: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
 
     if not generated_spec_str:
         typer.secho("生成失败,请检查LLM API的错误信息.", fg=typer.colors.RED)
@@ -158,6 +196,9 @@ def iterate(
         "-v",
         help="要生成的新版本号 (例如: 2)",
     ),
+    candidates: int = typer.Option(
+        1, "--candidates", help="并发请求的候选数, 采用第一个有效的 YAML"
+    ),
 ):
     """
     读取反馈,将其作为新的user_prompt,继续对话.
@@ -203,11 +244,19 @@ def iterate(
 
     # 3. 调用 *完全相同* 的对话处理器
     typer.echo("🧠 正在调用LLM进行迭代...")
-    generated_spec_str = execute_conversation_turn(
-        history_file=SPEC_HISTORY_FILE,
-        system_prompt=SPEC_SYSTEM_PROMPT,  # 处理器会自动忽略这个,因为历史文件已存在
-        user_prompt=user_prompt,
-    )
+    try:
+        generated_spec_str = execute_routed_turn(
+            history_file=SPEC_HISTORY_FILE,
+            system_prompt=SPEC_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            route=SPEC_MODEL_ROUTES["iterate"],
+            validate=_validate_spec_yaml,
+            task_id=f"v{version}",
+            candidates=candidates,
+        )
+    except LLMRequestError as e:
+        typer.secho(f"错误: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
 
     if not generated_spec_str:
         typer.secho("迭代失败.", fg=typer.colors.RED)
@@ -268,6 +317,8 @@ def approve(
     # 4. 执行归档 (重命名)
     try:
         shutil.move(str(spec_file_to_approve), str(archive_spec_file))
+        # 先把追加日志合并进历史文件, 再整体归档
+        history_store.compact(SPEC_HISTORY_FILE)
         shutil.move(str(SPEC_HISTORY_FILE), str(archive_history_file))
         typer.echo(f"  > 归档规范: {archive_spec_file}")
         typer.echo(f"  > 归档日志: {archive_history_file}")
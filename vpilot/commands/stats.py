@@ -0,0 +1,139 @@
+import typer
+import unicodedata
+from pathlib import Path
+
+from vpilot.core.telemetry import TELEMETRY_FILE, load_records
+
+# (列标题, 宽度)
+COLUMNS = [
+    ("调用", 6),
+    ("缓存", 6),
+    ("复用", 6),
+    ("prompt", 10),
+    ("cached", 10),
+    ("命中率", 8),
+    ("completion", 11),
+    ("总耗时s", 9),
+    ("平均s", 8),
+    ("最大s", 8),
+    ("首字s", 8),
+    ("成本$", 9),
+]
+
+
+def _rjust(text, width):
+    """按终端显示宽度右对齐 (中文字符占两列)."""
+    display = sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+    return " " * max(0, width - display) + text
+
+
+def _aggregate(records, key_fn):
+    groups = {}
+    for r in records:
+        g = groups.setdefault(
+            key_fn(r),
+            {
+                "calls": 0,
+                "cache_hits": 0,
+                "conn_reused": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+                "latency": 0.0,
+                "max_latency": 0.0,
+                "ttfb": 0.0,
+                "cost": 0.0,
+            },
+        )
+        g["calls"] += 1
+        g["cache_hits"] += 1 if r.get("cache_hit") else 0
+        g["conn_reused"] += 1 if r.get("conn_reused") else 0
+        for field in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            g[field] += r.get(field) or 0
+        latency = r.get("latency") or 0.0
+        g["latency"] += latency
+        g["max_latency"] = max(g["max_latency"], latency)
+        g["ttfb"] += r.get("ttfb") or 0.0
+        g["cost"] += r.get("cost") or 0.0
+    return groups
+
+
+def _print_table(title, groups, key_width):
+    typer.secho(title, bold=True)
+    header = "".ljust(key_width) + "".join(_rjust(name, w) for name, w in COLUMNS)
+    typer.echo(header)
+    typer.echo("-" * len(header))
+
+    # 按总耗时降序, 最慢的排在最前
+    for key, g in sorted(groups.items(), key=lambda kv: -kv[1]["latency"]):
+        values = [
+            str(g["calls"]),
+            str(g["cache_hits"]),
+            str(g["conn_reused"]),
+            str(g["prompt_tokens"]),
+            str(g["cached_tokens"]),
+            (
+                f"{g['cached_tokens'] / g['prompt_tokens']:.0%}"
+                if g["prompt_tokens"]
+                else "-"
+            ),
+            str(g["completion_tokens"]),
+            f"{g['latency']:.1f}",
+            f"{g['latency'] / g['calls']:.1f}",
+            f"{g['max_latency']:.1f}",
+            f"{g['ttfb'] / g['calls']:.1f}",
+            f"{g['cost']:.4f}",
+        ]
+        typer.echo(
+            key[:key_width].ljust(key_width)
+            + "".join(v.rjust(w) for v, (_, w) in zip(values, COLUMNS))
+        )
+    typer.echo("")
+
+
+def stats(
+    telemetry_file: Path = typer.Option(
+        TELEMETRY_FILE, "--file", "-f", help="telemetry.jsonl 文件路径"
+    ),
+    command: str = typer.Option(
+        None, "--command", "-c", help="只统计指定命令 (例如: 'uvm build')"
+    ),
+):
+    """
+    按阶段 (命令) 和任务汇总 LLM 调用的延迟, token 和成本.
+    """
+    records = load_records(telemetry_file)
+    if command:
+        records = [r for r in records if r.get("command") == command]
+
+    if not records:
+        typer.secho(
+            f"没有可用的 telemetry 记录: {telemetry_file}", fg=typer.colors.YELLOW
+        )
+        raise typer.Exit(code=1)
+
+    _print_table(
+        "按阶段汇总",
+        _aggregate(records, lambda r: r.get("command") or "-"),
+        key_width=22,
+    )
+    _print_table(
+        "按模型汇总",
+        _aggregate(records, lambda r: r.get("model") or "-"),
+        key_width=22,
+    )
+    _print_table(
+        "按任务汇总",
+        _aggregate(
+            records,
+            lambda r: f"{r.get('command') or '-'} / {r.get('task') or '-'}",
+        ),
+        key_width=34,
+    )
+
+    total = _aggregate(records, lambda r: "total")["total"]
+    typer.secho(
+        f"合计: {total['calls']} 次调用, {total['latency']:.1f}s, "
+        f"${total['cost']:.4f}",
+        fg=typer.colors.GREEN,
+    )
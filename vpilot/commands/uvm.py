@@ -1,3 +1,4 @@
+import os
 import typer
 from pathlib import Path
 import yaml
@@ -5,18 +6,73 @@ import shutil
 import json
 import subprocess
 import re
-
-from vpilot.core.code_manager import CodeManager
-from vpilot.core.llm_handler import execute_conversation_turn
+import time
+import string
+import difflib
+import hashlib
+
+from vpilot.core.code_manager import (
+    BlockMarkerError,
+    CodeManager,
+    check_content,
+    index_blocks,
+)
+from vpilot.core.context_extractor import (
+    block_texts,
+    extract_files,
+    referenced_symbols,
+)
+from vpilot.core.fill_parser import BLOCK_MARKER, FillStreamParser
+from vpilot.core import (
+    history_store,
+    log_distiller,
+    make_runner,
+    model_router,
+    preflight,
+    telemetry,
+)
+from vpilot.core.llm_handler import (
+    LLMRequestError,
+    append_conversation,
+    execute_conversation_turn,
+    execute_routed_turn,
+    load_conversation,
+)
+from vpilot.core.scheduler import run_waves
+from vpilot.core.snapshot_store import SnapshotStore
+from vpilot.core.workspace import Workspace, atomic_write_text
 
 app = typer.Typer(help="管理 UVM 测试平台的构建和迭代")
 
 # 定义工作目录和状态文件
 VPILOT_RUN_DIR = Path("./vpilot_run")
 STATE_FILE = VPILOT_RUN_DIR / ".vpilot.state.json"
+# 状态文件中 'uvm build' 检查点的键 (见 _save_checkpoint)
+BUILD_CHECKPOINT_KEY = "uvm_build_checkpoint"
+# 上一次构建中每个任务的输入/输出哈希和回合, 供 'uvm build --incremental' 复用
+UVM_BUILD_RECORD = VPILOT_RUN_DIR / "uvm_build.tasks.json"
 UVM_TB_DIR = Path("./uvm_tb")
 SKELETON_DIR = Path(__file__).parent.parent / "skeletons"
 UVM_BUILD_HISTORY = VPILOT_RUN_DIR / "uvm_build.history.json"
+# 'uvm iterate-build --auto' 每次迭代的耗时和测试结果
+UVM_ITERATE_RECORD = VPILOT_RUN_DIR / "uvm_iterate.auto.json"
+# 发送给 LLM 的对话历史的 token 预算 (0 表示不压缩)
+HISTORY_TOKEN_BUDGET = int(os.getenv("VPILOT_HISTORY_TOKEN_BUDGET", "60000"))
+# 响应未通过本地校验 (语法, 缩进, 未知代码块) 时, 最多追加几个修正回合
+CORRECTION_TURNS = int(os.getenv("VPILOT_CORRECTION_TURNS", "1"))
+# 依赖文件的上下文: "signatures" 只发送签名, 已填充的代码块和任务引用到的函数;
+# "full" 发送完整文件
+DEP_CONTEXT = os.getenv("VPILOT_DEP_CONTEXT", "signatures")
+# 日志中没有识别出错误时, 提交给 LLM 的 'make' 输出的最大行数 (从末尾截取)
+MAKE_LOG_TAIL_LINES = int(os.getenv("VPILOT_MAKE_LOG_TAIL_LINES", "200"))
+
+CORRECTION_PROMPT = """
+[!!] 你上面的响应未通过 v-pilot 的本地校验:
+{error}
+
+请只重新输出需要修改的代码块, 每个代码块都必须是 *完整* 的,
+并严格使用 'v-pilot:fill:[filename]:[BLOCK_ID]' 格式响应.
+"""
 
 # UVM会话
 UVM_BUILD_SYSTEM_PROMPT = """
@@ -76,6 +132,243 @@ UVM_BUILD_SYSTEM_PROMPT = """
 """
 
 
+# UVM 构建任务图
+# 每个任务负责填充一个骨架文件:
+#   id:     任务标识
+#   file:   正在编辑的骨架文件
+#   deps:   作为上下文一并发送给 LLM 的依赖文件
+#   after:  必须先完成的任务 (它们的代码或 v-pilot:context 输出会被本任务使用)
+#   inputs: 除模板引用的字段外, 本任务还依赖的 spec/plan 片段 ('spec' 表示整份,
+#           'spec.ports' 表示其中一个键), 用于 '--incremental' 判断任务是否需要重新生成
+#   prompt: 任务指令模板, 用 build_context 进行 str.format_map 渲染
+# 依赖相同 (例如只依赖 seq_item) 的任务会被调度器并发执行.
+UVM_BUILD_TASKS = [
+    {
+        "id": "makefile",
+        "file": "Makefile",
+        "deps": [],
+        "after": [],
+        "inputs": ["spec.module_name"],
+        "prompt": """
+    任务 1: 填充 'Makefile' 的 'COCOTB_TOPLEVEL' 块.
+    (根据 'spec.module_name')
+
+    [!!] 响应格式:
+    v-pilot:fill:Makefile:COCOTB_TOPLEVEL
+    """,
+    },
+    {
+        "id": "seq_item",
+        "file": "seq_item.py",
+        "deps": [],
+        "after": [],
+        "inputs": ["spec"],
+        "prompt": """
+    任务 2: 填充 'seq_item.py' 中的 *所有* 4 个 LLM 块.
+    (SEQ_ITEM_FIELDS, SEQ_ITEM_RANDOMIZE, SEQ_ITEM_STR, SEQ_ITEM_EQ)
+
+    [!!] 关键:
+    查看 'seq_item.py' 的文件内容, 确保你的代码
+    填充在 `class MySeqItem(uvm_sequence_item):` 内部.
+
+    [!!] 响应格式: (所有 4 个 'v-pilot:fill:seq_item.py:[BLOCK_ID]' 块)
+    """,
+    },
+    {
+        "id": "base_bfm",
+        "file": "base_bfm.py",
+        "deps": ["seq_item.py"],
+        "after": ["seq_item"],
+        "inputs": ["spec"],
+        "prompt": """
+    任务 3: 填充 'base_bfm.py' 中的 *所有* 4 个 LLM 块.
+    (BFM_HANDLES, BFM_RESET_TASK, BFM_DRIVER_TASKS, BFM_MONITOR_TASKS_AND_GETTERS)
+
+    [!!] 关键:
+    你 *必须* 查看 'base_bfm.py' (正在编辑) 和 'seq_item.py' (依赖文件).
+    你的 BFM 任务 (例如 'drive_input') *必须* 能够处理
+    在 'seq_item.py' 中定义的 *所有* 字段 (例如 'item.data_in', 'item.addr').
+
+    [!!] 响应格式:
+    1. v-pilot:context:bfm_methods:[...] (您生成的方法列表)
+    2. v-pilot:fill:base_bfm.py:[BLOCK_ID] (所有 4 个块)
+    """,
+    },
+    {
+        "id": "driver",
+        "file": "driver.py",
+        "deps": ["base_bfm.py"],
+        "after": ["base_bfm"],
+        "inputs": [],
+        "prompt": """
+    任务 4: 填充 'driver.py' 的 'DRIVER_BFM_CALL' 块.
+
+    [!!] v-pilot 上下文 (来自 任务 3):
+    - BFM 方法: {bfm_methods}
+
+    [!!] 关键:
+    查看 'driver.py' 的文件内容, 你的代码将位于 'run_phase'
+    的 'while True' 循环内部.
+    你 *必须* 从上面的列表中选择 'drive'/'write' 相关的方法来调用.
+
+    [!!] 响应格式: v-pilot:fill:driver.py:DRIVER_BFM_CALL
+    """,
+    },
+    {
+        "id": "monitor",
+        "file": "monitor.py",
+        "deps": ["base_bfm.py", "seq_item.py"],
+        "after": ["base_bfm", "seq_item"],
+        "inputs": [],
+        "prompt": """
+    任务 5: 填充 'monitor.py' 的 'MONITOR_BFM_CALL' 块.
+
+    [!!] v-pilot 上下文 (来自 任务 2):
+    - BFM 方法: {bfm_methods}
+
+    [!!] v-pilot 规则 (来自框架):
+    - 你 *必须* `create` 一个 'MySeqItem' 实例
+    - 你 *必须* `write` 到 'self.ap'
+
+    [!!] 响应格式: v-pilot:fill:monitor.py:MONITOR_BFM_CALL
+    """,
+    },
+    {
+        "id": "scoreboard",
+        "file": "scoreboard.py",
+        "deps": ["seq_item.py"],
+        "after": ["seq_item"],
+        "inputs": ["spec"],
+        "prompt": """
+    任务 6: 填充 'scoreboard.py' 的 3 个 LLM 块.
+
+    [!!] v-pilot 上下文 (来自 spec):
+    - 设计描述: {spec_description}
+
+    [!!] 响应格式: (所有 3 个 'v-pilot:fill:scoreboard.py:[BLOCK_ID]' 块)
+    """,
+    },
+    {
+        "id": "env",
+        "file": "env.py",
+        "deps": ["agent.py", "scoreboard.py", "coverage.py"],
+        "after": ["scoreboard", "coverage"],
+        "inputs": [],
+        "prompt": """
+    任务 7: 填充 'env.py' 的 2 个 LLM 块.
+
+    [!!] v-pilot 上下文 (来自 plan):
+    - 拓扑: {uvm_topology}
+
+    [!!] v-pilot 规则 (来自框架):
+    - Agent 类名: 'MyAgent'
+    - Scoreboard 类名: 'Scoreboard'
+    - Coverage 类名: 'Coverage'
+    - Monitor 端口: 'ap'
+    - Scoreboard 端口: 'expected_fifo.analysis_export', 'actual_fifo.analysis_export'
+    - Coverage 端口: 'analysis_export'
+
+    [!!] 响应格式:
+    1. v-pilot:context:sequencers:[...] (您实例化的 *所有* sequencer 路径)
+    2. v-pilot:fill:env.py:ENV_INSTANTIATION
+    3. v-pilot:fill:env.py:ENV_CONNECTIONS
+    """,
+    },
+    {
+        "id": "coverage",
+        "file": "coverage.py",
+        "deps": ["seq_item.py"],
+        "after": ["seq_item"],
+        "inputs": [],
+        "prompt": """
+    任务 8: 填充 'coverage.py' 的 'COVERAGE_DEFINITIONS' 和 'COVERAGE_SAMPLE_CALL' 块.
+
+    [!!] v-pilot 上下文 (来自 plan):
+    - 覆盖点: {coverage_points}
+
+    [!!] 关键规则:
+    `@CoverPoint` 装饰器 的参数请你回顾cocotb-coverage的文档, 以及根据示例生成
+    不存在 'description' 或 'item_field' 等关键字参数.
+
+    [!!] 响应格式: (所有 2 个 'v-pilot:fill:coverage.py:[BLOCK_ID]' 块)
+    """,
+    },
+    {
+        "id": "sequence_lib",
+        "file": "sequence_lib.py",
+        "deps": ["seq_item.py"],
+        "after": ["seq_item"],
+        "inputs": [],
+        "prompt": """
+    任务 9: 填充 'sequence_lib.py' 的 'SEQUENCES' 块.
+
+    [!!] v-pilot 上下文 (来自 plan):
+    - 序列库: {sequence_library}
+
+    [!!] v-pilot 规则 (来自框架):
+    - 你 *必须* 继承 'MyBaseSeq'
+    - 你 *必须* 使用 'MySeqItem'
+    - 你 *禁止* 访问 'self.dut', 'self.bfm'
+    - [例外] 仅在 'plan' 明确要求 'fork/join' 时才可导入 'cocotb'
+
+    [!!] 响应格式: v-pilot:fill:sequence_lib.py:SEQUENCES
+    """,
+    },
+    {
+        "id": "test_lib",
+        "file": "test_lib.py",
+        "deps": ["base_test.py", "sequence_lib.py", "env.py"],
+        "after": ["sequence_lib", "env"],
+        "inputs": [],
+        "prompt": """
+    任务 10: 填充 'test_lib.py' 的 'TESTS' 块.
+
+    [!!] v-pilot 上下文 (来自 plan):
+    - 序列库: {sequence_library}
+
+    [!!] v-pilot 上下文 (来自 任务 7):
+    - Sequencers: {sequencers}
+
+    [!!] v-pilot 规则 (来自框架):
+    - 你 *必须* 继承 'MyBaseTest' (来自 'base_test.py')
+    - 你 *必须* 重写 'async def main_phase(self)'
+    - 你 *必须* 使用 `seq_lib.` 命名空间
+    - 你 *必须* `start` 在一个正确的 Sequencer 路径上
+
+    [!!] 响应格式: v-pilot:fill:test_lib.py:TESTS
+    """,
+    },
+]
+# 每个任务完整的上游依赖. '--resume' 时 _remaining_tasks 会去掉已完成的依赖,
+# 输入哈希仍然按完整的依赖计算, 保证全新构建/恢复/增量构建得到同样的哈希.
+UVM_BUILD_TASK_DEPS = {task["id"]: task["after"] for task in UVM_BUILD_TASKS}
+
+# 模型路由 (见 vpilot/core/model_router.py): 任务 id -> 档位.
+# 机械性的任务 (Makefile 变量, 数据类字段, 组件连线) 用 fast 档位, 输出无法注入时
+# 升级到 strong; 参考模型, 驱动/监视时序, 激励序列和日志诊断直接用 strong.
+# (不同模型的前缀缓存互不共享, 因此档位只按任务难度划分, 不做更细的拆分.)
+UVM_MODEL_ROUTES = {
+    "context": {"tier": "fast"},
+    "makefile": {"tier": "fast", "timeout": 60, "escalate": True},
+    "seq_item": {"tier": "fast", "timeout": 90, "escalate": True},
+    "base_bfm": {"tier": "strong"},
+    "driver": {"tier": "strong"},
+    "monitor": {"tier": "strong"},
+    "scoreboard": {"tier": "strong"},
+    "env": {"tier": "fast", "timeout": 90, "escalate": True},
+    "coverage": {"tier": "fast", "timeout": 120, "escalate": True},
+    "sequence_lib": {"tier": "strong"},
+    "test_lib": {"tier": "fast", "timeout": 90, "escalate": True},
+    "fix": {"tier": "strong"},
+}
+
+
+@app.callback()
+def track_command(ctx: typer.Context):
+    # 为本组的所有 LLM 调用标注 telemetry 中的命令名 (例如 'uvm build')
+    telemetry.set_command(f"uvm {ctx.invoked_subcommand}")
+
+
 def load_state():
     """辅助函数: 加载并验证状态文件"""
     if not STATE_FILE.exists():
@@ -89,16 +382,74 @@ def load_state():
         raise typer.Exit(code=1)
 
 
+def write_state(state_data: dict):
+    """将更新后的状态写回文件 (原子写入, 构建中途被中断也不会损坏状态文件)"""
+    atomic_write_text(STATE_FILE, json.dumps(state_data, indent=2, ensure_ascii=False))
+
+
+def _save_checkpoint(state, checkpoint, build_context, snapshot_id, task_id=None):
+    """
+    记录 'uvm build' 的检查点:
+        inputs: spec + plan 的哈希 (蓝图变化后不能恢复)
+        completed: 已合并的任务; build_context: 合并后的上下文;
+        history_length: 对话历史的消息数; snapshot: 对应的 uvm_tb 快照.
+    """
+    if task_id:
+        checkpoint["completed"].append(task_id)
+    checkpoint["build_context"] = build_context
+    checkpoint["history_length"] = len(history_store.load(UVM_BUILD_HISTORY) or [])
+    checkpoint["snapshot"] = snapshot_id
+    state[BUILD_CHECKPOINT_KEY] = checkpoint
+    write_state(state)
+
+
+def _restore_checkpoint(snapshots, checkpoint):
+    """把 uvm_tb/ 和对话历史恢复到检查点时的状态."""
+    written, _ = snapshots.checkout(checkpoint["snapshot"], UVM_TB_DIR)
+    if written:
+        typer.echo(f"  > 已从快照 #{checkpoint['snapshot']} 恢复 {len(written)} 个文件")
+    # 检查点之后写入的回合 (任务合并后, 检查点保存前被中断) 需要丢弃
+    messages = history_store.load(UVM_BUILD_HISTORY) or []
+    if len(messages) > checkpoint["history_length"]:
+        history_store.write(UVM_BUILD_HISTORY, messages[: checkpoint["history_length"]])
+    elif len(messages) < checkpoint["history_length"]:
+        typer.secho(
+            "错误: 对话历史比检查点记录的短, 无法恢复. 请重新运行 'vpilot uvm build'.",
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(code=1)
+
+
+def _remaining_tasks(tasks, done):
+    """去掉已完成的任务, 以及剩余任务对它们的依赖."""
+    return [
+        dict(task, after=[dep for dep in task.get("after", []) if dep not in done])
+        for task in tasks
+        if task["id"] not in done
+    ]
+
+
 def _execute_task_with_context(
     relative_file_to_edit: str,
     dependent_files: list[str],
     task_prompt: str,
-) -> str:
+    history: list = None,
+    make_stream_parser=None,
+    token_budget: int = None,
+    task_id: str = None,
+    candidates: int = 1,
+    workspace=None,
+) -> tuple:
     """
     1. 读取 'relative_file_to_edit' (要编辑的文件).
     2. [!!] 读取 *所有* 'dependent_files' (依赖文件).
+       提供 'workspace' 时从内存中一次取出 (所有文件来自同一时刻).
+       默认只发送依赖文件的精简视图 (见 context_extractor 和 DEP_CONTEXT).
     3. 将 *全部* 内容组合成一个 "超级 Prompt".
-    4. 调用 LLM.
+    4. 基于 'history' 快照调用 LLM (不写回历史, 由调用者按顺序合并).
+       提供 'make_stream_parser' 时以流式模式调用 (只报告进度, 不注入).
+
+    返回 (完整 Prompt, LLM 响应).
     """
     try:
         title = [line for line in task_prompt.splitlines() if line.strip()][1]
@@ -106,38 +457,49 @@ def _execute_task_with_context(
     except IndexError:
         typer.echo(f"  > 正在执行: {relative_file_to_edit}")
 
+    files = _read_tb_files([*dependent_files, relative_file_to_edit], workspace)
+    current_file_content = files[relative_file_to_edit]
+
     # 1. 构建 "依赖文件" 上下文
+    dep_files = {dep_file: files[dep_file] for dep_file in dependent_files}
+    context_tokens_saved = 0
+    if DEP_CONTEXT != "full" and current_file_content is not None:
+        # 任务指令和要填充的代码块 (包括示例注释) 中引用到的函数保留完整实现
+        symbols = referenced_symbols(task_prompt, *block_texts(current_file_content))
+        dep_files, before, after = extract_files(dep_files, symbols)
+        context_tokens_saved = before - after
+        if context_tokens_saved > 0:
+            typer.echo(
+                f"  > [Context] {task_id or relative_file_to_edit}: 依赖文件 "
+                f"{before} -> {after} tokens (节省 {context_tokens_saved})"
+            )
+
     dependency_context = ""
     for dep_file in dependent_files:
-        try:
-            dep_content = (UVM_TB_DIR / dep_file).read_text(encoding="utf-8")
-            dependency_context += f"""
+        dep_content = dep_files[dep_file]
+        if dep_content is None:
+            # (忽略无法读取的文件, 例如在任务 7 之前 scoreboard.py 还没有被创建)
+            continue
+        dependency_context += f"""
                 [!!] 依赖文件: {dep_file}
                 --- (内容开始) ---
                 {dep_content}
                 --- (内容结束) ---
             """
-        except Exception:
-            # (忽略无法读取的文件, 例如在任务 7 之前 scoreboard.py 还没有被创建)
-            pass
 
-    # 2. 读取 "正在编辑的文件"
-    try:
-        current_file_content = (UVM_TB_DIR / relative_file_to_edit).read_text(
-            encoding="utf-8"
-        )
-    except Exception as e:
+    # 2. 检查 "正在编辑的文件"
+    if current_file_content is None:
         typer.secho(
-            f"  > [!!] 错误: 无法读取骨架文件: {relative_file_to_edit}: {e}",
+            f"  > [!!] 错误: 无法读取骨架文件: {relative_file_to_edit}",
             fg=typer.colors.RED,
         )
         raise typer.Exit(code=1)
 
     # 3. 构建 V-Final 完整 Prompt
+    # [!!] 布局: 稳定的大块上下文 (依赖文件, 正在编辑的文件) 在前, 可变的任务指令在后.
+    # 这样同一波次中依赖相同文件的任务 (以及重跑时未变化的任务) 共享尽可能长的
+    # 字节级相同前缀, 可以命中 API 的前缀缓存 (更便宜, 首字更快).
     full_prompt = f"""
-    {task_prompt}
-    # (↑ 'task_prompt' 现在包含 v-pilot 提供的 *关键字*)
-
     {dependency_context}
 
     [!!] 核心上下文: 正在编辑的文件
@@ -145,6 +507,9 @@ def _execute_task_with_context(
     {current_file_content}
     --- (文件结束) ---
 
+    {task_prompt}
+    # (↑ 'task_prompt' 现在包含 v-pilot 提供的 *关键字*)
+
     请分析 *所有* 上下文 (任务指令, 依赖文件, 正在编辑的文件),
     并回忆 (从我们的对话历史最开始) 'spec.yml' 和 'plan.yml' 的完整内容,
     来完成此任务. 提供的注释代码仅用来提供参考, 你需要根据实际情况进行调整.
@@ -152,68 +517,435 @@ def _execute_task_with_context(
     请严格按照 'v-pilot:fill:...' 格式响应.
     """
 
-    response = execute_conversation_turn(UVM_BUILD_HISTORY, "", full_prompt)
+    response = _request_turn(
+        full_prompt,
+        history=history,
+        make_stream_parser=make_stream_parser,
+        token_budget=token_budget,
+        task_id=task_id,
+        validate=lambda r: _validate_fill_response(r, relative_file_to_edit, workspace),
+        candidates=candidates,
+        context_tokens_saved=context_tokens_saved,
+    )
+    return full_prompt, response
+
+
+def _request_turn(
+    prompt,
+    history=None,
+    make_stream_parser=None,
+    save=False,
+    token_budget=None,
+    task_id=None,
+    validate=None,
+    candidates=1,
+    context_tokens_saved=0,
+):
+    """
+    在 UVM 构建会话中请求一个回合, 按 UVM_MODEL_ROUTES 选择模型.
+    流式模式下, 只有当流正常结束时才交出最后一个代码块.
+    升级重试和并发候选都基于同一份历史快照, 各自使用新的流式解析器.
+    """
+    if history is None:
+        history = load_conversation(UVM_BUILD_HISTORY, "")
+
+    def request(model, timeout, candidate, turn_history, turn_prompt):
+        stream_parser = make_stream_parser() if make_stream_parser else None
+        response = execute_conversation_turn(
+            UVM_BUILD_HISTORY,
+            "",
+            turn_prompt,
+            model=model,
+            history=turn_history,
+            save=False,
+            on_delta=stream_parser.feed if stream_parser else None,
+            token_budget=token_budget,
+            task_id=task_id,
+            timeout=timeout,
+            candidate=candidate,
+            context_tokens_saved=context_tokens_saved,
+        )
+        if response is not None and stream_parser:
+            stream_parser.close()
+        return response
+
+    def attempt(model, timeout, candidate):
+        return request(model, timeout, candidate, history, prompt)
+
+    route = UVM_MODEL_ROUTES.get(task_id) or model_router.DEFAULT_ROUTE
+    try:
+        response = model_router.run(
+            route,
+            attempt,
+            validate=validate,
+            label=task_id,
+            candidates=candidates,
+        )
+    except LLMRequestError as e:
+        # 由调用者按 "未获得响应" 处理 (构建中止, 修复失败)
+        typer.secho(f"  > [!!] {task_id}: {e}", fg=typer.colors.RED)
+        return None
+
+    # 仍未通过本地校验: 把错误直接发回给模型, 只要求重写出错的代码块.
+    # 修正回合基于 "快照 + 本回合" 发起, 合并后的响应才写回历史.
+    for _ in range(CORRECTION_TURNS if validate else 0):
+        error = validate(response) if response is not None else None
+        if error is None:
+            break
+        typer.secho(
+            f"  > [Correction] {task_id}: 本地校验失败 ({error}), 请求修正...",
+            fg=typer.colors.YELLOW,
+        )
+        try:
+            correction = request(
+                model_router.model_for(route["tier"]),
+                None,
+                0,
+                (history or [])
+                + [
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": response},
+                ],
+                CORRECTION_PROMPT.format(error=error),
+            )
+        except LLMRequestError as e:
+            # 保留未修正的响应, 由调用者报告校验错误
+            typer.secho(f"  > [!!] {task_id}: {e}", fg=typer.colors.RED)
+            break
+        response = _merge_responses(response, correction)
+    if save and response is not None:
+        append_conversation(
+            UVM_BUILD_HISTORY,
+            [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response},
+            ],
+        )
     return response
 
 
-def _parse_and_inject(response, code_manager):
-    build_context = {}
+def _merge_responses(response, correction):
+    """
+    把修正回合的 'v-pilot:' 块合并进原响应: 同一头部的块被替换, 新的块追加在末尾.
+    """
+    parts = response.split(BLOCK_MARKER)
+    headers = [part.strip().split("\n", 1)[0].strip() for part in parts]
+    for part in correction.split(BLOCK_MARKER)[1:]:
+        header = part.strip().split("\n", 1)[0].strip()
+        if not header:
+            continue
+        if not part.endswith("\n"):
+            part += "\n"
+        if header in headers[1:]:
+            parts[headers.index(header, 1)] = part
+        else:
+            if not parts[-1].endswith("\n"):
+                parts[-1] += "\n"
+            parts.append(part)
+            headers.append(header)
+    return BLOCK_MARKER.join(parts)
+
+
+def _read_tb_files(relative_files, workspace=None):
+    """
+    读取 uvm_tb 中的文件, 返回 {文件: 内容}, 无法读取的文件为 None.
+    提供 workspace 时读取内存中的内容.
+    """
+    if workspace is not None:
+        return workspace.snapshot(relative_files)
+    files = {}
+    for relative_file in relative_files:
+        try:
+            files[relative_file] = (UVM_TB_DIR / relative_file).read_text(
+                encoding="utf-8"
+            )
+        except (OSError, UnicodeDecodeError):
+            files[relative_file] = None
+    return files
 
-    for block in response.split("v-pilot:"):
-        if not block.strip():
+
+def _validate_fill_response(response, relative_file=None, workspace=None):
+    """
+    注入前的本地校验 (用于模型路由和候选选择):
+    - 每个 fill 块都必须指向 uvm_tb 中存在的代码块;
+    - 指定 relative_file 时, 还必须至少包含一个该文件的 fill 块;
+    - 在内存中拼接所有 fill 块 (含缩进规范化) 后, 文件必须通过 check_content
+      (.py 文件完整编译, Makefile 基本检查).
+    返回错误描述, 通过时返回 None.
+    """
+    fills = {}
+    for block in response.split(BLOCK_MARKER):
+        block_lines = block.strip().split("\n", 1)
+        parts = block_lines[0].strip().split(":")
+        if parts[0] != "fill":
             continue
+        if len(parts) != 3:
+            return f"fill 头部格式错误: {block_lines[0].strip()}"
+        content = block_lines[1] if len(block_lines) > 1 else ""
+        # 同一代码块出现多次时以最后一次为准 (与逐块注入的结果一致)
+        fills.setdefault(parts[1].strip(), {})[parts[2].strip()] = content
+
+    if relative_file and relative_file not in fills:
+        return f"没有 {relative_file} 的 fill 块"
 
+    code_manager = CodeManager(UVM_TB_DIR)
+    contents = _read_tb_files(list(fills), workspace)
+    for file_name, blocks in fills.items():
+        if contents[file_name] is None:
+            return f"未知的文件: {file_name}"
         try:
-            block_lines = block.strip().split("\n", 1)
-            header = block_lines[0].strip()
-            content = block_lines[1] if len(block_lines) > 1 else ""
+            text = code_manager.splice_blocks(
+                contents[file_name], blocks, relative_file=file_name
+            )
+        except KeyError as e:
+            return f"未知的代码块: {file_name}:{e.args[0]}"
+        except BlockMarkerError as e:
+            return f"{file_name} 中的代码块标记损坏: {e}"
+        # 与 CodeManager 一致: 只追究 fill 块引入的错误
+        error = check_content(file_name, text)
+        if error and not check_content(file_name, contents[file_name]):
+            return error
+    return None
+
+
+def _handle_block(block, code_manager, build_context, inject=True, pending=None):
+    """
+    处理一个 'v-pilot:' 响应块 (不含 'v-pilot:' 前缀).
+    fill 块注入到骨架文件 (inject=False 时跳过), context 块写入 build_context.
+    提供 pending 时 fill 块只收集到 pending[文件][代码块] 中, 由调用者批量注入.
+    """
+    if not block.strip():
+        return
 
-            header_parts = header.strip().split(":")
-            cmd_type = header_parts[0]
+    try:
+        block_lines = block.strip().split("\n", 1)
+        header = block_lines[0].strip()
+        content = block_lines[1] if len(block_lines) > 1 else ""
+
+        header_parts = header.strip().split(":")
+        cmd_type = header_parts[0]
+
+        if cmd_type == "fill":
+            if not inject:
+                return
+            if len(header_parts) != 3:
+                raise ValueError(f"Fill 头部格式错误: {header}")
+            if not content:
+                raise ValueError(f"Fill 块内容为空: {header}")
+
+            file_to_fix = header_parts[1].strip()
+            block_to_fix = header_parts[2].strip()
+
+            # CodeManager会自动清理 content
+            if pending is not None:
+                pending.setdefault(file_to_fix, {})[block_to_fix] = content
+            else:
+                code_manager.update_block(file_to_fix, block_to_fix, content)
 
-            if cmd_type == "fill":
-                if len(header_parts) != 3:
-                    raise ValueError(f"Fill 头部格式错误: {header}")
-                if not content:
-                    raise ValueError(f"Fill 块内容为空: {header}")
+        elif cmd_type == "context":
+            if len(header_parts) != 3:
+                raise ValueError(f"Context 头部格式错误: {header}")
 
-                file_to_fix = header_parts[1].strip()
-                block_to_fix = header_parts[2].strip()
+            key = header_parts[1].strip()
+            value_str = header_parts[2].strip()
 
-                # CodeManager会自动清理 content
-                code_manager.update_block(file_to_fix, block_to_fix, content)
+            if value_str.startswith("[") and value_str.endswith("]"):
+                build_context[key] = [
+                    m.strip().strip("'\"")
+                    for m in value_str[1:-1].split(",")
+                    if m.strip()
+                ]
+            else:
+                build_context[key] = value_str
+
+    except Exception as e:
+        typer.secho(f"  > [!!] 警告: 无法解析 LLM 响应块: {e}", fg=typer.colors.YELLOW)
+        typer.echo(f"  > 块内容 (前100字符): {block[:100]}...")
 
-            elif cmd_type == "context":
-                if len(header_parts) != 3:
-                    raise ValueError(f"Context 头部格式错误: {header}")
 
-                key = header_parts[1].strip()
-                value_str = header_parts[2].strip()
+def _parse_and_inject(response, code_manager, inject=True):
+    """
+    解析完整的 LLM 响应. 返回其中的 'v-pilot:context' 键值.
+    inject=False 时只提取 context (复用的回合, 代码已经在 uvm_tb/ 中).
+    同一文件的所有 fill 块一次读取, 一次写入.
+    """
+    build_context = {}
+    pending = {}
+    for block in response.split(BLOCK_MARKER):
+        _handle_block(block, code_manager, build_context, inject, pending)
+    for file_name, blocks in pending.items():
+        code_manager.update_blocks(file_name, blocks)
+    return build_context
 
-                if value_str.startswith("[") and value_str.endswith("]"):
-                    build_context[key] = [
-                        m.strip().strip("'\"")
-                        for m in value_str[1:-1].split(",")
-                        if m.strip()
-                    ]
-                else:
-                    build_context[key] = value_str
 
-        except Exception as e:
-            typer.secho(
-                f"  > [!!] 警告: 无法解析 LLM 响应块: {e}", fg=typer.colors.YELLOW
+def _stream_progress(label):
+    """
+    创建一个流式解析器, 只报告代码块的到达进度.
+    代码块不在这里注入: 响应还要经过本地校验 (以及升级重试, 修正回合),
+    并且 worker 线程不能写共享的工作区. 通过校验的最终响应由主线程
+    (合并步骤) 统一注入.
+    """
+    start = time.monotonic()
+
+    def on_block(block):
+        if parser.blocks_emitted == 1:
+            typer.echo(
+                f"  > [Stream] {label}: 首个代码块在 "
+                f"{time.monotonic() - start:.1f}s 后到达"
             )
-            typer.echo(f"  > 块内容 (前100字符): {block[:100]}...")
 
-    return build_context
+    parser = FillStreamParser(on_block)
+    return parser
+
+
+def _initial_build_context(spec_data, plan_data):
+    """构建开始时的 build_context, 之后由各任务的 'v-pilot:context' 输出更新."""
+    return {
+        "module_name": spec_data.get("module_name", "UNKNOWN_MODULE"),
+        "key_signals": spec_data.get("key_signals", {}),
+        "ports": spec_data.get("ports", []),
+        "spec_description": spec_data.get("description", ""),
+        "uvm_topology": plan_data.get("uvm_topology", {}),
+        "sequence_library": plan_data.get("sequence_library", []),
+        "coverage_points": plan_data.get("coverage_points", []),
+        "generated_bfm_methods": [],
+        "generated_sequencers": [],
+        # 由任务 3 / 任务 7 的 'v-pilot:context' 输出填充
+        "bfm_methods": [],
+        "sequencers": [],
+    }
+
+
+def _initial_context_prompt(spec_text, plan_text):
+    return f"""
+    --- 蓝图 1: design_spec.final.yml ---
+    {spec_text}
+    --- 蓝图 2: verif_plan.final.yml ---
+    {plan_text}
+    你现在拥有了完整的上下文.请确认你已准备好, 等待我的第一个任务.
+    """
+
+
+def _send_initial_context(spec_text, plan_text, record, reuse=False):
+    """
+    任务 0: 把两份蓝图发送给 LLM, 作为整个构建会话的稳定前缀.
+    reuse=True 且有上一次构建的记录时, 直接复用它的确认回复, 不调用 LLM
+    (回复只是确认, 与蓝图内容无关).
+    """
+    initial_prompt = _initial_context_prompt(spec_text, plan_text)
+    if reuse and record.get("context"):
+        append_conversation(
+            UVM_BUILD_HISTORY,
+            [
+                {"role": "user", "content": initial_prompt},
+                {"role": "assistant", "content": record["context"]["response"]},
+            ],
+            UVM_BUILD_SYSTEM_PROMPT,
+        )
+        return
+    try:
+        initial_response = execute_routed_turn(
+            UVM_BUILD_HISTORY,
+            UVM_BUILD_SYSTEM_PROMPT,
+            initial_prompt,
+            UVM_MODEL_ROUTES["context"],
+            task_id="context",
+        )
+    except LLMRequestError as e:
+        typer.secho(f"错误: 发送初始上下文失败: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    record["context"] = {"response": initial_response}
+    _write_build_record(record)
+
+
+def _load_build_record():
+    try:
+        return json.loads(UVM_BUILD_RECORD.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_build_record(record):
+    atomic_write_text(UVM_BUILD_RECORD, json.dumps(record, ensure_ascii=False))
+
+
+def _hash_json(payload):
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _task_input_hash(task, build_context, spec_data, plan_data, outputs):
+    """
+    任务输入的哈希: 指令模板, task["inputs"] 声明的 spec/plan 片段, 模板引用的
+    build_context 字段, 系统提示, 骨架文件 (正在编辑的文件和依赖文件),
+    以及上游任务 (after) 输出的哈希. 上游任务被重新生成后, 下游任务随之失效.
+    """
+    sources = {"spec": spec_data, "plan": plan_data}
+    sections = {}
+    for name in task.get("inputs", []):
+        source, _, key = name.partition(".")
+        sections[name] = sources[source].get(key) if key else sources[source]
+    fields = sorted(
+        {field for _, field, _, _ in string.Formatter().parse(task["prompt"]) if field}
+    )
+    skeleton = {}
+    for relative_file in [task["file"], *task["deps"]]:
+        path = SKELETON_DIR / relative_file
+        skeleton[relative_file] = (
+            SnapshotStore.hash_content(path.read_text(encoding="utf-8"))
+            if path.is_file()
+            else None
+        )
+    return _hash_json(
+        {
+            "system": UVM_BUILD_SYSTEM_PROMPT,
+            "prompt": task["prompt"],
+            "file": task["file"],
+            "deps": task["deps"],
+            "sections": sections,
+            "context": {field: build_context.get(field) for field in fields},
+            "skeleton": skeleton,
+            "after": {
+                dep: outputs.get(dep)
+                for dep in UVM_BUILD_TASK_DEPS.get(task["id"], task.get("after", []))
+            },
+        }
+    )
 
 
 @app.command("build", help="[!!] 启动一个交互式会话来构建 UVM 脚手架")
-def build():
+def build(
+    jobs: int = typer.Option(
+        4, "--jobs", "-j", help="并发执行的最大任务数 (1 表示按顺序执行)"
+    ),
+    stream: bool = typer.Option(
+        False, "--stream", help="流式接收 LLM 响应, 报告代码块的到达进度"
+    ),
+    token_budget: int = typer.Option(
+        HISTORY_TOKEN_BUDGET,
+        "--token-budget",
+        help="对话历史的 token 预算, 超出时压缩旧回合 (0 表示不压缩)",
+    ),
+    candidates: int = typer.Option(
+        1,
+        "--candidates",
+        help="每个任务并发请求的候选数, 采用第一个通过本地校验的候选",
+    ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="从上一次中断的构建的检查点继续, 跳过已完成的任务",
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="在现有 uvm_tb/ 上构建, 只重新生成输入 (spec/plan 片段, 上游任务) 变化的任务",
+    ),
+):
     """
     'uvm build', 一个有状态的会话
     """
-    typer.echo("启动 UVM 构建会话...")
+    typer.echo("继续 UVM 构建会话..." if resume else "启动 UVM 构建会话...")
     # --- 1. 门控检查和加载 ---
     state = load_state()
     if not state.get("plan_approved"):
@@ -251,287 +983,749 @@ def build():
         )
         raise typer.Exit(code=1)
 
-    # --- 2. 复制骨架 ---
-    if UVM_TB_DIR.exists():
-        typer.secho("警告: 'uvm_tb/' 目录已存在, 将被覆盖.", fg=typer.colors.YELLOW)
-        shutil.rmtree(UVM_TB_DIR)
-    shutil.copytree(SKELETON_DIR, UVM_TB_DIR)
-    typer.echo(f"  > 已将骨架文件复制到 {UVM_TB_DIR}/")
+    # 每个任务合并后记录一个快照 (内容寻址, 未变化的文件不重复存储)
+    snapshots = SnapshotStore()
+    inputs = SnapshotStore.hash_content(spec_text + plan_text)
+    record = (_load_build_record() if resume or incremental else None) or {"tasks": {}}
+
+    # --- 2. 复制骨架 (或从检查点恢复, 或在现有 uvm_tb/ 上增量构建) ---
+    if resume:
+        checkpoint = state.get(BUILD_CHECKPOINT_KEY)
+        if not checkpoint:
+            typer.secho("错误: 没有可恢复的构建检查点.", fg=typer.colors.RED)
+            typer.echo("  > 请直接运行 'vpilot uvm build'.")
+            raise typer.Exit(code=1)
+        if checkpoint["inputs"] != inputs:
+            typer.secho(
+                "错误: spec/plan 在上次构建之后发生了变化, 不能从检查点恢复.",
+                fg=typer.colors.RED,
+            )
+            typer.echo("  > 请直接运行 'vpilot uvm build' 重新构建.")
+            raise typer.Exit(code=1)
+        if checkpoint.get("finished"):
+            typer.secho("上一次构建已经完成, 无需恢复.", fg=typer.colors.GREEN)
+            return
+        typer.echo(
+            f"  > 从检查点恢复, 跳过已完成的任务: "
+            f"{', '.join(checkpoint['completed']) or '(无)'}"
+        )
+        _restore_checkpoint(snapshots, checkpoint)
+        workspace = Workspace(
+            UVM_TB_DIR, _tracked_tb_files(snapshots.get(checkpoint["snapshot"]))
+        )
+        build_context = checkpoint["build_context"]
+    elif incremental:
+        if not record["tasks"] or not UVM_TB_DIR.is_dir():
+            typer.secho(
+                "错误: 没有可用于增量构建的上一次构建记录或 'uvm_tb/' 目录.",
+                fg=typer.colors.RED,
+            )
+            typer.echo("  > 请先运行一次完整的 'vpilot uvm build'.")
+            raise typer.Exit(code=1)
+        typer.echo(f"  > 增量构建: 在现有的 {UVM_TB_DIR}/ 上更新")
+        # 只加载快照跟踪的文件, 'make' 的产物留在磁盘上, 不进入快照
+        workspace = Workspace(UVM_TB_DIR, _tracked_tb_files(snapshots.latest()))
+        # 对话历史按任务表顺序重建: 未变化的任务复用上一次的回合
+        history_store.remove(UVM_BUILD_HISTORY)
+        build_context = _initial_build_context(spec_data, plan_data)
+        checkpoint = {"inputs": inputs, "completed": [], "finished": False}
+        start, _ = snapshots.commit(workspace.snapshot(), "build --incremental: 开始")
+        _save_checkpoint(state, checkpoint, build_context, start["id"])
+    else:
+        if UVM_TB_DIR.exists():
+            typer.secho("警告: 'uvm_tb/' 目录已存在, 将被覆盖.", fg=typer.colors.YELLOW)
+            shutil.rmtree(UVM_TB_DIR)
+        shutil.copytree(
+            SKELETON_DIR, UVM_TB_DIR, ignore=shutil.ignore_patterns("__pycache__")
+        )
+        typer.echo(f"  > 已将骨架文件复制到 {UVM_TB_DIR}/")
+        workspace = Workspace(UVM_TB_DIR, _tracked_tb_files())
+        history_store.remove(UVM_BUILD_HISTORY)
+        # 维护一个内部状态, 用来存储 LLM 在上一步生成的 *关键信息*
+        build_context = _initial_build_context(spec_data, plan_data)
+        checkpoint = {"inputs": inputs, "completed": [], "finished": False}
+        skeleton, _ = snapshots.commit(workspace.snapshot(), "build: 骨架")
+        _save_checkpoint(state, checkpoint, build_context, skeleton["id"])
 
     # --- 3. 初始化 CodeManager ---
-    code_manager = CodeManager(UVM_TB_DIR)
-    if UVM_BUILD_HISTORY.exists():
-        UVM_BUILD_HISTORY.unlink()
-    # 维护一个内部状态, 用来存储 LLM 在上一步生成的 *关键信息*
-    build_context = {
-        "module_name": spec_data.get("module_name", "UNKNOWN_MODULE"),
-        "key_signals": spec_data.get("key_signals", {}),
-        "ports": spec_data.get("ports", []),
-        "spec_description": spec_data.get("description", ""),
-        "uvm_topology": plan_data.get("uvm_topology", {}),
-        "sequence_library": plan_data.get("sequence_library", []),
-        "coverage_points": plan_data.get("coverage_points", []),
-        "generated_bfm_methods": [],
-        "generated_sequencers": [],
-    }
+    # 构建期间 uvm_tb/ 只在内存中读写, 每个波次结束时写回磁盘
+    code_manager = CodeManager(UVM_TB_DIR, workspace)
 
     # --- 4. [!!] 启动"总调度循环" [!!] ---
     # 任务 0: 发送系统提示
-    initial_prompt = f"""
-    {UVM_BUILD_SYSTEM_PROMPT}
-    --- 蓝图 1: design_spec.final.yml ---
-    {spec_text}
-    --- 蓝图 2: verif_plan.final.yml ---
-    {plan_text}
-    你现在拥有了完整的上下文.请确认你已准备好, 等待我的第一个任务.
-    """
-    execute_conversation_turn(UVM_BUILD_HISTORY, "", initial_prompt)
-
-    # ---
-    # 任务 1: Makefile (无依赖文件)
-    # ---
-    prompt = """
-    任务 1: 填充 'Makefile' 的 'COCOTB_TOPLEVEL' 块.
-    (根据 'spec.module_name')
-
-    [!!] 响应格式:
-    v-pilot:fill:Makefile:COCOTB_TOPLEVEL
-    """
-    response = _execute_task_with_context("Makefile", [], prompt)
-    _parse_and_inject(response, code_manager)
+    # 系统提示和两份蓝图构成整个会话的稳定前缀, 之后的每个回合都能命中前缀缓存
+    if "context" not in checkpoint["completed"]:
+        _send_initial_context(spec_text, plan_text, record, reuse=incremental)
+        _save_checkpoint(
+            state, checkpoint, build_context, checkpoint["snapshot"], "context"
+        )
 
-    # ---
-    # 任务 2: seq_item.py (必须在 BFM 之前)
-    # ---
-    prompt = """
-    任务 2: 填充 'seq_item.py' 中的 *所有* 4 个 LLM 块.
-    (SEQ_ITEM_FIELDS, SEQ_ITEM_RANDOMIZE, SEQ_ITEM_STR, SEQ_ITEM_EQ)
+    # 任务 1-10: 按依赖图调度, 同一波次内的任务并发执行.
+    # 合并只发生在波次之间, 因此同一波次的任务读到的是同一份历史快照;
+    # 波次结束后按任务表顺序把各回合写回历史.
+    # 任务 id -> 输出 (响应) 的哈希, 作为下游任务输入哈希的一部分
+    outputs = {task_id: entry["output"] for task_id, entry in record["tasks"].items()}
+    regenerated, reused = [], []
+    # 修正回合之后仍未通过本地校验的任务 {任务 id: 错误}
+    invalid = {}
+    # 未通过校验的任务, 以及 (直接或间接) 依赖它们的任务: 都不记为已完成
+    unfinished = set()
+
+    def run_task(task):
+        input_hash = _task_input_hash(
+            task, build_context, spec_data, plan_data, outputs
+        )
+        previous = record["tasks"].get(task["id"])
+        if incremental and previous and previous["input"] == input_hash:
+            typer.echo(f"  > 复用: {task['file']} ({task['id']} 的输入未变化)")
+            return input_hash, previous["prompt"], previous["response"], True, None
+
+        prompt = task["prompt"].format_map(build_context)
+        full_prompt, response = _execute_task_with_context(
+            task["file"],
+            task["deps"],
+            prompt,
+            history=load_conversation(UVM_BUILD_HISTORY, ""),
+            make_stream_parser=(
+                (lambda: _stream_progress(task["id"])) if stream else None
+            ),
+            token_budget=token_budget,
+            task_id=task["id"],
+            candidates=candidates,
+            workspace=workspace,
+        )
+        error = (
+            _validate_fill_response(response, task["file"], workspace)
+            if response is not None
+            else None
+        )
+        return input_hash, full_prompt, response, False, error
 
-    [!!] 关键:
-    查看 'seq_item.py' 的文件内容, 确保你的代码
-    填充在 `class MySeqItem(uvm_sequence_item):` 内部.
+    def merge_task(task, result):
+        input_hash, full_prompt, response, was_reused, error = result
+        if response is None:
+            typer.secho(
+                f"错误: 任务 '{task['id']}' 未获得 LLM 响应, 构建中止.",
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(code=1)
+        append_conversation(
+            UVM_BUILD_HISTORY,
+            [
+                {"role": "user", "content": full_prompt},
+                {"role": "assistant", "content": response},
+            ],
+        )
+        # 代码块在校验之后才注入 (流式模式也一样); 复用的回合只提取 context
+        build_context.update(
+            _parse_and_inject(response, code_manager, inject=not was_reused)
+        )
+        outputs[task["id"]] = SnapshotStore.hash_content(response)
+        # 任务按依赖顺序合并, 上游任务是否完成在这里已经确定
+        upstream = [d for d in UVM_BUILD_TASK_DEPS[task["id"]] if d in unfinished]
+        if error is not None:
+            invalid[task["id"]] = error
+            typer.secho(
+                f"  > [!!] 任务 '{task['id']}' 未通过本地校验: {error}",
+                fg=typer.colors.YELLOW,
+            )
+        elif upstream:
+            typer.secho(
+                f"  > [!!] 任务 '{task['id']}' 依赖未通过校验的任务 "
+                f"({', '.join(upstream)}), 不记为已完成",
+                fg=typer.colors.YELLOW,
+            )
+        done = error is None and not upstream
+        if done:
+            record["tasks"][task["id"]] = {
+                "input": input_hash,
+                "output": outputs[task["id"]],
+                "prompt": full_prompt,
+                "response": response,
+            }
+        else:
+            unfinished.add(task["id"])
+            # 未完成的任务不进入构建记录, 增量构建时重新生成
+            record["tasks"].pop(task["id"], None)
+        _write_build_record(record)
+        (reused if was_reused else regenerated).append(task["id"])
+        manifest, _ = snapshots.commit(workspace.snapshot(), f"build: {task['id']}")
+        _save_checkpoint(
+            state,
+            checkpoint,
+            build_context,
+            manifest["id"],
+            task["id"] if done else None,
+        )
 
-    [!!] 响应格式: (所有 4 个 'v-pilot:fill:seq_item.py:[BLOCK_ID]' 块)
-    """
-    response = _execute_task_with_context("seq_item.py", [], prompt)
-    _parse_and_inject(response, code_manager)
+    try:
+        run_waves(
+            _remaining_tasks(UVM_BUILD_TASKS, set(checkpoint["completed"])),
+            run_task,
+            merge_task,
+            max_workers=jobs,
+            after_wave=lambda wave: workspace.flush(),
+        )
+    except (Exception, KeyboardInterrupt):
+        typer.secho(
+            f"构建中断, 已完成的任务: {', '.join(checkpoint['completed'])}. "
+            "运行 'vpilot uvm build --resume' 从断点继续.",
+            fg=typer.colors.YELLOW,
+        )
+        raise
+    finally:
+        # 构建中止时也把已完成的部分写回磁盘
+        workspace.flush()
+
+    # 有任务未通过校验时检查点保持未完成, '--resume' 重新生成这些任务及其下游任务
+    checkpoint["finished"] = not unfinished
+    write_state(state)
+    if invalid:
+        typer.secho(
+            f"[!!] UVM 脚手架已生成, 但 {len(invalid)} 个任务未通过本地校验:",
+            fg=typer.colors.YELLOW,
+        )
+        for task_id, error in invalid.items():
+            typer.secho(f"  - {task_id}: {error}", fg=typer.colors.YELLOW)
+        dependents = [
+            task["id"]
+            for task in UVM_BUILD_TASKS
+            if task["id"] in unfinished and task["id"] not in invalid
+        ]
+        if dependents:
+            typer.secho(
+                f"  依赖它们的任务同样未记为完成: {', '.join(dependents)}",
+                fg=typer.colors.YELLOW,
+            )
+        typer.echo(
+            "  > 运行 'vpilot uvm build --resume' 重新生成这些任务, "
+            "或用 'vpilot uvm iterate-build' 修复."
+        )
+    else:
+        typer.secho("✅ UVM 脚手架已初步生成完毕!", fg=typer.colors.GREEN)
+    if incremental:
+        typer.echo(
+            f"  > 增量构建: 重新生成 {len(regenerated)} 个任务 "
+            f"({', '.join(regenerated) or '无'}), 复用 {len(reused)} 个"
+        )
+    typer.echo(
+        f"  > 快照 #{snapshots.latest()['id']} "
+        "(用 'vpilot uvm log' 查看, 'vpilot uvm checkout <n>' 回滚)"
+    )
+    typer.echo("-----------------------------------------------------")
+    typer.secho("下一步:", bold=True)
+    typer.echo("1. 'vpilot uvm check' (不运行仿真器, 预检导入和跨文件引用)")
+    typer.echo("2. 'cd uvm_tb' 后运行 'make' (运行冒烟测试)")
+    typer.echo("3. 如果失败, 复制 'make' 的错误日志到 'make_fail.log'")
+    typer.echo("4. 运行 'vpilot uvm iterate-build --feedback-file make_fail.log'")
+    typer.echo(
+        "   (或运行 'vpilot uvm iterate-build --auto', 自动运行 'make' 直到通过)"
+    )
 
-    # ---
-    # 任务 3: base_bfm.py (依赖 'seq_item.py')
-    # ---
-    prompt = """
-    任务 3: 填充 'base_bfm.py' 中的 *所有* 4 个 LLM 块.
-    (BFM_HANDLES, BFM_RESET_TASK, BFM_DRIVER_TASKS, BFM_MONITOR_TASKS_AND_GETTERS)
 
-    [!!] 关键:
-    你 *必须* 查看 'base_bfm.py' (正在编辑) 和 'seq_item.py' (依赖文件).
-    你的 BFM 任务 (例如 'drive_input') *必须* 能够处理
-    在 'seq_item.py' 中定义的 *所有* 字段 (例如 'item.data_in', 'item.addr').
+@app.command(
+    "iterate-build", help="提交 'make' 失败日志, 让 LLM 修复 (--auto: 自动运行 'make')"
+)
+def iterate_build(
+    feedback_file: Path = typer.Option(
+        None, "--feedback", "-f", help="包含 'make' 失败日志的 .log 文件"
+    ),
+    auto: bool = typer.Option(
+        False,
+        "--auto",
+        help="自动在 uvm_tb/ 中运行 'make', 把失败日志反馈给 LLM, 直到测试通过或预算用尽",
+    ),
+    max_iterations: int = typer.Option(
+        5, "--max-iterations", help="--auto: 最多运行几次 'make' (包括最后一次验证)"
+    ),
+    time_budget: float = typer.Option(
+        1800, "--time-budget", help="--auto: 总时间预算 (秒, 0 表示不限)"
+    ),
+    max_tokens: int = typer.Option(
+        0, "--max-tokens", help="--auto: 修复回合的 LLM token 预算 (0 表示不限)"
+    ),
+    check: bool = typer.Option(
+        True,
+        "--check/--no-check",
+        help="--auto: 运行 'make' 前先预检 (见 'uvm check'), 有问题时直接修复",
+    ),
+    fail_fast: bool = typer.Option(
+        False,
+        "--fail-fast",
+        help="--auto: 第一个记分板 FAIL 或断言失败时就终止 'make'",
+    ),
+    abort_on: list[str] = typer.Option(
+        None,
+        "--abort-on",
+        help="--auto: 额外的致命错误正则, 'make' 输出匹配时立即终止 (可重复)",
+    ),
+    stream: bool = typer.Option(
+        False, "--stream", help="流式接收 LLM 响应, 报告代码块的到达进度"
+    ),
+    token_budget: int = typer.Option(
+        HISTORY_TOKEN_BUDGET,
+        "--token-budget",
+        help="对话历史的 token 预算, 超出时压缩旧回合 (0 表示不压缩)",
+    ),
+    candidates: int = typer.Option(
+        1,
+        "--candidates",
+        help="并发请求的候选数, 采用第一个通过本地校验的候选",
+    ),
+):
+    if not UVM_BUILD_HISTORY.exists():
+        typer.secho("错误: 找不到 'uvm_build.history.json'.", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
 
-    [!!] 响应格式:
-    1. v-pilot:context:bfm_methods:[...] (您生成的方法列表)
-    2. v-pilot:fill:base_bfm.py:[BLOCK_ID] (所有 4 个块)
-    """
-    response = _execute_task_with_context("base_bfm.py", ["seq_item.py"], prompt)
-    ctx = _parse_and_inject(response, code_manager)
-    build_context.update(ctx)
+    code_manager = CodeManager(UVM_TB_DIR)
+    snapshots = SnapshotStore()
+
+    def fix(feedback_log, label):
+        return _fix_turn(
+            feedback_log,
+            code_manager,
+            snapshots,
+            label,
+            stream,
+            token_budget,
+            candidates,
+        )
 
-    # ---
-    # 任务 4: driver.py (依赖 BFM)
-    # ---
-    prompt = f"""
-    任务 4: 填充 'driver.py' 的 'DRIVER_BFM_CALL' 块.
+    if auto:
+        try:
+            patterns = make_runner.abort_patterns(fail_fast, abort_on or ())
+        except re.error as e:
+            typer.secho(f"错误: 无效的 '--abort-on' 正则: {e}", fg=typer.colors.RED)
+            raise typer.Exit(code=1)
+        _auto_iterate(fix, max_iterations, time_budget, max_tokens, check, patterns)
+        return
+
+    if feedback_file is None:
+        typer.secho(
+            "错误: 请使用 '--feedback' 提供 'make' 失败日志, 或使用 '--auto'.",
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(code=1)
 
-    [!!] v-pilot 上下文 (来自 任务 3):
-    - BFM 方法: {build_context.get('bfm_methods', '[]')}
+    typer.echo(f"正在提交 'make' 失败日志, 请求 LLM 修复...")
+    try:
+        feedback_log = _distill_log(log_distiller.iter_log_lines(feedback_file))
+    except OSError as e:
+        typer.secho(f"错误: 无法读取日志文件: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    manifest = fix(feedback_log, "iterate-build")
+    if manifest is None:
+        raise typer.Exit(code=1)
+    typer.secho("✅ 代码已自动修复! 请重新运行 'make'.", fg=typer.colors.GREEN)
+    typer.echo(f"  > 快照 #{manifest['id']} (回滚: 'vpilot uvm checkout <n>')")
 
-    [!!] 关键:
-    查看 'driver.py' 的文件内容, 你的代码将位于 'run_phase'
-    的 'while True' 循环内部.
-    你 *必须* 从上面的列表中选择 'drive'/'write' 相关的方法来调用.
 
-    [!!] 响应格式: v-pilot:fill:driver.py:DRIVER_BFM_CALL
+def _fix_turn(
+    feedback_log, code_manager, snapshots, label, stream, token_budget, candidates
+):
     """
-    response = _execute_task_with_context("driver.py", ["base_bfm.py"], prompt)
-    _parse_and_inject(response, code_manager)
+    把 'make' 失败日志提交给 LLM 并注入修复.
+    成功时返回修复后的快照清单; 未获得响应或注入失败时返回 None.
+    """
+    prompt_task_fix = f"""
+    [!!] 迭代修复任务:
 
-    # ---
-    # 任务 5: monitor.py (依赖 BFM, SeqItem)
-    # ---
-    prompt = f"""
-    任务 5: 填充 'monitor.py' 的 'MONITOR_BFM_CALL' 块.
+    'make' (冒烟测试) 失败了.这是精简后的失败日志 (只保留错误, 并标注了相关的代码块):
+    --- MAKE LOG START ---
+    {feedback_log}
+    --- MAKE LOG END ---
 
-    [!!] v-pilot 上下文 (来自 任务 2):
-    - BFM 方法: {build_context.get('bfm_methods', '[]')}
+    请仔细分析 *你之前生成的代码* (在我们的对话历史中) 和这个错误日志.
+    (注意: 'spec.yml' 和 'plan.yml' 也在历史记录的 *最开头*)
 
-    [!!] v-pilot 规则 (来自框架):
-    - 你 *必须* `create` 一个 'MySeqItem' 实例
-    - 你 *必须* `write` 到 'self.ap'
+    你需要:
+    1. 诊断问题 (e.g., "NameError: 'InputAgent' is not defined").
+    2. 找出是 *哪一个* 代码块 (e.g., 'env.py' 的 'ENV_INSTANTIATION') 导致的.
+    3. 提供 *修正后的完整代码块*.
 
-    [!!] 响应格式: v-pilot:fill:monitor.py:MONITOR_BFM_CALL
+    [!!] 响应格式:
+    请 *只* 使用 'v-pilot:fill:[filename.py]:[BLOCK_ID]' 格式来响应.
     """
-    response = _execute_task_with_context(
-        "monitor.py", ["base_bfm.py", "seq_item.py"], prompt
-    )
-    _parse_and_inject(response, code_manager)
 
-    # ---
-    # 任务 6: scoreboard.py (依赖 SeqItem)
-    # ---
-    prompt = f"""
-    任务 6: 填充 'scoreboard.py' 的 3 个 LLM 块.
-
-    [!!] v-pilot 上下文 (来自 spec):
-    - 设计描述: {build_context["spec_description"]}
+    # 先记录修复前的状态 (包括用户的手工修改; 未变化时不会新建快照)
+    _snapshot_tb(snapshots, f"{label}: 修复前")
+    response_fix = _request_turn(
+        prompt_task_fix,
+        make_stream_parser=(lambda: _stream_progress(label)) if stream else None,
+        save=True,
+        token_budget=token_budget,
+        task_id="fix",
+        validate=_validate_fill_response,
+        candidates=candidates,
+    )
+    if response_fix is None:
+        typer.secho("错误: 未获得 LLM 响应.", fg=typer.colors.RED)
+        return None
+    try:
+        _parse_and_inject(response_fix, code_manager)
+        manifest, _ = _snapshot_tb(snapshots, label)
+        return manifest
 
-    [!!] 响应格式: (所有 3 个 'v-pilot:fill:scoreboard.py:[BLOCK_ID]' 块)
-    """
-    response = _execute_task_with_context("scoreboard.py", ["seq_item.py"], prompt)
-    _parse_and_inject(response, code_manager)
+    except Exception as e:
+        typer.secho(f"错误: 自动修复失败: {e}", fg=typer.colors.RED)
+        typer.echo("LLM 原始响应:")
+        typer.echo(response_fix)
+        return None
 
-    # ---
-    # 任务 7: env.py (依赖 Agent, Scoreboard, Coverage)
-    # ---
-    prompt = f"""
-    任务 7: 填充 'env.py' 的 2 个 LLM 块.
 
-    [!!] v-pilot 上下文 (来自 plan):
-    - 拓扑: {build_context["uvm_topology"]}
+def _distill_log(lines):
+    """精简 'make' 日志 (见 log_distiller), 并报告精简的效果."""
+    text, stats = log_distiller.distill(
+        lines, UVM_TB_DIR, tail_lines=MAKE_LOG_TAIL_LINES
+    )
+    typer.echo(
+        f"  > [Log] 日志精简: {stats['lines']} 行 -> {len(text.splitlines())} 行 "
+        f"({stats['entries']} 条错误, 去重 {stats['duplicates']} 条)"
+    )
+    if stats["blocks"]:
+        typer.echo(f"  > [Log] 相关代码块: {', '.join(stats['blocks'])}")
+    return text
+
+
+def _make_feedback(result):
+    """把一次 'make' 的结果整理成提交给 LLM 的失败日志."""
+    parts = []
+    if result["timed_out"]:
+        parts.append(f"[v-pilot] 'make' 超出时间预算, 已被终止.")
+    if result["aborted"]:
+        parts.append(
+            f"[v-pilot] 'make' 在第一个致命错误处被提前终止: {result['aborted']['line']}"
+        )
+    results = result["results"]
+    if results and results["failed"]:
+        parts.append(f"[v-pilot] 失败的测试: {', '.join(results['failed'])}")
+    elif result["returncode"] == 0 and results is None:
+        parts.append(f"[v-pilot] 'make' 没有生成 {make_runner.RESULTS_FILE}.")
+    parts.append(_distill_log(result["output"].splitlines()))
+    return "\n".join(parts)
+
+
+def _format_problems(problems):
+    lines = []
+    for problem in problems:
+        block = f" [{problem['block'].split(':', 1)[1]}]" if problem["block"] else ""
+        lines.append(f"{problem['file']}:{problem['line']}{block} {problem['message']}")
+    return lines
+
+
+def _check_feedback(problems):
+    """把预检发现的问题整理成提交给 LLM 的失败日志."""
+    blocks = []
+    for problem in problems:
+        if problem["block"] and problem["block"] not in blocks:
+            blocks.append(problem["block"])
+    parts = ["[v-pilot] 预检 (导入测试平台, 未运行仿真) 发现以下问题:"]
+    if blocks:
+        parts.insert(0, f"[v-pilot] 可能需要修改的代码块: {', '.join(blocks)}")
+    parts.extend(_format_problems(problems))
+    return "\n".join(parts)
+
+
+def _tokens_used_since(start_ts):
+    """从 telemetry 中统计 start_ts 之后的 LLM token 用量."""
+    return sum(
+        (r.get("prompt_tokens") or 0) + (r.get("completion_tokens") or 0)
+        for r in telemetry.load_records()
+        if r.get("ts", 0) >= start_ts
+    )
 
-    [!!] v-pilot 规则 (来自框架):
-    - Agent 类名: 'MyAgent'
-    - Scoreboard 类名: 'Scoreboard'
-    - Coverage 类名: 'Coverage'
-    - Monitor 端口: 'ap'
-    - Scoreboard 端口: 'expected_fifo.analysis_export', 'actual_fifo.analysis_export'
-    - Coverage 端口: 'analysis_export'
 
-    [!!] 响应格式:
-    1. v-pilot:context:sequencers:[...] (您实例化的 *所有* sequencer 路径)
-    2. v-pilot:fill:env.py:ENV_INSTANTIATION
-    3. v-pilot:fill:env.py:ENV_CONNECTIONS
+def _auto_iterate(
+    fix, max_iterations, time_budget, max_tokens, check=True, patterns=None
+):
+    """
+    闭环修复: 运行 'make' -> 失败时提交日志修复 -> 再次运行 'make', 直到测试通过,
+    或者次数/时间/token 预算用尽. 每次迭代的耗时记录在 UVM_ITERATE_RECORD 中.
+    check 为 True 时, 每次运行 'make' 前先做预检 (见 'uvm check'),
+    发现问题时直接提交预检结果修复, 不运行 'make'.
+    patterns: 致命错误的模式 (见 make_runner.abort_patterns), 匹配时提前终止 'make'.
     """
-    response = _execute_task_with_context(
-        "env.py", ["agent.py", "scoreboard.py", "coverage.py"], prompt
+    start, start_ts = time.monotonic(), time.time()
+    iterations = []
+    passed, stop_reason = False, f"已用完 {max_iterations} 次迭代"
+
+    def remaining():
+        return time_budget - (time.monotonic() - start) if time_budget else None
+
+    for iteration in range(1, max_iterations + 1):
+        if remaining() is not None and remaining() <= 0:
+            stop_reason = "时间预算用尽"
+            break
+        typer.echo(f"\n--- [Auto] 第 {iteration}/{max_iterations} 次迭代 ---")
+        entry = {"iteration": iteration, "passed": False}
+        iterations.append(entry)
+
+        feedback = None
+        if check:
+            check_start = time.monotonic()
+            problems = preflight.check_testbench(UVM_TB_DIR)
+            entry["check_s"] = round(time.monotonic() - check_start, 3)
+            entry["problems"] = len(problems)
+            typer.echo(
+                f"  > [Auto] 预检: {entry['check_s']:.2f}s, {len(problems)} 个问题"
+            )
+            if problems:
+                feedback = _check_feedback(problems)
+
+        if feedback is None:
+            try:
+                result = make_runner.run_make(
+                    UVM_TB_DIR, timeout=remaining(), patterns=patterns
+                )
+            except FileNotFoundError:
+                typer.secho("错误: 找不到 'make' 命令.", fg=typer.colors.RED)
+                raise typer.Exit(code=1)
+            entry.update(
+                {
+                    "make_s": round(result["duration"], 3),
+                    "returncode": result["returncode"],
+                    "timed_out": result["timed_out"],
+                    "aborted": result["aborted"],
+                    "results": result["results"],
+                    "passed": result["passed"],
+                }
+            )
+            if result["aborted"]:
+                summary = (
+                    f"提前终止 ({result['aborted']['pattern']}: "
+                    f"{result['aborted']['line'][:80]})"
+                )
+            elif result["results"]:
+                summary = (
+                    f"{result['results']['tests'] - result['results']['failures']}/"
+                    f"{result['results']['tests']} 通过"
+                )
+            else:
+                summary = f"退出码 {result['returncode']}"
+            typer.echo(f"  > [Auto] make: {result['duration']:.1f}s, {summary}")
+            if result["passed"]:
+                passed = True
+                break
+            feedback = _make_feedback(result)
+
+        if iteration == max_iterations:
+            break
+        if remaining() is not None and remaining() <= 0:
+            stop_reason = "时间预算用尽"
+            break
+        if max_tokens and _tokens_used_since(start_ts) >= max_tokens:
+            stop_reason = "token 预算用尽"
+            break
+
+        llm_start = time.monotonic()
+        manifest = fix(feedback, f"iterate-build --auto #{iteration}")
+        entry["fix_s"] = round(time.monotonic() - llm_start, 3)
+        if manifest is None:
+            stop_reason = "修复失败"
+            break
+        entry["snapshot"] = manifest["id"]
+        typer.echo(f"  > [Auto] 修复: {entry['fix_s']:.1f}s, 快照 #{manifest['id']}")
+
+    total = time.monotonic() - start
+    record = {
+        "passed": passed,
+        "total_s": round(total, 3),
+        "tokens": _tokens_used_since(start_ts),
+        "iterations": iterations,
+    }
+    VPILOT_RUN_DIR.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(
+        UVM_ITERATE_RECORD, json.dumps(record, ensure_ascii=False, indent=2)
     )
-    ctx = _parse_and_inject(response, code_manager)
-    build_context.update(ctx)
-
-    # ---
-    # 任务 8: coverage.py (依赖 SeqItem)
-    # ---
-    prompt = f"""
-    任务 8: 填充 'coverage.py' 的 'COVERAGE_DEFINITIONS' 和 'COVERAGE_SAMPLE_CALL' 块.
 
-    [!!] v-pilot 上下文 (来自 plan):
-    - 覆盖点: {build_context["coverage_points"]}
-
-    [!!] 关键规则:
-    `@CoverPoint` 装饰器 的参数请你回顾cocotb-coverage的文档, 以及根据示例生成
-    不存在 'description' 或 'item_field' 等关键字参数.
+    typer.echo("\n--- [Auto] 迭代耗时 ---")
+    for entry in iterations:
+        steps = []
+        if "check_s" in entry:
+            steps.append(f"预检 {entry['check_s']:.2f}s ({entry['problems']} 个问题)")
+        if "make_s" in entry:
+            status = "通过" if entry["passed"] else "失败"
+            if entry.get("aborted"):
+                status = f"提前终止: {entry['aborted']['pattern']}"
+            steps.append(f"make {entry['make_s']:.1f}s ({status})")
+        if "fix_s" in entry:
+            steps.append(f"修复 {entry['fix_s']:.1f}s")
+        typer.echo(f"  #{entry['iteration']}: {', '.join(steps)}")
+    typer.echo(f"  > 记录已写入: {UVM_ITERATE_RECORD}")
+    if passed:
+        typer.secho(
+            f"✅ 测试通过! 共 {len(iterations)} 次迭代, 耗时 {total:.1f}s.",
+            fg=typer.colors.GREEN,
+        )
+        return
+    typer.secho(
+        f"错误: 测试仍未通过 ({stop_reason}), 耗时 {total:.1f}s.",
+        fg=typer.colors.RED,
+    )
+    raise typer.Exit(code=1)
 
-    [!!] 响应格式: (所有 2 个 'v-pilot:fill:coverage.py:[BLOCK_ID]' 块)
-    """
-    response = _execute_task_with_context("coverage.py", ["seq_item.py"], prompt)
-    _parse_and_inject(response, code_manager)
 
-    # ---
-    # 任务 9: sequence_lib.py (依赖 SeqItem)
-    # ---
-    prompt = f"""
-    任务 9: 填充 'sequence_lib.py' 的 'SEQUENCES' 块.
+@app.command(
+    "check", help="不运行仿真器, 预检 uvm_tb/ (导入, 未定义的名字, 跨文件引用)"
+)
+def check():
+    if not UVM_TB_DIR.is_dir():
+        typer.secho(
+            "错误: 找不到 'uvm_tb/'. 请先运行 'vpilot uvm build'.", fg=typer.colors.RED
+        )
+        raise typer.Exit(code=1)
 
-    [!!] v-pilot 上下文 (来自 plan):
-    - 序列库: {plan_data.get('sequence_library', [])}
+    start = time.monotonic()
+    problems = preflight.check_testbench(UVM_TB_DIR)
+    elapsed = time.monotonic() - start
+    if not problems:
+        typer.secho(f"✅ 预检通过 ({elapsed:.2f}s).", fg=typer.colors.GREEN)
+        return
+    for line in _format_problems(problems):
+        typer.echo(f"  > {line}")
+    typer.secho(
+        f"错误: 预检发现 {len(problems)} 个问题 ({elapsed:.2f}s).", fg=typer.colors.RED
+    )
+    typer.echo("  > 运行 'vpilot uvm iterate-build --auto' 自动修复.")
+    raise typer.Exit(code=1)
 
-    [!!] v-pilot 规则 (来自框架):
-    - 你 *必须* 继承 'MyBaseSeq'
-    - 你 *必须* 使用 'MySeqItem'
-    - 你 *禁止* 访问 'self.dut', 'self.bfm'
-    - [例外] 仅在 'plan' 明确要求 'fork/join' 时才可导入 'cocotb'
 
-    [!!] 响应格式: v-pilot:fill:sequence_lib.py:SEQUENCES
+def _tracked_tb_files(manifest=None):
     """
-    response = _execute_task_with_context("sequence_lib.py", ["seq_item.py"], prompt)
-    _parse_and_inject(response, code_manager)
-
-    # ---
-    # 任务 10: test_lib.py (依赖 BaseTest, SeqLib, Env)
-    # ---
-    prompt = f"""
-    任务 10: 填充 'test_lib.py' 的 'TESTS' 块.
-
-    [!!] v-pilot 上下文 (来自 plan):
-    - 序列库: {plan_data.get('sequence_library', [])}
+    uvm_tb/ 中跟踪的文件: 快照 manifest 中的文件 (没有快照时为骨架文件).
+    仿真产物 (sim_build/, results.xml, 日志等) 不在其中.
+    """
+    if manifest:
+        return list(manifest["files"])
+    return [
+        path.relative_to(SKELETON_DIR).as_posix()
+        for path in SKELETON_DIR.rglob("*")
+        if path.is_file() and "__pycache__" not in path.parts
+    ]
 
-    [!!] v-pilot 上下文 (来自 任务 7):
-    - Sequencers: {build_context.get('sequencers', '[]')}
 
-    [!!] v-pilot 规则 (来自框架):
-    - 你 *必须* 继承 'MyBaseTest' (来自 'base_test.py')
-    - 你 *必须* 重写 'async def main_phase(self)'
-    - 你 *必须* 使用 `seq_lib.` 命名空间
-    - 你 *必须* `start` 在一个正确的 Sequencer 路径上
-
-    [!!] 响应格式: v-pilot:fill:test_lib.py:TESTS
+def _snapshot_tb(snapshots, label):
+    """
+    从磁盘记录 uvm_tb/ 的快照. 跟踪的文件与最新快照相同 (没有快照时为骨架文件),
+    仿真产物 (sim_build/, results.xml 等) 不进入快照.
     """
-    response = _execute_task_with_context(
-        "test_lib.py",
-        ["base_test.py", "sequence_lib.py", "env.py"],
-        prompt,
+    files = _read_tb_files(_tracked_tb_files(snapshots.latest()))
+    return snapshots.commit(
+        {path: content for path, content in files.items() if content is not None},
+        label,
     )
-    _parse_and_inject(response, code_manager)
 
-    typer.secho("✅ UVM 脚手架已初步生成完毕!", fg=typer.colors.GREEN)
-    typer.echo("-----------------------------------------------------")
-    typer.secho("下一步:", bold=True)
-    typer.echo("1. 'cd uvm_tb'")
-    typer.echo("2. 'make' (运行冒烟测试)")
-    typer.echo("3. 如果失败, 复制 'make' 的错误日志到 'make_fail.log'")
-    typer.echo("4. 运行 'vpilot uvm iterate-build --feedback-file make_fail.log'")
-
-
-@app.command("iterate-build", help="提交 'make' 失败日志, 让 LLM 修复")
-def iterate_build(
-    feedback_file: Path = typer.Option(
-        ..., "--feedback", "-f", help="包含 'make' 失败日志的 .log 文件"
-    )
-):
-    typer.echo(f"正在提交 'make' 失败日志, 请求 LLM 修复...")
 
-    if not UVM_BUILD_HISTORY.exists():
-        typer.secho("错误: 找不到 'uvm_build.history.json'.", fg=typer.colors.RED)
+def _get_snapshot(snapshots, snapshot_id):
+    try:
+        return snapshots.get(snapshot_id)
+    except KeyError:
+        typer.secho(f"错误: 快照 #{snapshot_id} 不存在.", fg=typer.colors.RED)
+        typer.echo("  > 运行 'vpilot uvm log' 查看所有快照.")
         raise typer.Exit(code=1)
 
-    feedback_log = feedback_file.read_text(encoding="utf-8")
 
-    prompt_task_fix = f"""
-    [!!] 迭代修复任务:
-
-    'make' (冒烟测试) 失败了.这是完整的失败日志:
-    --- MAKE LOG START ---
-    {feedback_log}
-    --- MAKE LOG END ---
+@app.command("log", help="列出 uvm_tb/ 的所有快照")
+def log():
+    snapshots = SnapshotStore()
+    ids = snapshots.ids()
+    if not ids:
+        typer.echo("还没有快照. 请先运行 'vpilot uvm build'.")
+        return
+    previous = {}
+    for snapshot_id in ids:
+        manifest = snapshots.get(snapshot_id)
+        changed = [
+            path for path, sha in manifest["files"].items() if previous.get(path) != sha
+        ]
+        previous = manifest["files"]
+        summary = ", ".join(changed[:4]) + (" ..." if len(changed) > 4 else "")
+        typer.echo(
+            f"#{snapshot_id:<4} {manifest['time']}  {manifest['label']}  [{summary}]"
+        )
 
-    请仔细分析 *你之前生成的代码* (在我们的对话历史中) 和这个错误日志.
-    (注意: 'spec.yml' 和 'plan.yml' 也在历史记录的 *最开头*)
 
-    你需要:
-    1. 诊断问题 (e.g., "NameError: 'InputAgent' is not defined").
-    2. 找出是 *哪一个* 代码块 (e.g., 'env.py' 的 'ENV_INSTANTIATION') 导致的.
-    3. 提供 *修正后的完整代码块*.
+@app.command("checkout", help="把 uvm_tb/ 恢复到指定的快照 (只重写有变化的文件)")
+def checkout(
+    snapshot_id: int = typer.Argument(..., help="快照编号 (见 'vpilot uvm log')"),
+):
+    snapshots = SnapshotStore()
+    manifest = _get_snapshot(snapshots, snapshot_id)
+    # 先保存当前状态, 回滚本身也可以被撤销
+    _snapshot_tb(snapshots, "checkout 之前")
+    written, removed = snapshots.checkout(snapshot_id, UVM_TB_DIR)
+    if not written and not removed:
+        typer.echo(f"uvm_tb/ 已经是快照 #{snapshot_id} 的内容.")
+        return
+    current, _ = _snapshot_tb(snapshots, f"checkout #{snapshot_id}")
+    for path in written:
+        typer.echo(f"  > 恢复: {path}")
+    for path in removed:
+        typer.echo(f"  > 删除: {path}")
+    typer.secho(
+        f"✅ 已恢复到快照 #{snapshot_id} ({manifest['label']}), "
+        f"记录为快照 #{current['id']}.",
+        fg=typer.colors.GREEN,
+    )
+    typer.echo("  > 注意: 对话历史不会回滚, 之后的 iterate-build 仍能看到后来的修改.")
 
-    [!!] 响应格式:
-    请 *只* 使用 'v-pilot:fill:[filename.py]:[BLOCK_ID]' 格式来响应.
-    """
 
-    response_fix = execute_conversation_turn(UVM_BUILD_HISTORY, "", prompt_task_fix)
+@app.command("diff", help="比较两个快照 (或快照与当前 uvm_tb/) 的差异")
+def diff(
+    a: int = typer.Argument(..., help="快照编号"),
+    b: int = typer.Argument(None, help="快照编号, 省略时与当前 uvm_tb/ 比较"),
+):
+    snapshots = SnapshotStore()
+    old_files = snapshots.load_files(_get_snapshot(snapshots, a))
+    if b is None:
+        new_label = "uvm_tb"
+        files = _read_tb_files(sorted(old_files))
+        new_files = {path: c for path, c in files.items() if c is not None}
+    else:
+        new_label = f"#{b}"
+        new_files = snapshots.load_files(_get_snapshot(snapshots, b))
+
+    changed = 0
+    for path in sorted(set(old_files) | set(new_files)):
+        old, new = old_files.get(path, ""), new_files.get(path, "")
+        if old == new:
+            continue
+        changed += 1
+        blocks = _changed_blocks(old, new)
+        typer.secho(
+            f"=== {path}" + (f" (代码块: {', '.join(blocks)})" if blocks else ""),
+            bold=True,
+        )
+        for line in difflib.unified_diff(
+            old.splitlines(),
+            new.splitlines(),
+            f"#{a}/{path}",
+            f"{new_label}/{path}",
+            lineterm="",
+        ):
+            color = None
+            if line.startswith("+") and not line.startswith("+++"):
+                color = typer.colors.GREEN
+            elif line.startswith("-") and not line.startswith("---"):
+                color = typer.colors.RED
+            typer.secho(line, fg=color)
+    if not changed:
+        typer.echo(f"#{a} 与 {new_label} 没有差异.")
+
+
+def _changed_blocks(old, new):
+    """返回内容不同的代码块 ID (标记损坏时返回空列表)."""
     try:
-        code_manager = CodeManager(UVM_TB_DIR)
-        _parse_and_inject(response_fix, code_manager)
-        typer.secho("✅ 代码已自动修复! 请重新运行 'make'.", fg=typer.colors.GREEN)
-
-    except Exception as e:
-        typer.secho(f"错误: 自动修复失败: {e}", fg=typer.colors.RED)
-        typer.echo("LLM 原始响应:")
-        typer.echo(response_fix)
+        old_index, new_index = index_blocks(old), index_blocks(new)
+    except BlockMarkerError:
+        return []
+
+    def body(content, index, block_id):
+        entry = index.get(block_id)
+        return content[entry["body_start"] : entry["body_end"]] if entry else None
+
+    return [
+        block_id
+        for block_id in dict.fromkeys([*old_index, *new_index])
+        if body(old, old_index, block_id) != body(new, new_index, block_id)
+    ]
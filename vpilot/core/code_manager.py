@@ -1,41 +1,270 @@
+import io
 import re
+import ast
 import typer
+import tokenize
 import textwrap
+import threading
+import contextlib
 from pathlib import Path
 
+from vpilot.core.workspace import atomic_write_text
+
+START_MARKER = "# LLM_GENERATED_START:"
+END_MARKER = "# LLM_GENERATED_END:"
+
+# 缩进有语义, 注入时需要对齐到 START 标签缩进的文件类型
+REINDENT_SUFFIXES = (".py",)
+
+MAKE_CONDITIONALS = ("ifeq", "ifneq", "ifdef", "ifndef")
+MAKE_DIRECTIVES = (
+    "include",
+    "-include",
+    "sinclude",
+    "export",
+    "unexport",
+    "override",
+    "private",
+    "undefine",
+    "vpath",
+)
+MAKE_ASSIGNMENT = re.compile(r"^[^\s:#=]+\s*(?:::=|:=|\?=|\+=|!=|=)")
+MAKE_RULE = re.compile(r"^[^\s#=][^=]*?:")
+# shell 命令中的引号字符串, 其中的括号不参与配对检查
+MAKE_QUOTED = re.compile(r"\"(?:[^\"\\]|\\.)*\"|'[^']*'")
+
+
+class BlockMarkerError(ValueError):
+    """文件中的 LLM_GENERATED 标记重复, 嵌套或不成对."""
+
+
+def index_blocks(content):
+    """
+    单次逐行扫描, 建立 content 中所有代码块的索引:
+        {block_id: {"body_start", "body_end", "end", "indent", "line"}}
+    body_start: START 标签之后的偏移; body_end: END 标签前空白的起始偏移;
+    end: END 标签之后的偏移; indent: START 标签所在行的缩进; line: START 行号.
+
+    标记重复, 嵌套或不成对时抛出 BlockMarkerError.
+    """
+    index = {}
+    open_id = None
+    open_entry = None
+    offset = 0
+    for lineno, line in enumerate(content.splitlines(keepends=True), 1):
+        stripped = line.lstrip()
+        indent = line[: len(line) - len(stripped)]
+        marker_at = offset + len(indent)
+
+        if stripped.startswith(START_MARKER):
+            block_id = stripped[len(START_MARKER) :].strip()
+            if open_id is not None:
+                raise BlockMarkerError(
+                    f"第 {lineno} 行: '{block_id}' 嵌套在 '{open_id}' 中 "
+                    f"(第 {open_entry['line']} 行开始, 缺少 END 标记?)"
+                )
+            if block_id in index:
+                raise BlockMarkerError(
+                    f"第 {lineno} 行: 代码块 '{block_id}' 重复 "
+                    f"(第一次出现在第 {index[block_id]['line']} 行)"
+                )
+            open_id = block_id
+            open_entry = {
+                "body_start": marker_at + len(stripped.rstrip("\r\n")),
+                "indent": indent,
+                "line": lineno,
+            }
+
+        elif stripped.startswith(END_MARKER):
+            block_id = stripped[len(END_MARKER) :].strip()
+            if open_id != block_id:
+                raise BlockMarkerError(
+                    f"第 {lineno} 行: END 标记 '{block_id}' 没有对应的 START 标记"
+                    + (f" (当前打开的是 '{open_id}')" if open_id else "")
+                )
+            # END 标签前的空白 (换行 + 缩进) 属于标记, 替换时保留
+            body_end = marker_at
+            while (
+                body_end > open_entry["body_start"] and content[body_end - 1].isspace()
+            ):
+                body_end -= 1
+            open_entry["body_end"] = body_end
+            open_entry["end"] = marker_at + len(stripped.rstrip("\r\n"))
+            index[block_id] = open_entry
+            open_id = None
+
+        offset += len(line)
+
+    if open_id is not None:
+        raise BlockMarkerError(
+            f"代码块 '{open_id}' (第 {open_entry['line']} 行) 缺少 END 标记"
+        )
+    return index
+
+
+def _string_lines(code):
+    """
+    返回 code 中多行字符串 (包括 docstring) 的续行的行号 (从 0 开始),
+    即字符串开始那一行之后, 仍在字符串内部的行. 无法分词时返回空集合.
+    """
+    lines = set()
+    fstring_starts = []
+    try:
+        # 分词只需要行号, 先去掉公共缩进, 避免首行缩进不一致导致分词失败
+        readline = io.StringIO(textwrap.dedent(code)).readline
+        for token in tokenize.generate_tokens(readline):
+            if token.type == tokenize.STRING:
+                lines.update(range(token.start[0], token.end[0]))
+            # Python 3.12+ 的 f-string 拆分为 FSTRING_START ... FSTRING_END
+            elif token.type == getattr(tokenize, "FSTRING_START", None):
+                fstring_starts.append(token.start[0])
+            elif token.type == getattr(tokenize, "FSTRING_END", None):
+                lines.update(range(fstring_starts.pop(), token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        # 代码不完整或缩进混乱: 退化为不跳过任何行
+        pass
+    return lines
+
+
+def reindent(code, indent):
+    """
+    把代码块平移到 START 标签的缩进: 以第一个代码行 (跳过空行和注释行)
+    为基准整体增减缩进, 块内的相对缩进保持不变. 已经对齐时原样返回.
+    多行字符串的续行属于字符串的内容, 保持原样.
+    """
+    lines = code.split("\n")
+    first = next(
+        (line for line in lines if line.strip() and not line.lstrip().startswith("#")),
+        None,
+    )
+    if first is None:
+        return code
+    current = first[: len(first) - len(first.lstrip())]
+    if current == indent:
+        return code
+
+    string_lines = _string_lines(code)
+    result = []
+    for i, line in enumerate(lines):
+        if not line.strip() or i in string_lines:
+            result.append(line)
+        elif line.startswith(current):
+            result.append(indent + line[len(current) :])
+        else:
+            # 比基准行缩进还少的行 (LLM 缩进不一致), 对齐到块的缩进
+            result.append(indent + line.lstrip())
+    return "\n".join(result)
+
+
+def _check_makefile(content, name):
+    """
+    Makefile 的基本检查: 残留的 Markdown 标记, 括号配对, 条件/define 配对,
+    以及既不是赋值, 规则也不是指令的行 (make 会报 'missing separator').
+    """
+    conditionals = []
+    define_line = None
+    logical = ""
+    for lineno, line in enumerate(content.splitlines(), 1):
+        # 以 '\' 结尾的行与下一行合并为一个逻辑行
+        if line.endswith("\\"):
+            logical += line[:-1] + " "
+            continue
+        line, logical = logical + line, ""
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        word = stripped.split(None, 1)[0]
+
+        if define_line is not None:
+            if word == "endef":
+                define_line = None
+            continue
+        if stripped.startswith("```") or stripped.startswith("v-pilot:"):
+            return f"{name} 第 {lineno} 行: 残留的 Markdown 或响应标记"
+        code = re.sub(r"\s#.*$", "", MAKE_QUOTED.sub("", stripped))
+        if code.count("(") != code.count(")") or code.count("{") != code.count("}"):
+            return f"{name} 第 {lineno} 行: 括号不配对"
+
+        if word in MAKE_CONDITIONALS:
+            conditionals.append(lineno)
+        elif word in ("else", "endif"):
+            if not conditionals:
+                return f"{name} 第 {lineno} 行: '{word}' 没有对应的条件语句"
+            if word == "endif":
+                conditionals.pop()
+        elif word == "define":
+            define_line = lineno
+        elif not (
+            line.startswith("\t")
+            or word in MAKE_DIRECTIVES
+            or MAKE_ASSIGNMENT.match(stripped)
+            or MAKE_RULE.match(stripped)
+        ):
+            return (
+                f"{name} 第 {lineno} 行: 既不是变量赋值, 规则也不是指令 "
+                "(make 会报 'missing separator')"
+            )
+
+    if conditionals:
+        return f"{name} 第 {conditionals[-1]} 行: 条件语句缺少 'endif'"
+    if define_line is not None:
+        return f"{name} 第 {define_line} 行: 'define' 缺少 'endef'"
+    return None
+
+
+# CPython 3.11 把 AST 转换为 Python 对象时的递归深度计数保存在解释器共享的状态中,
+# 多个线程同时 ast.parse 时偶尔抛出 SystemError ("AST constructor recursion depth
+# mismatch"). uvm build 的并发任务都要解析代码, 统一通过 parse_python 串行解析.
+_ast_lock = threading.Lock()
+
+
+def parse_python(source, filename="<unknown>"):
+    """线程安全的 ast.parse (见 _ast_lock)."""
+    with _ast_lock:
+        return ast.parse(source, filename=filename)
+
+
+def check_content(relative_file, content):
+    """
+    注入前的本地检查: .py 文件完整编译 (compile, 不只是 ast.parse: 还能发现
+    函数外的 'return', 错位的 'nonlocal'/'await' 等编译期错误), Makefile 做基本的
+    语法检查, 其他文件不检查. 返回错误描述, 通过时返回 None.
+    """
+    name = Path(relative_file).name
+    if name.endswith(".py"):
+        try:
+            # 直接编译为字节码, 不构造 Python 的 AST 对象, 不需要 _ast_lock
+            compile(content, name, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            return f"{name} 第 {e.lineno} 行语法错误: {e.msg}"
+        except ValueError as e:
+            return f"{name}: {e}"
+    elif name == "Makefile" or name.endswith(".mk"):
+        return _check_makefile(content, name)
+    return None
+
 
 class CodeManager:
     """负责管理 UVM 测试平台代码中的 LLM 生成代码块."""
 
-    def __init__(self, uvm_tb_path):
+    def __init__(self, uvm_tb_path, workspace=None):
+        """
+        提供 workspace (见 vpilot.core.workspace) 时, 所有读写都在内存中进行,
+        由 workspace 的持有者负责写回磁盘.
+        """
         self.uvm_tb_path = uvm_tb_path
+        self.workspace = workspace
         if not self.uvm_tb_path.is_dir():
             typer.secho(
                 f"CodeManager Error: 找不到工作目录: {uvm_tb_path}", fg=typer.colors.RED
             )
             raise FileNotFoundError(f"指定的 uvm_tb 路径不存在: {uvm_tb_path}")
+        # 相对路径 -> (文件状态, 内容, 代码块索引); 文件变化后自动失效
+        self._index_cache = {}
 
     def _get_file_path(self, relative_file):
         return (self.uvm_tb_path / relative_file).resolve()
 
-    def _get_block_pattern(self, block_id: str) -> re.Pattern:
-        """
-        匹配 (START 标签) + (内容) + (END 标签前的空白) + (END 标签)
-        不关心缩进.
-        """
-        start_marker = f"# LLM_GENERATED_START: {re.escape(block_id)}"
-        end_marker = f"# LLM_GENERATED_END: {re.escape(block_id)}"
-
-        # (组 1: START 标签)
-        # (组 2: 内容)
-        # (组 3: END 标签前的空白)
-        # (组 4: END 标签)
-        pattern = re.compile(
-            f"({re.escape(start_marker)})(.*?)(\\s*)({re.escape(end_marker)})",
-            re.DOTALL,
-        )
-        return pattern
-
     def _sanitize_llm_code(self, raw_response):
         """清理 LLM 的原始响应.
         只清理 "传输工件", 不触碰 "代码空白"
@@ -51,72 +280,191 @@ class CodeManager:
         code = re.sub(r"^v-pilot:fill:.*?\n", "", code, flags=re.MULTILINE, count=1)
         return code
 
-    def update_block(self, relative_file, block_id, new_code):
+    def _guard(self):
+        """读-改-写期间持有 workspace 的锁 (没有 workspace 时不加锁)."""
+        return self.workspace.lock if self.workspace else contextlib.nullcontext()
+
+    def _exists(self, relative_file):
+        if self.workspace:
+            return self.workspace.exists(relative_file)
+        return self._get_file_path(relative_file).exists()
+
+    def _write(self, relative_file, content):
+        if self.workspace:
+            self.workspace.write(relative_file, content)
+        else:
+            atomic_write_text(self._get_file_path(relative_file), content)
+
+    def _load(self, relative_file):
+        """读取文件并返回 (内容, 代码块索引). 文件未变化时直接使用缓存."""
+        with self._guard():
+            if self.workspace:
+                stat = self.workspace.revision(relative_file)
+                content = self.workspace.read(relative_file)
+            else:
+                st = self._get_file_path(relative_file).stat()
+                stat = (st.st_mtime_ns, st.st_size)
+                content = None
+            cached = self._index_cache.get(relative_file)
+            if cached and cached[0] == stat:
+                return cached[1], cached[2]
+            if content is None:
+                content = self._get_file_path(relative_file).read_text(encoding="utf-8")
+            index = index_blocks(content)
+            self._index_cache[relative_file] = (stat, content, index)
+            return content, index
+
+    def index(self, relative_file):
+        """返回文件中所有代码块的索引 (见 index_blocks)."""
+        return self._load(relative_file)[1]
+
+    def splice_blocks(self, content, blocks, index=None, relative_file=None):
+        """
+        一次性把多个代码块 {block_id: LLM 代码} 拼接进 content, 返回新内容.
+        只在内存中操作, 不写文件. 找不到的 block_id 抛出 KeyError,
+        标记损坏时抛出 BlockMarkerError.
+        提供 relative_file 且为 Python 文件时, 代码缩进对齐到 START 标签的缩进.
         """
-        哑注入: 认定 LLM 返回的代码包含正确的缩进.
+        if index is None:
+            index = index_blocks(content)
+        for block_id in blocks:
+            if block_id not in index:
+                raise KeyError(block_id)
+        align = str(relative_file or "").endswith(REINDENT_SUFFIXES)
+
+        pieces = []
+        cursor = 0
+        for block_id in sorted(blocks, key=lambda b: index[b]["body_start"]):
+            entry = index[block_id]
+            # START 标签 + '\n' + 代码 + END 标签前的空白 + END 标签
+            code = self._sanitize_llm_code(blocks[block_id])
+            if align:
+                code = reindent(code, entry["indent"])
+            pieces.append(content[cursor : entry["body_start"]])
+            pieces.append("\n" + code)
+            cursor = entry["body_end"]
+        pieces.append(content[cursor:])
+        return "".join(pieces)
+
+    def splice_block(self, content, block_id, new_code, relative_file=None):
+        """
+        把 LLM 的代码拼接到 content 中 block_id 的标记之间, 返回新内容.
+        只在内存中操作, 不写文件 (用于注入前的校验). 找不到标记时返回 None.
         """
-        file_path = self._get_file_path(relative_file)
+        try:
+            return self.splice_blocks(
+                content, {block_id: new_code}, relative_file=relative_file
+            )
+        except (KeyError, BlockMarkerError):
+            return None
 
-        if not file_path.exists():
+    def update_blocks(self, relative_file, blocks):
+        """
+        批量注入: 一次读取, 一次拼接所有代码块, 一次原子写入.
+        Python 代码的缩进对齐到 START 标签; 写入前在内存中校验 (见 check_content),
+        会引入语法错误的代码块以及找不到的代码块会被跳过并报错.
+        全部成功时返回 True.
+        """
+        # 读取, 拼接, 写回之间持有锁, 并发注入同一文件时不会丢失更新
+        with self._guard():
+            applied = self._update_blocks(relative_file, blocks)
+        for block_id in applied:
             typer.secho(
-                f"CodeManager update_block Error: 文件不存在: {relative_file}",
+                f"  > [CodeManager] 已更新 '{block_id}' " f"在 {relative_file}",
+                fg=typer.colors.CYAN,
+            )
+        return len(applied) == len(blocks)
+
+    def _update_blocks(self, relative_file, blocks):
+        """update_blocks 的实现, 返回实际更新的代码块."""
+        if not self._exists(relative_file):
+            typer.secho(
+                f"CodeManager update_blocks Error: 文件不存在: {relative_file}",
                 fg=typer.colors.RED,
             )
-            return False
+            return {}
 
         try:
-            original_content = file_path.read_text(encoding="utf-8")
-            pattern = self._get_block_pattern(block_id)
-
-            match = pattern.search(original_content)
+            original_content, index = self._load(relative_file)
+        except BlockMarkerError as e:
+            typer.secho(
+                f"CodeManager Error: {relative_file} 中的代码块标记损坏: {e}",
+                fg=typer.colors.RED,
+            )
+            return {}
 
-            if not match:
+        found = {}
+        for block_id, new_code in blocks.items():
+            if block_id in index:
+                found[block_id] = new_code
+            else:
                 typer.secho(
                     f"CodeManager Error: 找不到标记 '{block_id}' "
                     f"在文件 {relative_file} 中 ",
                     fg=typer.colors.RED,
                 )
-                return False
-
-            # 清理 LLM 的代码
-            clean_code = self._sanitize_llm_code(new_code)
-
-            # 构造替换字符串
-            # 组 1: START 标签
-            # {clean_code}: LLM 的响应 (它 *应该* 自己以 '\n' + '缩进' 开始)
-            # 组 3: END 标签前的空白 (它 *应该* 包含 '\n' + '缩进')
-            # 组 4: END 标签
-            replacement = f"\\1\n{clean_code}\\3\\4"
+        if not found:
+            return {}
 
-            # 执行替换
-            new_content = pattern.sub(replacement, original_content, count=1)
-            file_path.write_text(new_content, encoding="utf-8")
-
-            typer.secho(
-                f"  > [CodeManager] 已更新 '{block_id}' " f"在 {relative_file}",
-                fg=typer.colors.CYAN,
+        try:
+            new_content = self.splice_blocks(
+                original_content, found, index, relative_file
             )
-            return True
-
+            # 注入前校验: 只拒绝 *引入* 错误的注入 (原文件已有错误时照常注入,
+            # 例如 iterate-build 只修复了其中一部分代码块)
+            if check_content(relative_file, new_content) and not check_content(
+                relative_file, original_content
+            ):
+                found, new_content = self._accept_valid(
+                    relative_file, original_content, index, found
+                )
+                if not found:
+                    return {}
+            self._write(relative_file, new_content)
         except Exception as e:
             typer.secho(
-                f"CodeManager Error: 更新文件 {file_path} 失败: {e}",
+                f"CodeManager Error: 更新文件 {relative_file} 失败: {e}",
                 fg=typer.colors.RED,
             )
-            return False
+            return {}
+        return found
 
-    def read_block(self, relative_file, block_id):
-        file_path = self._get_file_path(relative_file)
+    def _accept_valid(self, relative_file, original_content, index, blocks):
+        """
+        整体校验失败时逐个尝试代码块, 只保留不会破坏文件的代码块.
+        返回 (接受的代码块, 新内容).
+        """
+        accepted = {}
+        new_content = original_content
+        for block_id, new_code in blocks.items():
+            trial = {**accepted, block_id: new_code}
+            content = self.splice_blocks(original_content, trial, index, relative_file)
+            error = check_content(relative_file, content)
+            if error:
+                typer.secho(
+                    f"CodeManager Error: '{block_id}' 未通过注入前校验, "
+                    f"已跳过: {error}",
+                    fg=typer.colors.RED,
+                )
+            else:
+                accepted, new_content = trial, content
+        return accepted, new_content
 
-        if not file_path.exists():
+    def update_block(self, relative_file, block_id, new_code):
+        """
+        注入单个代码块 (见 update_blocks).
+        """
+        return self.update_blocks(relative_file, {block_id: new_code})
+
+    def read_block(self, relative_file, block_id):
+        if not self._exists(relative_file):
             return None
 
         try:
-            content = file_path.read_text(encoding="utf-8")
-            pattern = self._get_block_pattern(block_id)
-            match = pattern.search(content)
-            if match:
-                return match.group(2).strip()
+            content, index = self._load(relative_file)
+            entry = index.get(block_id)
+            if entry:
+                return content[entry["body_start"] : entry["body_end"]].strip()
             else:
                 typer.secho(
                     f"CodeManager Error: 找不到标记 '{block_id}' "
@@ -127,7 +475,7 @@ class CodeManager:
 
         except Exception as e:
             typer.secho(
-                f"CodeManager Error: 读取文件 {file_path} 失败: {e}",
+                f"CodeManager Error: 读取文件 {relative_file} 失败: {e}",
                 fg=typer.colors.RED,
             )
             return None
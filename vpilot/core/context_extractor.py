@@ -0,0 +1,154 @@
+import ast
+import re
+
+from vpilot.core.code_manager import BlockMarkerError, index_blocks, parse_python
+from vpilot.core.history_compactor import estimate_tokens
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+ELLIPSIS = "..."
+# 实例化和连接子组件的方法: 完整保留, 下游任务需要照着其中的组件路径连线
+WIRING_METHODS = ("build_phase", "connect_phase")
+
+
+def referenced_symbols(*texts):
+    """texts 中出现的所有标识符 (包括注释和示例代码中的)."""
+    symbols = set()
+    for text in texts:
+        symbols.update(IDENTIFIER.findall(text))
+    return symbols
+
+
+def block_texts(content):
+    """返回 content 中所有 LLM 代码块的内容 (包括骨架中的示例注释)."""
+    try:
+        index = index_blocks(content)
+    except BlockMarkerError:
+        return []
+    return [content[e["body_start"] : e["body_end"]] for e in index.values()]
+
+
+def _is_filled(body):
+    """代码块中有非注释的代码 (而不只是骨架的说明和示例)."""
+    return any(
+        line.strip() and not line.strip().startswith("#") for line in body.splitlines()
+    )
+
+
+def _line_of(content, offset):
+    return content.count("\n", 0, offset) + 1
+
+
+class _Selector:
+    """按 AST 选出需要保留的行 (行号从 1 开始)."""
+
+    def __init__(self, lines, symbols):
+        self.lines = lines
+        self.symbols = symbols
+        self.keep = set()
+
+    def keep_range(self, start, end):
+        self.keep.update(range(start, end + 1))
+
+    def keep_header(self, node):
+        """保留装饰器和定义头部 (可能跨多行), 跳过其中的注释行."""
+        start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+        for lineno in range(start, node.body[0].lineno):
+            if not self.lines[lineno - 1].strip().startswith("#"):
+                self.keep.add(lineno)
+        self.keep.add(node.lineno)
+
+    def keep_attribute_assignments(self, function):
+        """保留方法中的 'self.<属性> = <调用>' (组件, BFM 等的实例化)."""
+        for node in ast.walk(function):
+            if (
+                isinstance(node, (ast.Assign, ast.AnnAssign))
+                and isinstance(node.value, ast.Call)
+                and any(
+                    isinstance(target, ast.Attribute)
+                    and isinstance(target.value, ast.Name)
+                    and target.value.id == "self"
+                    for target in (
+                        node.targets if isinstance(node, ast.Assign) else [node.target]
+                    )
+                )
+            ):
+                self.keep_range(node.lineno, node.end_lineno)
+
+    def visit_body(self, body, in_class):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if node.name in self.symbols or node.name in WIRING_METHODS:
+                    start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+                    self.keep_range(start, node.end_lineno)
+                else:
+                    self.keep_header(node)
+                    self.keep_attribute_assignments(node)
+            elif isinstance(node, ast.ClassDef):
+                self.keep_header(node)
+                self.visit_body(node.body, in_class=True)
+            elif isinstance(
+                node, (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign)
+            ):
+                self.keep_range(node.lineno, node.end_lineno)
+            elif not in_class and isinstance(node, (ast.If, ast.Try)):
+                # 模块级的条件导入等, 原样保留
+                self.keep_range(node.lineno, node.end_lineno)
+
+
+def extract(content, relative_file, symbols=frozenset()):
+    """
+    返回 relative_file 的精简视图, 作为依赖文件的上下文发送给 LLM:
+      - import 语句, 模块级和类级的赋值;
+      - 类定义头部和方法签名, 省略的实现以 '...' 代替; 其中的
+        'self.<属性> = <调用>' 保留, build_phase/connect_phase 完整保留;
+      - 已填充的 LLM 代码块 (连同标记) 完整保留, 未填充的 (只有示例注释) 省略;
+      - symbols 中引用到的函数/方法保留完整实现.
+    非 Python 文件或无法解析时返回原文.
+    """
+    if not str(relative_file).endswith(".py"):
+        return content
+    try:
+        tree = parse_python(content)
+        index = index_blocks(content)
+    except (SyntaxError, ValueError):
+        return content
+
+    lines = content.splitlines()
+    selector = _Selector(lines, symbols)
+    selector.visit_body(tree.body, in_class=False)
+    for entry in index.values():
+        if _is_filled(content[entry["body_start"] : entry["body_end"]]):
+            selector.keep_range(entry["line"], _line_of(content, entry["end"]))
+
+    result = []
+    elided = False
+    for lineno, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if lineno in selector.keep:
+            result.append(line)
+            elided = False
+        elif not stripped:
+            if result and result[-1].strip():
+                result.append("")
+        elif not stripped.startswith("#") and not elided:
+            # 连续省略的代码合并为一个 '...', 缩进与第一行省略的代码一致
+            result.append(line[: len(line) - len(line.lstrip())] + ELLIPSIS)
+            elided = True
+    return "\n".join(result).strip("\n") + "\n"
+
+
+def extract_files(files, symbols):
+    """
+    对多个依赖文件 {文件: 内容} 生成精简视图.
+    返回 ({文件: 精简内容}, 原始 token 数, 精简后 token 数).
+    """
+    extracted = {}
+    before = after = 0
+    for relative_file, content in files.items():
+        if content is None:
+            extracted[relative_file] = None
+            continue
+        extracted[relative_file] = extract(content, relative_file, symbols)
+        before += estimate_tokens(content)
+        after += estimate_tokens(extracted[relative_file])
+    return extracted, before, after
@@ -0,0 +1,52 @@
+BLOCK_MARKER = "v-pilot:"
+
+
+class FillStreamParser:
+    """
+    'v-pilot:' 响应的增量解析器.
+
+    以流式方式接收 LLM 的输出片段 (feed), 每当出现下一个 'v-pilot:' 标记时,
+    前一个块即视为完整, 立刻交给 on_block 回调处理 (例如注入到骨架文件).
+    回调收到的文本与 response.split("v-pilot:") 的元素一致.
+    """
+
+    def __init__(self, on_block):
+        self.on_block = on_block
+        self._buffer = ""
+        # 当前块在 _buffer 中的起点 (None 表示还没遇到第一个标记)
+        self._block_start = None
+        # 已扫描过的位置, 避免对同一段文本重复查找
+        self._scanned = 0
+        self.blocks_emitted = 0
+
+    def feed(self, text):
+        self._buffer += text
+        # 回退 len(标记)-1 个字符, 以识别被拆分在两个片段之间的标记
+        search_from = max(0, self._scanned - len(BLOCK_MARKER) + 1)
+        while True:
+            pos = self._buffer.find(BLOCK_MARKER, search_from)
+            if pos < 0:
+                break
+            if self._block_start is not None:
+                self._emit(self._buffer[self._block_start : pos])
+            self._block_start = pos + len(BLOCK_MARKER)
+            search_from = self._block_start
+
+        # 丢弃已经处理完的前缀, 只保留当前未完成的块
+        if self._block_start is not None:
+            self._buffer = self._buffer[self._block_start :]
+            self._block_start = 0
+        self._scanned = len(self._buffer)
+
+    def close(self):
+        """流正常结束: 最后一个块也已完整, 将其交出."""
+        if self._block_start is not None:
+            self._emit(self._buffer[self._block_start :])
+        self._buffer = ""
+        self._block_start = None
+        self._scanned = 0
+
+    def _emit(self, block):
+        if block.strip():
+            self.blocks_emitted += 1
+            self.on_block(block)
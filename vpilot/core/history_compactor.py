@@ -0,0 +1,151 @@
+import re
+
+# 对话历史中的文件快照 (与 uvm._execute_task_with_context 生成的格式一致)
+DUMP_PATTERNS = [
+    re.compile(
+        r"\[!!\] 依赖文件: (?P<file>\S+)[ \t]*\n\s*--- \(内容开始\) ---\n"
+        r".*?--- \(内容结束\) ---",
+        re.DOTALL,
+    ),
+    re.compile(
+        r"\[!!\] 核心上下文: 正在编辑的文件[ \t]*\n\s*--- (?P<file>\S+) ---\n"
+        r".*?--- \(文件结束\) ---",
+        re.DOTALL,
+    ),
+]
+
+FILL_SECTION = re.compile(
+    r"v-pilot:fill:(?P<file>[^:\s]+):(?P<block>[^\s]+)[ \t]*\n(?P<body>.*?)"
+    r"(?=v-pilot:|\Z)",
+    re.DOTALL,
+)
+
+_CJK = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """
+    粗略估计 token 数: 中日韩字符按 1 个 token, 其余按 4 个字符 1 个 token.
+    只用于预算判断和统计, 不追求精确.
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def _elide_superseded_fills(messages, start):
+    """同一个 (文件, 块) 只保留最新一次填充, 旧版本替换为一行说明."""
+    seen = set()
+    for i in range(len(messages) - 1, start - 1, -1):
+        msg = messages[i]
+        if msg["role"] != "assistant":
+            continue
+
+        def replace(match):
+            key = (match.group("file"), match.group("block"))
+            if key not in seen:
+                seen.add(key)
+                return match.group(0)
+            return (
+                f"v-pilot:fill:{key[0]}:{key[1]}\n"
+                f"[v-pilot: 旧版本已被后续回合取代, 省略 "
+                f"~{estimate_tokens(match.group('body'))} tokens]\n"
+            )
+
+        # 倒序处理同一条消息内的块, 保证 "最新" 的判断与顺序一致
+        sections = list(FILL_SECTION.finditer(msg["content"]))
+        content = msg["content"]
+        for match in reversed(sections):
+            content = content[: match.start()] + replace(match) + content[match.end() :]
+        messages[i] = {**msg, "content": content}
+
+
+def _elide_file_dumps(messages, start, end):
+    """把旧回合中的文件快照替换为一行说明 (每个块的最新版本仍保留在 assistant 回合中)."""
+    for i in range(start, end):
+        msg = messages[i]
+        if msg["role"] != "user":
+            continue
+        content = msg["content"]
+        for pattern in DUMP_PATTERNS:
+            content = pattern.sub(
+                lambda m: (
+                    f"[v-pilot: 已省略 {m.group('file')} 的旧快照 "
+                    f"(~{estimate_tokens(m.group(0))} tokens), 以最新版本为准]"
+                ),
+                content,
+            )
+        messages[i] = {**msg, "content": content}
+
+
+def _summarize(msg):
+    """把一条消息压缩成一行摘要."""
+    if msg["role"] == "assistant":
+        blocks = [
+            f"{m.group('file')}:{m.group('block')}"
+            for m in FILL_SECTION.finditer(msg["content"])
+        ]
+        detail = f"填充了 {', '.join(blocks)}" if blocks else "无代码块"
+    else:
+        lines = [line.strip() for line in msg["content"].splitlines() if line.strip()]
+        # 任务指令位于文件快照之后, 优先用 "任务 N: ..." 这一行作为摘要
+        titles = [line for line in lines if line.startswith("任务")]
+        detail = (titles or lines or [""])[0][:120]
+    return {
+        "role": msg["role"],
+        "content": f"[v-pilot: 已省略较早的回合 ({detail})]",
+    }
+
+
+def stable_prefix_length(messages):
+    """
+    会话稳定前缀的消息数: 开头的系统提示, 以及紧随其后的第一组 user/assistant 回合
+    (uvm build 中为 spec/plan 蓝图及其确认). 这部分在整个会话中字节级不变,
+    是 API 前缀缓存命中的部分.
+    """
+    n = 0
+    while n < len(messages) and messages[n]["role"] == "system":
+        n += 1
+    if [m["role"] for m in messages[n : n + 2]] == ["user", "assistant"]:
+        n += 2
+    return n
+
+
+def compact_messages(messages, token_budget, preamble=None):
+    """
+    在 token 预算内压缩对话历史 (只影响发送给 API 的视图, 不修改历史文件).
+
+    总量未超过预算时原样返回. 超出时只压缩稳定前缀之后的部分, 依次:
+    1. 被后续回合取代的 'v-pilot:fill' 块替换为说明;
+    2. 旧回合中的文件快照替换为说明;
+    3. 从最早的回合开始, 把整条消息替换为一行摘要, 直到满足预算.
+    前 'preamble' 条消息 (默认为 stable_prefix_length, 即系统提示和 spec/plan 蓝图)
+    和最后一条消息 (当前回合) 始终原样保留, 压缩后前缀缓存仍然能命中.
+
+    返回 (压缩后的消息列表, 统计信息 dict).
+    """
+    if preamble is None:
+        preamble = stable_prefix_length(messages)
+    before = count_tokens(messages)
+    stats = {"tokens_before": before, "tokens_after": before, "tokens_saved": 0}
+    if not token_budget or before <= token_budget or len(messages) <= preamble + 1:
+        return messages, stats
+
+    compacted = [dict(m) for m in messages]
+    last = len(compacted) - 1
+
+    _elide_superseded_fills(compacted, preamble)
+    if count_tokens(compacted) > token_budget:
+        _elide_file_dumps(compacted, preamble, last)
+
+    i = preamble
+    while count_tokens(compacted) > token_budget and i < last:
+        compacted[i] = _summarize(compacted[i])
+        i += 1
+
+    after = count_tokens(compacted)
+    stats.update(tokens_after=after, tokens_saved=before - after)
+    return compacted, stats
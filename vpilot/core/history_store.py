@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+
+# 日志中累计多少条消息后, 合并回快照文件
+COMPACT_EVERY = int(os.getenv("VPILOT_HISTORY_COMPACT_EVERY", "20"))
+
+# 进程内缓存: 历史文件路径 -> 已解析的消息及对应的文件状态
+_cache = {}
+_lock = threading.RLock()
+
+
+def journal_path(history_file):
+    """历史文件的追加日志: <history_file>.journal (JSONL)."""
+    return history_file.with_name(history_file.name + ".journal")
+
+
+def _snapshot_stat(history_file):
+    st = history_file.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_journal(journal, offset, base_len, messages):
+    """
+    从 offset 开始读取日志, 把索引 >= base_len 的消息追加到 messages.
+    返回新的 offset (只推进到最后一个完整的行, 写了一半的行会被忽略).
+    """
+    if not journal.exists():
+        return offset
+    with open(journal, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    for raw in data.splitlines(keepends=True):
+        if not raw.endswith(b"\n"):
+            break
+        offset += len(raw)
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            continue
+        # 跳过已经合并进快照的条目 (合并后, 删除日志之前中断的情况)
+        if entry["i"] >= base_len and entry["i"] == len(messages):
+            messages.append(entry["message"])
+    return offset
+
+
+def load(history_file):
+    """
+    加载对话历史 (快照 + 日志). 不存在时返回 None.
+    同一进程内的连续调用只解析新增的日志行.
+    """
+    with _lock:
+        key = str(history_file.resolve())
+        if not history_file.exists():
+            _cache.pop(key, None)
+            return None
+
+        stat = _snapshot_stat(history_file)
+        cached = _cache.get(key)
+        if cached is None or cached["stat"] != stat:
+            with open(history_file, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+            cached = {
+                "stat": stat,
+                "base_len": len(messages),
+                "messages": messages,
+                "offset": 0,
+            }
+            _cache[key] = cached
+
+        cached["offset"] = _read_journal(
+            journal_path(history_file),
+            cached["offset"],
+            cached["base_len"],
+            cached["messages"],
+        )
+        return list(cached["messages"])
+
+
+def write(history_file, messages):
+    """原子地写入完整历史快照 (临时文件 + rename), 并清空日志."""
+    with _lock:
+        tmp_path = history_file.with_name(history_file.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(messages, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, history_file)
+        journal_path(history_file).unlink(missing_ok=True)
+
+        _cache[str(history_file.resolve())] = {
+            "stat": _snapshot_stat(history_file),
+            "base_len": len(messages),
+            "messages": list(messages),
+            "offset": 0,
+        }
+
+
+def append(history_file, new_messages):
+    """
+    追加消息. 历史不存在时直接写入快照; 否则只向日志追加 JSONL 行,
+    每轮的 I/O 与历史长度无关. 日志累计到 COMPACT_EVERY 条时合并回快照.
+    """
+    with _lock:
+        messages = load(history_file)
+        if messages is None:
+            write(history_file, list(new_messages))
+            return
+
+        cached = _cache[str(history_file.resolve())]
+        journal = journal_path(history_file)
+        # 截掉上次中断时写了一半的行, 否则新行会与它拼接在一起
+        if journal.exists() and journal.stat().st_size > cached["offset"]:
+            os.truncate(journal, cached["offset"])
+
+        lines = "".join(
+            json.dumps({"i": len(messages) + n, "message": m}, ensure_ascii=False)
+            + "\n"
+            for n, m in enumerate(new_messages)
+        )
+        with open(journal, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if len(cached["messages"]) + len(new_messages) - cached["base_len"] >= (
+            COMPACT_EVERY
+        ):
+            compact(history_file)
+        else:
+            # 刷新缓存 (只解析刚追加的行)
+            load(history_file)
+
+
+def compact(history_file):
+    """把日志合并回快照文件. 归档 (移动) 历史文件之前必须调用."""
+    with _lock:
+        messages = load(history_file)
+        if messages is None:
+            return
+        if journal_path(history_file).exists():
+            write(history_file, messages)
+
+
+def remove(history_file):
+    """删除历史快照和日志."""
+    with _lock:
+        _cache.pop(str(history_file.resolve()), None)
+        history_file.unlink(missing_ok=True)
+        journal_path(history_file).unlink(missing_ok=True)
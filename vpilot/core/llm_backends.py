@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import threading
+import importlib.util
+from types import SimpleNamespace
+from pathlib import Path
+from urllib.parse import urlparse
+
+from vpilot.core import telemetry
+from vpilot.core.llm_cache import LLMCache
+
+# 单次请求超时 (秒)
+LLM_TIMEOUT = float(os.getenv("VPILOT_LLM_TIMEOUT", "300"))
+# 流式响应: 两个片段之间的最大间隔 (秒), 超过即视为卡死并中断
+STREAM_STALL_TIMEOUT = float(os.getenv("VPILOT_STREAM_STALL_TIMEOUT", "60"))
+# 建立连接 (TCP + TLS) 的超时 (秒)
+CONNECT_TIMEOUT = float(os.getenv("VPILOT_CONNECT_TIMEOUT", "10"))
+# 连接池: 最大连接数, 空闲连接保活时间 (秒)
+HTTP_POOL_SIZE = int(os.getenv("VPILOT_HTTP_POOL_SIZE", "10"))
+HTTP_KEEPALIVE = float(os.getenv("VPILOT_HTTP_KEEPALIVE", "120"))
+# HTTP/2: auto (安装了 h2 时启用) | 1 | 0
+HTTP2 = os.getenv("VPILOT_HTTP2", "auto").lower()
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+# 本机的服务 (例如 replay_server) 不校验密钥, 没有配置密钥时使用这个占位值
+LOCAL_API_KEY = "vpilot-local"
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+DEFAULT_FIXTURE_DIR = Path("./vpilot_fixtures")
+
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    加载 .env (API 密钥, 模型名等, 不覆盖已有的环境变量). 只在第一次调用时读取文件,
+    在创建后端或解析模型名之前调用, 导入 vpilot 的模块时不读取 .env.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+class FixtureMissingError(RuntimeError):
+    """回放模式下找不到与请求匹配的录制文件."""
+
+
+def fixture_path(fixture_dir, model, messages):
+    return Path(fixture_dir) / f"{LLMCache.make_key(model, messages)}.json"
+
+
+def load_fixture(fixture_dir, model, messages):
+    path = fixture_path(fixture_dir, model, messages)
+    if not path.exists():
+        raise FixtureMissingError(f"找不到录制文件: {path} (model={model})")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def usage_from_fixture(fixture):
+    """把录制的 token 统计还原成与 API usage 对象相同的属性."""
+    usage = fixture.get("usage") or {}
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        prompt_cache_hit_tokens=usage.get("cached_tokens", 0),
+    )
+
+
+class OpenAIBackend:
+    """
+    真实的 OpenAI 兼容 API (默认 DeepSeek, 可用 VPILOT_BASE_URL 指向其他服务).
+
+    进程内所有请求 (包括并发任务) 共用同一个 httpx 连接池, 连接保持 keep-alive,
+    只在第一次请求时支付 TCP/TLS 建连的开销.
+    指向本机的服务 (例如回放服务 replay_server) 时不要求配置 API 密钥.
+    """
+
+    def __init__(self, base_url=None):
+        import httpx
+        from openai import OpenAI
+
+        if HTTP2 == "auto":
+            http2 = importlib.util.find_spec("h2") is not None
+        else:
+            http2 = HTTP2 not in ("0", "false", "no")
+
+        # 每个线程最近一次请求的连接信息 (由 httpx 事件钩子写入)
+        self._local = threading.local()
+        self.http_client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=CONNECT_TIMEOUT),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response],
+            },
+        )
+        self._stream_timeout = httpx.Timeout(
+            STREAM_STALL_TIMEOUT, connect=CONNECT_TIMEOUT
+        )
+        base_url = base_url or os.getenv("VPILOT_BASE_URL") or DEFAULT_BASE_URL
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key and urlparse(base_url).hostname in LOCAL_HOSTS:
+            api_key = LOCAL_API_KEY
+        # 重试由 llm_handler 控制 (带 telemetry 记录), 关闭 SDK 内置的重试
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=self.http_client,
+        )
+
+    def _on_request(self, request):
+        info = {"conn_reused": True, "http_version": None}
+        self._local.info = info
+
+        def trace(event, args):
+            # 只有新建的连接才会经历 connect_tcp, 复用的连接直接发送请求
+            if event == "connection.connect_tcp.started":
+                info["conn_reused"] = False
+
+        request.extensions["trace"] = trace
+
+    def _on_response(self, response):
+        info = getattr(self._local, "info", None)
+        if info is not None:
+            info["http_version"] = response.http_version
+
+    def connection_info(self):
+        """当前线程最近一次请求的连接信息: conn_reused, http_version."""
+        return dict(getattr(self._local, "info", None) or {})
+
+    def complete(self, model, messages, timeout=None):
+        """
+        返回 (文本, usage, ttfb). 非流式模式下 ttfb 为 None.
+        timeout: 本次请求的超时 (秒), 默认 LLM_TIMEOUT.
+        """
+        extra = {}
+        if timeout is not None:
+            import httpx
+
+            extra["timeout"] = httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, **extra
+        )
+        return response.choices[0].message.content.strip(), response.usage, None
+
+    def stream(self, model, messages, on_delta, timeout=None):
+        """
+        以流式方式调用 API, 每收到一个文本片段就交给 on_delta.
+        片段间隔超过 STREAM_STALL_TIMEOUT (读超时), 总耗时超过 timeout,
+        或响应被截断时抛出异常.
+
+        返回 (文本, usage, 首个片段到达的耗时).
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=self._stream_timeout,
+        )
+        parts = []
+        finish_reason = None
+        usage = None
+        ttfb = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if ttfb is None:
+                        ttfb = time.monotonic() - start
+                    parts.append(delta)
+                    on_delta(delta)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"流式响应超过 {timeout}s 的时间预算")
+        finally:
+            stream.close()
+
+        if finish_reason != "stop":
+            raise RuntimeError(
+                f"流式响应未正常结束 (finish_reason={finish_reason}), 已接收 "
+                f"{sum(len(p) for p in parts)} 字符"
+            )
+        return "".join(parts), usage, ttfb
+
+
+class RecordingBackend:
+    """包装另一个后端, 把每一次成功的请求/响应录制到 fixture 目录."""
+
+    def __init__(self, inner, fixture_dir):
+        self.inner = inner
+        self.fixture_dir = Path(fixture_dir)
+
+    def _record(self, model, messages, content, usage):
+        path = fixture_path(self.fixture_dir, model, messages)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fixture = {
+            "model": model,
+            "messages": messages,
+            "content": content,
+            "usage": telemetry.extract_usage(usage),
+        }
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps(fixture, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        os.replace(tmp_path, path)
+
+    def connection_info(self):
+        return self.inner.connection_info()
+
+    def complete(self, model, messages, timeout=None):
+        content, usage, ttfb = self.inner.complete(model, messages, timeout)
+        self._record(model, messages, content, usage)
+        return content, usage, ttfb
+
+    def stream(self, model, messages, on_delta, timeout=None):
+        content, usage, ttfb = self.inner.stream(model, messages, on_delta, timeout)
+        self._record(model, messages, content, usage)
+        return content, usage, ttfb
+
+
+class ReplayBackend:
+    """
+    从 fixture 目录回放录制的响应, 不访问网络.
+    latency: 每次调用注入的总延迟 (秒); ttfb: 其中首个片段之前的延迟.
+    """
+
+    def __init__(self, fixture_dir, latency=0.0, ttfb=0.0, chunk_size=64):
+        self.fixture_dir = Path(fixture_dir)
+        self.latency = latency
+        self.ttfb = min(ttfb, latency)
+        self.chunk_size = chunk_size
+
+    def connection_info(self):
+        return {}
+
+    def _check_budget(self, timeout):
+        # 模拟超时: 注入的延迟超出调用方的时间预算
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"回放延迟 {self.latency}s 超过 {timeout}s 的时间预算")
+
+    def complete(self, model, messages, timeout=None):
+        fixture = load_fixture(self.fixture_dir, model, messages)
+        self._check_budget(timeout)
+        time.sleep(self.latency)
+        return fixture["content"], usage_from_fixture(fixture), None
+
+    def stream(self, model, messages, on_delta, timeout=None):
+        fixture = load_fixture(self.fixture_dir, model, messages)
+        self._check_budget(timeout)
+        content = fixture["content"]
+        chunks = [
+            content[i : i + self.chunk_size]
+            for i in range(0, len(content), self.chunk_size)
+        ] or [""]
+
+        time.sleep(self.ttfb)
+        per_chunk = (self.latency - self.ttfb) / len(chunks)
+        for chunk in chunks:
+            on_delta(chunk)
+            time.sleep(per_chunk)
+        return content, usage_from_fixture(fixture), self.ttfb
+
+
+def create_backend():
+    """
+    根据环境变量创建后端:
+        VPILOT_LLM_BACKEND = openai (默认) | record | replay
+        VPILOT_FIXTURE_DIR = 录制/回放目录 (默认 ./vpilot_fixtures)
+        VPILOT_REPLAY_LATENCY / VPILOT_REPLAY_TTFB = 回放时注入的延迟 (秒)
+    """
+    load_env()
+    kind = os.getenv("VPILOT_LLM_BACKEND", "openai").lower()
+    fixture_dir = Path(os.getenv("VPILOT_FIXTURE_DIR") or DEFAULT_FIXTURE_DIR)
+
+    if kind == "openai":
+        return OpenAIBackend()
+    if kind == "record":
+        return RecordingBackend(OpenAIBackend(), fixture_dir)
+    if kind == "replay":
+        return ReplayBackend(
+            fixture_dir,
+            latency=float(os.getenv("VPILOT_REPLAY_LATENCY", "0")),
+            ttfb=float(os.getenv("VPILOT_REPLAY_TTFB", "0")),
+        )
+    raise ValueError(f"未知的 VPILOT_LLM_BACKEND: {kind}")
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+# 默认缓存位置和淘汰策略 (可通过环境变量覆盖)
+DEFAULT_CACHE_DIR = Path("./vpilot_run/llm_cache")
+DEFAULT_MAX_BYTES = int(float(os.getenv("VPILOT_CACHE_MAX_MB", "200")) * 1024 * 1024)
+DEFAULT_MAX_AGE = float(os.getenv("VPILOT_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+# 两次淘汰扫描之间最多写入 max_bytes 的这个比例 (缓存最多超出上限这么多)
+EVICT_FRACTION = 0.05
+
+
+class LLMCache:
+    """
+    LLM 响应的持久化内容寻址缓存.
+
+    键: (model, messages, 其他请求参数) 的 SHA-256.
+    值: 一个小 JSON 文件, 存放在 <cache_dir>/<key[:2]>/<key>.json.
+    过期: 条目的年龄按写入时记录的 'created' 计算 (命中不会延长寿命).
+    淘汰: 总大小超过 max_bytes 时, 按 mtime (命中时会刷新) 从旧到新删除, 即 LRU.
+          扫描整个目录的开销较大, 只在首次写入和累计写入一定字节数后进行.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_age=None):
+        self.cache_dir = Path(
+            cache_dir or os.getenv("VPILOT_CACHE_DIR") or DEFAULT_CACHE_DIR
+        )
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = DEFAULT_MAX_AGE if max_age is None else max_age
+        self._lock = threading.Lock()
+        # 上次淘汰扫描之后写入的字节数; None 表示本进程还没有扫描过
+        self._written = None
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """返回缓存条目 (dict), 未命中或已过期时返回 None."""
+        path = self._entry_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # 损坏的条目直接丢弃
+            path.unlink(missing_ok=True)
+            return None
+
+        created = entry.get("created") if isinstance(entry, dict) else None
+        if not isinstance(created, (int, float)):
+            path.unlink(missing_ok=True)
+            return None
+        if time.time() - created > self.max_age:
+            path.unlink(missing_ok=True)
+            return None
+
+        # 刷新 mtime, 作为 LRU 的访问时间
+        os.utime(path, None)
+        return entry
+
+    def put(self, key, entry):
+        """写入条目 (未提供 'created' 时记为现在). 先写临时文件再原子替换."""
+        entry = {"created": time.time(), **entry}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 每次写入使用唯一的临时文件, 同一进程的多个线程也不会互相覆盖
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=f"{key}.", suffix=".tmp", delete=False
+        ) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+        with self._lock:
+            due = self._written is None or (
+                self._written + len(data) > self.max_bytes * EVICT_FRACTION
+            )
+            self._written = 0 if due else self._written + len(data)
+        if due:
+            self.evict()
+
+    def evict(self):
+        """
+        按 LRU 把缓存总大小压到 max_bytes 以内. 超过 max_age 未被访问的条目
+        (必然已经过期) 直接删除; 其余过期条目在 get 时删除.
+        """
+        if not self.cache_dir.is_dir():
+            return
+
+        now = time.time()
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
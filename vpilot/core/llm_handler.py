@@ -1,69 +1,503 @@
 import os
-import json
+import time
+import queue
+import random
+import threading
+import contextlib
+import collections
 from pathlib import Path
-from openai import OpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
+from vpilot.core import history_store, model_router, telemetry
+from vpilot.core.llm_backends import create_backend, load_env
+from vpilot.core.llm_cache import LLMCache
+from vpilot.core.history_compactor import compact_messages
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"), base_url="https://api.deepseek.com"
-)
+# 可重试错误 (超时, 连接错误, 429, 5xx) 的最大重试次数
+MAX_RETRIES = int(os.getenv("VPILOT_LLM_MAX_RETRIES", "4"))
+# 指数退避: 第 n 次重试前等待 uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2^n)) 秒
+BACKOFF_BASE = float(os.getenv("VPILOT_LLM_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("VPILOT_LLM_BACKOFF_MAX", "60"))
+# 对冲请求: 设置为百分位 (例如 0.9) 时启用. 请求耗时超过近期延迟的该百分位后,
+# 再发出一个相同的请求, 取先返回的结果.
+HEDGE_PERCENTILE = float(os.getenv("VPILOT_LLM_HEDGE_PERCENTILE", "0"))
+# 延迟样本不足时使用的对冲等待时间 (秒)
+HEDGE_DEFAULT_DELAY = float(os.getenv("VPILOT_LLM_HEDGE_DELAY", "60"))
 
 
-def generate_text(prompt, model=os.getenv("CHAT_MODEL")):
+class LLMRequestError(RuntimeError):
+    """重试用尽后仍未获得 LLM 响应. 由命令层报告错误并以非零状态退出."""
+
+
+# LLM 后端 (真实 API / 录制 / 回放), 首次使用时根据环境变量创建
+_backend = None
+_backend_lock = threading.Lock()
+
+# 同时进行中的 API 请求数上限 (跨进程共享的信号量, 由 'vpilot batch' 设置)
+_request_limiter = None
+
+# 近期成功请求的延迟样本 (用于计算对冲阈值)
+_latencies = collections.deque(maxlen=200)
+_latencies_seeded = False
+
+# 响应缓存模式: on (默认) | off | refresh. CLI 的 '--no-cache' / '--refresh'
+# 选项设置这个环境变量 (不需要导入本模块), 在每次调用 API 时读取.
+CACHE_MODE_ENV = "VPILOT_LLM_CACHE"
+# configure_cache 设置的缓存开关, 设置后优先于环境变量
+_cache_settings = None
+_cache = None
+
+
+def configure_cache(enabled=True, refresh=False):
+    """
+    配置 LLM 响应缓存 (优先于 VPILOT_LLM_CACHE 环境变量).
+
+    Args:
+        enabled: False 时完全绕过缓存 (既不读也不写).
+        refresh: True 时忽略已有条目, 重新调用 API 并覆盖缓存.
+    """
+    global _cache_settings
+    _cache_settings = {"enabled": enabled, "refresh": refresh}
+
+
+def _cache_mode():
+    """返回当前的缓存开关 {"enabled", "refresh"}."""
+    if _cache_settings is not None:
+        return _cache_settings
+    mode = os.getenv(CACHE_MODE_ENV, "on").lower()
+    return {"enabled": mode != "off", "refresh": mode == "refresh"}
+
+
+def _get_cache():
+    global _cache
+    if not _cache_mode()["enabled"]:
+        return None
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+def configure_backend(backend):
+    """
+    替换 LLM 后端. 后端需要提供:
+        complete(model, messages, timeout=None) -> (文本, usage, ttfb)
+        stream(model, messages, on_delta, timeout=None) -> (文本, usage, ttfb)
+        connection_info() -> 当前线程最近一次请求的连接信息 (dict)
+    见 vpilot.core.llm_backends.
+    """
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    """返回进程内共享的后端 (及其连接池). 并发任务第一次调用时只会创建一个."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def configure_concurrency(limiter):
+    """
+    设置全局并发上限. limiter 是支持上下文管理协议的信号量
+    (例如 multiprocessing.Manager().BoundedSemaphore(n)), 每个 API 请求
+    在发出前获取, 返回后释放. 传入 None 取消限制.
+    """
+    global _request_limiter
+    _request_limiter = limiter
+
+
+def _request_slot():
+    return (
+        _request_limiter if _request_limiter is not None else contextlib.nullcontext()
+    )
+
+
+def _is_retryable(error):
+    # openai 导入较慢 (~0.5s), 只在出错时才需要它的异常类型
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+def _backoff_delay(error, attempt):
+    """带抖动的指数退避 (full jitter). 服务端给出 Retry-After 时优先采用."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def _hedge_delay():
+    """对冲阈值: 近期延迟的 HEDGE_PERCENTILE 分位数."""
+    global _latencies_seeded
+    if not _latencies_seeded:
+        # 首次使用时, 用以往运行的 telemetry 记录预热延迟样本
+        _latencies_seeded = True
+        for r in telemetry.load_records()[-_latencies.maxlen :]:
+            if not r.get("cache_hit") and not r.get("stream") and r.get("latency"):
+                _latencies.appendleft(r["latency"])
+    if len(_latencies) < 5:
+        return HEDGE_DEFAULT_DELAY
+    samples = sorted(_latencies)
+    index = min(len(samples) - 1, int(HEDGE_PERCENTILE * len(samples)))
+    return samples[index]
+
+
+def _hedged_call(call):
+    """
+    发出请求; 若超过对冲阈值仍未返回, 再发出一个相同的请求, 取先成功的结果.
+    落后的那个请求会在后台线程中自然结束, 其结果被丢弃.
+
+    返回 (结果, 是否由对冲请求返回).
+    """
+    results = queue.Queue()
+
+    def run(hedged):
+        try:
+            results.put((hedged, None, call()))
+        except Exception as e:
+            results.put((hedged, e, None))
+
+    # 使用守护线程, 以免落后的请求阻塞进程退出
+    threading.Thread(target=run, args=(False,), daemon=True).start()
+    delay = _hedge_delay()
+    try:
+        hedged, error, value = results.get(timeout=delay)
+    except queue.Empty:
+        print(f"  > [Hedge] 请求超过 {delay:.1f}s 仍未返回, 发出对冲请求...")
+        threading.Thread(target=run, args=(True,), daemon=True).start()
+        hedged, error, value = results.get()
+        if error is not None:
+            # 先返回的失败了, 等待另一个
+            hedged, error, value = results.get()
+
+    if error is not None:
+        raise error
+    return value, hedged
+
+
+def _call_with_retries(call, can_retry=lambda error: True, hedge=True):
+    """
+    执行 call(), 对可重试错误 (且 can_retry(error) 为真) 进行指数退避重试.
+    hedge=True 且启用了 HEDGE_PERCENTILE 时, 每次尝试都使用对冲请求.
+    返回 (结果, 重试次数, 是否由对冲请求返回).
+    """
+    attempt = 0
+    while True:
+        try:
+            if hedge and HEDGE_PERCENTILE > 0:
+                value, hedged = _hedged_call(call)
+            else:
+                value, hedged = call(), False
+            return value, attempt, hedged
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_retryable(e) or not can_retry(e):
+                raise
+            delay = _backoff_delay(e, attempt)
+            attempt += 1
+            print(
+                f"WARNING: LLM 请求失败 ({type(e).__name__}: {e}), "
+                f"{delay:.1f}s 后进行第 {attempt}/{MAX_RETRIES} 次重试..."
+            )
+            time.sleep(delay)
+
+
+def _chat_completion(
+    model,
+    messages,
+    on_delta=None,
+    task_id=None,
+    tokens_saved=0,
+    timeout=None,
+    candidate=0,
+    context_tokens_saved=0,
+):
+    """
+    调用 chat completion API, 并经过内容寻址缓存.
+    相同的 (model, messages) 会直接返回上次的响应, 不再请求 API.
+    candidate > 0 时 (并发采样的其他候选) 缓存键中包含候选序号.
+
+    提供 on_delta 时使用流式模式: 每个文本片段到达时立即回调.
+    (缓存命中时, 整个响应作为一个片段回调.)
+
+    每次调用都会向 telemetry.jsonl 记录一条延迟/token/成本记录.
+    """
+    start = time.monotonic()
+    if model is None:
+        load_env()
+        model = os.getenv("CHAT_MODEL")
+    cache = _get_cache()
+    params = {"candidate": candidate} if candidate else {}
+    key = LLMCache.make_key(model, messages, **params) if cache else None
+
+    if cache and not _cache_mode()["refresh"]:
+        entry = cache.get(key)
+        if entry is not None:
+            print("  > [LLM Cache] 命中缓存, 跳过 API 调用.")
+            if on_delta:
+                on_delta(entry["content"])
+            latency = time.monotonic() - start
+            telemetry.record(
+                task=task_id,
+                model=model,
+                cache_hit=True,
+                stream=bool(on_delta),
+                **telemetry.extract_usage(None),
+                ttfb=latency,
+                latency=latency,
+                retries=0,
+                cost=0.0,
+                tokens_saved=tokens_saved,
+                context_tokens_saved=context_tokens_saved,
+                candidate=candidate,
+            )
+            return entry["content"]
+
+    def within_budget(error):
+        # 设置了时间预算时, 超时不再重试, 由调用者决定 (例如升级到更强的模型)
+        import openai
+
+        return timeout is None or not isinstance(error, openai.APITimeoutError)
+
+    if on_delta:
+        # 流式模式只在尚未收到任何片段时重试, 否则已注入的内容会与重试的内容混在一起.
+        # 流式模式也不做对冲.
+        received = []
+
+        def forward(delta):
+            received.append(len(delta))
+            on_delta(delta)
+
+        def call():
+            backend = get_backend()
+            with _request_slot():
+                result = backend.stream(model, messages, forward, timeout)
+            return result, backend.connection_info()
+
+        ((content, usage, ttfb), conn), retries, hedged = _call_with_retries(
+            call, can_retry=lambda e: not received and within_budget(e), hedge=False
+        )
+        content = content.strip()
+    else:
+
+        def call():
+            # 连接信息保存在执行请求的线程中 (对冲请求在独立线程中执行), 随结果一起返回
+            backend = get_backend()
+            with _request_slot():
+                result = backend.complete(model, messages, timeout)
+            return result, backend.connection_info()
+
+        ((content, usage, ttfb), conn), retries, hedged = _call_with_retries(
+            call, can_retry=within_budget
+        )
+    latency = time.monotonic() - start
+    if not on_delta:
+        _latencies.append(latency)
+
+    tokens = telemetry.extract_usage(usage)
+    if tokens["prompt_tokens"]:
+        print(
+            f"  > [Prefix Cache] 命中 {tokens['cached_tokens']}/"
+            f"{tokens['prompt_tokens']} prompt tokens "
+            f"({tokens['cached_tokens'] / tokens['prompt_tokens']:.0%})"
+        )
+    telemetry.record(
+        task=task_id,
+        model=model,
+        cache_hit=False,
+        stream=bool(on_delta),
+        **tokens,
+        # 非流式模式下响应头与完整响应几乎同时到达, ttfb 取总延迟
+        ttfb=latency if ttfb is None else ttfb,
+        latency=latency,
+        retries=retries,
+        hedged=hedged,
+        conn_reused=conn.get("conn_reused"),
+        http_version=conn.get("http_version"),
+        cost=telemetry.estimate_cost(**tokens),
+        tokens_saved=tokens_saved,
+        context_tokens_saved=context_tokens_saved,
+        candidate=candidate,
+    )
+
+    if cache:
+        try:
+            cache.put(key, {"model": model, "content": content, "created": time.time()})
+        except OSError as e:
+            print(f"WARNING: 写入 LLM 缓存失败: {e}")
+    return content
+
+
+def generate_text(prompt, model=None, task_id=None):
     """
     发送一个Prompt给LLM并返回生成的文本.
 
     Args:
         prompt: 发送给LLM的完整提示.
-        model: 使用的LLM模型.
+        model: 使用的LLM模型 (默认为环境变量 CHAT_MODEL).
+        task_id: 记录到 telemetry 中的任务标识.
 
     Returns:
         LLM生成的文本响应.
+
+    Raises:
+        LLMRequestError: 重试用尽后仍调用失败.
     """
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
+        return _chat_completion(
+            model,
+            [
                 {
                     "role": "system",
                     "content": "You are a professional RTL verification assistant. Your responses must be precise and follow the user's format instructions.",
                 },
                 {"role": "user", "content": prompt},
             ],
+            task_id=task_id,
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        print(f"ERROR: 调用LLM API失败: {e}")
-        return ""
+        raise LLMRequestError(f"调用LLM API失败: {e}") from e
+
+
+def load_conversation(history_file, system_prompt):
+    """
+    加载对话历史. 历史文件不存在时, 返回只包含系统提示的新会话.
+    """
+    messages = history_store.load(history_file)
+    if messages is None:
+        return [{"role": "system", "content": system_prompt}]
+    return messages
+
+
+def append_conversation(history_file, new_messages, system_prompt=""):
+    """
+    将若干条消息追加到对话历史并保存.
+    用于并发执行的回合: 先以 save=False 调用 LLM, 再按确定顺序写回历史.
+    """
+    if not history_file.exists():
+        new_messages = [{"role": "system", "content": system_prompt}, *new_messages]
+    history_store.append(history_file, new_messages)
 
 
 def execute_conversation_turn(
-    history_file, system_prompt, user_prompt, model=os.getenv("CHAT_MODEL")
+    history_file,
+    system_prompt,
+    user_prompt,
+    model=None,
+    history=None,
+    save=True,
+    on_delta=None,
+    token_budget=None,
+    task_id=None,
+    timeout=None,
+    candidate=0,
+    context_tokens_saved=0,
 ):
     """
     执行一个有状态的对话回合.
     加载对话历史, 追加新消息, 调用API, 并保存完整历史.
-    """
-    messages = []
 
-    if history_file.exists():
-        with open(history_file, "r", encoding="utf-8") as f:
-            messages = json.load(f)
+    Args:
+        history: 可选的历史快照 (消息列表). 提供时不再读取 history_file.
+        save: False 时只返回响应, 不写回历史文件 (由调用者负责合并).
+        on_delta: 可选回调. 提供时以流式模式调用 API, 每个文本片段到达时回调.
+        token_budget: 可选的 token 预算. 历史超出预算时, 发送给 API 的是
+            压缩后的视图 (见 history_compactor), 历史文件中仍保存完整内容.
+        task_id: 记录到 telemetry 中的任务标识.
+        timeout: 可选的单次请求时间预算 (秒), 见 model_router.
+        candidate: 并发采样时的候选序号, 见 model_router.
+        context_tokens_saved: 调用者精简 prompt 节省的 token 数, 记录到 telemetry 中.
+
+    Raises:
+        LLMRequestError: 重试用尽后仍调用失败 (可重试的错误已在 _chat_completion
+            中重试过).
+    """
+    if history is not None:
+        messages = list(history)
+        persisted = len(messages)
     else:
-        messages.append({"role": "system", "content": system_prompt})
+        stored = history_store.load(history_file)
+        messages = stored or [{"role": "system", "content": system_prompt}]
+        persisted = len(stored) if stored else 0
 
     messages.append({"role": "user", "content": user_prompt})
 
     try:
-        response = client.chat.completions.create(model=model, messages=messages)
-        assistant_response = response.choices[0].message.content.strip()
-        messages.append({"role": "assistant", "content": assistant_response})
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(messages, f, indent=2, ensure_ascii=False)
+        request_messages, stats = compact_messages(messages, token_budget)
+        if stats["tokens_saved"]:
+            print(
+                f"  > [History] 上下文已压缩: {stats['tokens_before']} -> "
+                f"{stats['tokens_after']} tokens (节省 {stats['tokens_saved']})"
+            )
+        assistant_response = _chat_completion(
+            model,
+            request_messages,
+            on_delta=on_delta,
+            task_id=task_id,
+            tokens_saved=stats["tokens_saved"],
+            timeout=timeout,
+            candidate=candidate,
+            context_tokens_saved=context_tokens_saved,
+        )
+        if save:
+            messages.append({"role": "assistant", "content": assistant_response})
+            # 只追加本回合新增的消息, 不重写整个历史
+            history_store.append(history_file, messages[persisted:])
         return assistant_response
 
     except Exception as e:
-        print(f"ERROR: 调用LLM API失败: {e}")
-        return None
+        raise LLMRequestError(f"调用LLM API失败: {e}") from e
+
+
+def execute_routed_turn(
+    history_file,
+    system_prompt,
+    user_prompt,
+    route,
+    validate=None,
+    task_id=None,
+    token_budget=None,
+    candidates=1,
+):
+    """
+    按模型路由执行一个对话回合 (见 model_router.run).
+    各次尝试 (以及并发的候选) 都基于同一份历史快照, 只有最终采用的响应会写回历史.
+    所有尝试都失败时抛出 LLMRequestError.
+    """
+
+    def attempt(model, timeout, candidate):
+        return execute_conversation_turn(
+            history_file,
+            system_prompt,
+            user_prompt,
+            model=model,
+            save=False,
+            token_budget=token_budget,
+            task_id=task_id,
+            timeout=timeout,
+            candidate=candidate,
+        )
+
+    response = model_router.run(
+        route, attempt, validate=validate, label=task_id, candidates=candidates
+    )
+    if response is not None:
+        append_conversation(
+            history_file,
+            [
+                {"role": "user", "content": user_prompt},
+                {"role": "assistant", "content": response},
+            ],
+            system_prompt,
+        )
+    return response
@@ -0,0 +1,200 @@
+import mmap
+import re
+from collections import deque
+from pathlib import Path
+
+from vpilot.core.code_manager import BlockMarkerError, index_blocks
+
+# 超过这个大小的日志文件用 mmap 逐行读取 (字节)
+MMAP_THRESHOLD = 16 * 1024 * 1024
+# 最多保留的 (去重后的) 错误条目数
+MAX_ENTRIES = 20
+# Verilator %Error 之后最多保留的源码上下文行数
+VERILATOR_CONTEXT_LINES = 3
+
+TRACEBACK = "Traceback (most recent call last):"
+VERILATOR_ERROR = re.compile(r"^\s*%Error")
+VERILATOR_CONTEXT = re.compile(r"^\s+(\d+\s*)?\|")
+# 记分板的 FAIL 行 (不包括 'FAIL=0' 这样的统计), 断言, ERROR/FATAL 级别的日志,
+# 单独出现的 Python 异常 (没有 traceback), 以及 make 自身的错误
+ERROR_LINE = re.compile(
+    r"\bFAIL(?:ED)?\b(?!=0\b)|\bfailed\b|AssertionError|[Aa]ssertion"
+    r"|\b(?:ERROR|CRITICAL|FATAL)\b|^\s*\w+(?:Error|Exception): "
+    r"|^make(?:\[\d+\])?: \*\*\*"
+)
+# 错误中引用的文件位置: Python traceback 的帧, 或者 'file.py:42' / 'Makefile:42'
+LOCATION = re.compile(r'File "([^"]+)", line (\d+)|([\w./\\-]*(?:\.py|Makefile)):(\d+)')
+# 去重时忽略的数字 (仿真时间, 期望值/实际值等)
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def iter_log_lines(path):
+    """逐行读取日志 (不含换行符), 不一次性读入内存. 很大的文件使用 mmap."""
+    path = Path(path)
+    if path.stat().st_size >= MMAP_THRESHOLD:
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.decode("utf-8", errors="replace").rstrip("\r\n")
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def _entries(lines):
+    """
+    从日志行中提取错误条目, 每个条目为 (类型, 文本).
+    类型: 'traceback', 'verilator', 'error'.
+    """
+    traceback, column = None, 0
+    verilator = None
+    for line in lines:
+        if traceback is not None:
+            # traceback 的帧比 'Traceback' 缩进更深, 第一个同级的行是异常本身
+            if line[:column].strip() or not line[column:].strip():
+                yield "traceback", "\n".join(traceback)
+                traceback = None
+            else:
+                traceback.append(line[column:])
+                if not line[column].isspace():
+                    yield "traceback", "\n".join(traceback)
+                    traceback = None
+                continue
+
+        if verilator is not None:
+            if VERILATOR_CONTEXT.match(line) and len(verilator) <= (
+                VERILATOR_CONTEXT_LINES
+            ):
+                verilator.append(line)
+                continue
+            yield "verilator", "\n".join(verilator)
+            verilator = None
+
+        if TRACEBACK in line:
+            column = line.index(TRACEBACK)
+            traceback = [TRACEBACK]
+        elif VERILATOR_ERROR.match(line):
+            verilator = [line.strip()]
+        elif ERROR_LINE.search(line):
+            yield "error", line.strip()
+
+    if traceback is not None:
+        yield "traceback", "\n".join(traceback)
+    if verilator is not None:
+        yield "verilator", "\n".join(verilator)
+
+
+class BlockLocator:
+    """把 uvm_tb/ 中的文件位置 (文件, 行号) 映射到所在的 LLM 代码块."""
+
+    def __init__(self, root):
+        self.root = Path(root).resolve() if root else None
+        self._ranges = {}
+
+    def _relative(self, file):
+        path = Path(file)
+        if path.is_absolute():
+            try:
+                return path.resolve().relative_to(self.root).as_posix()
+            except ValueError:
+                # uvm_tb/ 之外的文件 (例如 pyuvm, cocotb 的源码)
+                return None
+        return path.as_posix()
+
+    def _block_ranges(self, relative_file):
+        if relative_file not in self._ranges:
+            ranges = []
+            try:
+                content = (self.root / relative_file).read_text(encoding="utf-8")
+                for block_id, entry in index_blocks(content).items():
+                    end_line = content.count("\n", 0, entry["end"]) + 1
+                    ranges.append((entry["line"], end_line, block_id))
+            except (OSError, UnicodeDecodeError, BlockMarkerError):
+                pass
+            self._ranges[relative_file] = ranges
+        return self._ranges[relative_file]
+
+    def block_at(self, file, line):
+        """返回位置 (文件, 行号) 所在的代码块 'file:BLOCK_ID', 不在代码块中时返回 None."""
+        if self.root is None:
+            return None
+        relative_file = self._relative(file)
+        if relative_file is None:
+            return None
+        for start, end, block_id in self._block_ranges(relative_file):
+            if start <= line <= end:
+                return f"{relative_file}:{block_id}"
+        return None
+
+    def blocks(self, text):
+        """返回 text 中引用到的代码块 ['file:BLOCK_ID', ...] (按出现顺序, 去重)."""
+        found = []
+        for match in LOCATION.finditer(text):
+            block = self.block_at(
+                match.group(1) or match.group(3), int(match.group(2) or match.group(4))
+            )
+            if block and block not in found:
+                found.append(block)
+        return found
+
+
+def distill(lines, root=None, max_entries=MAX_ENTRIES, tail_lines=200):
+    """
+    精简 'make' 日志, 只保留 Python traceback, Verilator %Error,
+    记分板 FAIL 行和断言信息. 重复的条目 (忽略数字) 只保留第一次出现的,
+    并注明重复次数. 提供 root (uvm_tb/ 目录) 时, 把错误映射到所在的 LLM 代码块.
+    没有找到任何错误条目时, 保留日志的最后 tail_lines 行.
+
+    返回 (精简后的日志, 统计信息 {"lines", "entries", "duplicates", "blocks"}).
+    """
+    counted = {"lines": 0}
+    tail = deque(maxlen=tail_lines)
+
+    def numbered(lines):
+        for line in lines:
+            counted["lines"] += 1
+            tail.append(line)
+            yield line
+
+    entries = {}
+    for kind, text in _entries(numbered(lines)):
+        # traceback 中的行号用于定位代码块, 不参与归一化
+        key = (kind, text if kind == "traceback" else NUMBER.sub("#", text))
+        if key in entries:
+            entries[key]["count"] += 1
+        else:
+            entries[key] = {"kind": kind, "text": text, "count": 1}
+
+    locator = BlockLocator(root)
+    kept = list(entries.values())[:max_entries]
+    blocks = []
+    parts = []
+    for i, entry in enumerate(kept, 1):
+        entry_blocks = locator.blocks(entry["text"])
+        blocks.extend(b for b in entry_blocks if b not in blocks)
+        header = f"[{i}] {entry['kind']}"
+        if entry["count"] > 1:
+            header += f" (重复 {entry['count']} 次)"
+        if entry_blocks:
+            header += f" -> 代码块: {', '.join(entry_blocks)}"
+        parts.append(f"{header}\n{entry['text']}")
+
+    if len(entries) > max_entries:
+        parts.append(
+            f"[v-pilot] (另有 {len(entries) - max_entries} 条不同的错误被省略)"
+        )
+    if not entries:
+        parts.append(f"[v-pilot] 没有识别出错误条目, 以下是日志的最后 {len(tail)} 行:")
+        parts.extend(tail)
+    if blocks:
+        parts.insert(0, f"[v-pilot] 可能需要修改的代码块: {', '.join(blocks)}")
+
+    stats = {
+        "lines": counted["lines"],
+        "entries": len(entries),
+        "duplicates": sum(e["count"] - 1 for e in entries.values()),
+        "blocks": blocks,
+    }
+    return "\n".join(parts), stats
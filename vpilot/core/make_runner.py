@@ -0,0 +1,176 @@
+import asyncio
+import os
+import re
+import signal
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+# cocotb 写出的 JUnit 格式测试结果 (相对于运行 make 的目录)
+RESULTS_FILE = "results.xml"
+
+# 出现后 'make' 已经不可能成功的致命错误: 立即终止, 不再等待后续的编译/仿真
+FATAL_PATTERNS = {
+    # Verilator 编译错误
+    "verilator": r"^\s*%Error",
+    # 导入测试模块时的异常 (traceback 的最后一行), 仿真实际上不会运行任何测试.
+    # 模块顶层代码抛出的 NameError/TypeError 等按 traceback 中的 '<module>' 帧识别,
+    # 测试运行期间的同类异常不在此列
+    "import": r"^\s*(?:ImportError|ModuleNotFoundError|SyntaxError|IndentationError)\b"
+    r"|Failed to import"
+    r'|^\s*File "[^"]+", line \d+, in <module>$',
+}
+# --fail-fast: 第一个测试失败就终止
+FAIL_FAST_PATTERNS = {
+    "scoreboard": r"\bFAIL:",
+    "assertion": r"\bAssertionError\b",
+}
+# 匹配到致命错误后, 再读取一小段输出 (例如 %Error 之后的源码上下文) 再终止
+ABORT_GRACE_LINES = 20
+ABORT_GRACE_S = 0.5
+# 单行输出的最大长度 (asyncio 的默认上限为 64KB)
+STREAM_LIMIT = 1024 * 1024
+
+
+def abort_patterns(fail_fast=False, extra=()):
+    """
+    返回提前终止使用的模式 {名字: 已编译的正则}.
+    extra 为额外的正则表达式 (字符串), 无效的正则抛出 re.error.
+    """
+    patterns = dict(FATAL_PATTERNS)
+    if fail_fast:
+        patterns.update(FAIL_FAST_PATTERNS)
+    for i, pattern in enumerate(extra, 1):
+        patterns[f"custom{i}"] = pattern
+    return {name: re.compile(pattern) for name, pattern in patterns.items()}
+
+
+def parse_results(path):
+    """
+    解析 cocotb 的 results.xml.
+    返回 {"tests", "failures", "failed": [测试名]}; 文件不存在或无法解析时返回 None.
+    """
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return None
+    tests, failed = 0, []
+    for case in root.iter("testcase"):
+        tests += 1
+        if case.find("failure") is not None or case.find("error") is not None:
+            failed.append(case.get("name") or "?")
+    return {"tests": tests, "failures": len(failed), "failed": failed}
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # 进程组已经全部退出
+        pass
+    except AttributeError:
+        # 没有进程组的平台 (Windows) 只终止 make 本身
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_make_async(cwd, args=(), timeout=None, patterns=None):
+    """
+    在 cwd 中以异步子进程运行 'make', stdout 和 stderr 合并, 逐行读取.
+    超出 timeout (秒) 时终止进程.
+    提供 patterns ({名字: 正则}, 见 abort_patterns) 时, 任一行匹配即视为致命错误:
+    再读取一小段输出后终止整个进程组, 不等待 make 结束.
+
+    返回 {"returncode", "output", "duration", "timed_out", "aborted", "results",
+    "passed"}. aborted 为 {"pattern", "line"} (未提前终止时为 None).
+    results 为 parse_results 的结果; 每次运行前删除旧的 results.xml,
+    避免把上一次的结果当成这一次的.
+    passed: make 成功退出, 并且 results.xml 中至少有一个测试, 没有失败的测试.
+    """
+    cwd = Path(cwd)
+    results_path = cwd / RESULTS_FILE
+    results_path.unlink(missing_ok=True)
+
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        "make",
+        *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        limit=STREAM_LIMIT,
+        # 独立的进程组: 终止时连同仿真器等子进程一起终止
+        start_new_session=True,
+    )
+    chunks = []
+    aborted = None
+
+    async def read_line(deadline):
+        try:
+            if deadline is None:
+                return await process.stdout.readline()
+            return await asyncio.wait_for(
+                process.stdout.readline(), max(0, deadline - time.monotonic())
+            )
+        except ValueError:
+            # 单行超过 STREAM_LIMIT, 按块读取
+            return await process.stdout.read(STREAM_LIMIT)
+
+    async def read_output():
+        nonlocal aborted
+        deadline, grace_lines = None, 0
+        while True:
+            try:
+                line = await read_line(deadline)
+            except asyncio.TimeoutError:
+                return
+            if not line:
+                return
+            chunks.append(line)
+            if aborted is not None:
+                grace_lines += 1
+                if grace_lines >= ABORT_GRACE_LINES:
+                    return
+                continue
+            text = line.decode("utf-8", errors="replace")
+            for name, pattern in (patterns or {}).items():
+                if pattern.search(text):
+                    aborted = {"pattern": name, "line": text.strip()}
+                    deadline = time.monotonic() + ABORT_GRACE_S
+                    break
+
+    reader = asyncio.create_task(read_output())
+    done, _ = await asyncio.wait({reader}, timeout=timeout)
+    timed_out = not done
+    if timed_out or aborted is not None:
+        _kill(process)
+    # 进程组被终止后管道关闭, 读取随之结束
+    await reader
+    await process.wait()
+    stdout = b"".join(chunks)
+
+    results = parse_results(results_path)
+    returncode = process.returncode
+    return {
+        "returncode": returncode,
+        "output": stdout.decode("utf-8", errors="replace"),
+        "duration": time.monotonic() - start,
+        "timed_out": timed_out,
+        "aborted": aborted,
+        "results": results,
+        "passed": (
+            not timed_out
+            and aborted is None
+            and returncode == 0
+            and results is not None
+            and results["tests"] > 0
+            and results["failures"] == 0
+        ),
+    }
+
+
+def run_make(cwd, args=(), timeout=None, patterns=None):
+    """run_make_async 的同步入口."""
+    return asyncio.run(run_make_async(cwd, args, timeout, patterns))
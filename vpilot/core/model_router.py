@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from vpilot.core.llm_backends import load_env
+
+# 模型档位:
+#   fast   - 便宜, 低延迟, 用于机械性的任务 (Makefile 变量, 数据类字段等)
+#   strong - 推理能力强, 用于参考模型, 驱动/监视时序, 激励序列等
+# 未配置的档位回退到 CHAT_MODEL, 因此默认情况下所有调用仍使用同一个模型.
+TIER_ENV = {
+    "fast": "VPILOT_FAST_MODEL",
+    "strong": "VPILOT_STRONG_MODEL",
+}
+
+# 路由表中没有列出的任务使用的路由
+DEFAULT_ROUTE = {"tier": "strong"}
+
+
+# 多个任务 (各自在调度器的工作线程中) 同时采样候选时, 日志行不能相互穿插
+_log_lock = threading.Lock()
+
+
+def _log(message):
+    """整行写出一条日志 (print 的文本和换行是两次写入, 并发时会拆开)."""
+    with _log_lock:
+        sys.stdout.write(message + "\n")
+        sys.stdout.flush()
+
+
+def model_for(tier):
+    """返回档位对应的模型名 (在调用时读取环境变量和 .env)."""
+    if tier not in TIER_ENV:
+        raise ValueError(f"未知的模型档位: {tier}")
+    load_env()
+    return os.getenv(TIER_ENV[tier]) or os.getenv("CHAT_MODEL")
+
+
+def _call(attempt, model, timeout, candidate, label, failures):
+    """
+    调用 attempt. 抛出的异常 (重试用尽后的 API 错误) 记入 failures,
+    本次按未获得响应处理, 这样仍然可以升级到 strong 档位重试.
+    """
+    try:
+        return attempt(model, timeout, candidate)
+    except Exception as e:
+        failures.append(e)
+        _log(f"  > [Router] {label}: {model} 请求失败: {e}")
+        return None
+
+
+def _result(response, failures):
+    """所有尝试都没有响应时, 把最后一个异常交给调用者, 而不是返回 None."""
+    if response is None and failures:
+        raise failures[-1]
+    return response
+
+
+def _check(response, validate):
+    if response is None:
+        return "未获得响应"
+    return validate(response) if validate else None
+
+
+def _sample(attempt, model, timeout, validate, candidates, label, failures):
+    """
+    并发请求 candidates 个候选, 第一个通过校验的候选胜出, 其余的在后台结束后丢弃.
+    返回 (响应, 错误描述). 全部未通过时返回第一个非空的响应及其错误.
+    """
+    if candidates <= 1:
+        response = _call(attempt, model, timeout, 0, label, failures)
+        return response, _check(response, validate)
+
+    pool = ThreadPoolExecutor(max_workers=candidates)
+    futures = {
+        pool.submit(_call, attempt, model, timeout, i, label, failures): i
+        for i in range(candidates)
+    }
+    fallback, fallback_error = None, "未获得响应"
+    try:
+        for future in as_completed(futures):
+            response = future.result()
+            error = _check(response, validate)
+            name = f"{label}: 候选 {futures[future] + 1}/{candidates}"
+            if error is None:
+                _log(f"  > [Candidates] {name} 通过校验")
+                return response, None
+            _log(f"  > [Candidates] {name} 未通过 ({error})")
+            if fallback is None and response is not None:
+                fallback, fallback_error = response, error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return fallback, fallback_error
+
+
+def run(route, attempt, validate=None, label="", candidates=1):
+    """
+    按路由执行一次 LLM 请求, 必要时升级到 strong 档位重试.
+
+    Args:
+        route: 路由表中的一项, 例如
+            {"tier": "fast", "timeout": 60, "escalate": True}
+            tier: 档位; timeout: 单次请求的时间预算 (秒, 可选);
+            escalate: 响应为空 (出错或超出时间预算) 或未通过校验时,
+                      是否用 strong 档位的模型重试.
+        attempt: attempt(model, timeout, candidate) -> 响应文本 (失败时为 None
+            或抛出异常).
+            由调用者负责基于同一份历史快照发起请求, 并且不写回历史,
+            这样被放弃的响应不会进入对话. candidate 是候选序号 (从 0 开始),
+            用于区分缓存键.
+        validate: 可选. validate(响应) -> 错误描述, 通过时返回 None.
+        label: 日志中显示的任务名.
+        candidates: 每个档位并发请求的候选数, 第一个通过校验的候选被采用.
+
+    返回最终采用的响应 (可能仍未通过校验, 由调用者处理).
+    所有尝试都抛出异常 (没有任何响应) 时, 重新抛出最后一个异常.
+    """
+    route = route or DEFAULT_ROUTE
+    model = model_for(route["tier"])
+    failures = []
+    response, error = _sample(
+        attempt, model, route.get("timeout"), validate, candidates, label, failures
+    )
+    if error is None:
+        return response
+
+    strong = model_for("strong")
+    if not route.get("escalate") or strong == model:
+        return _result(response, failures)
+
+    _log(f"  > [Router] {label}: {model} 的输出不可用 ({error}), 升级到 {strong} 重试")
+    # strong 档位不设时间预算, 升级的目的就是拿到可用的结果
+    escalated, _ = _sample(attempt, strong, None, validate, candidates, label, failures)
+    return _result(escalated if escalated is not None else response, failures)
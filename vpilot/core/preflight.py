@@ -0,0 +1,507 @@
+import ast
+import builtins
+import importlib
+import importlib.abc
+import importlib.machinery
+import inspect
+import sys
+import traceback
+import types
+from pathlib import Path
+
+from vpilot.core.log_distiller import BlockLocator
+
+# 仿真环境才有的包: 检查时用占位模块代替, 任何属性都可以导入和访问
+STUB_PACKAGES = ("cocotb", "pyuvm", "cocotb_coverage")
+# pyuvm 基类提供的, 常被继续访问的属性 (例如 'self.env.logger.info',
+# 'self.driver.seq_item_port.connect'), 不在测试平台中定义
+PYUVM_ATTRIBUTES = {
+    "logger",
+    "parent",
+    "seq_item_port",
+    "seq_item_export",
+    "analysis_export",
+    "get_export",
+    "get_peek_export",
+    "put_export",
+    "sequencer",
+}
+BUILTIN_NAMES = set(dir(builtins)) | {"__file__", "__class__"}
+
+
+# --------------------------------------------------
+# 1. 导入检查: 用占位的 cocotb/pyuvm/cocotb_coverage 导入每个模块
+# --------------------------------------------------
+
+
+class _StubMeta(type):
+    """占位类的元类: 类属性, 调用, 作为元类或装饰器使用都不会出错."""
+
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _stub_class(name)
+
+    def __call__(cls, *args, **kwargs):
+        if len(args) == 1 and not kwargs and _is_decorated(args[0]):
+            # 作为装饰器使用 (@pyuvm.test), 原样返回被装饰的对象
+            return args[0]
+        if (
+            len(args) == 3
+            and isinstance(args[0], str)
+            and isinstance(args[1], tuple)
+            and isinstance(args[2], dict)
+        ):
+            # 作为元类使用 (metaclass=utility_classes.Singleton)
+            return _StubMeta(args[0], args[1] or (_Stub,), args[2])
+        return super().__call__(*args, **kwargs)
+
+
+class _Stub(metaclass=_StubMeta):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub()
+
+    def __call__(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and _is_decorated(args[0]):
+            # 作为带参数的装饰器使用 (@pyuvm.test())
+            return args[0]
+        return _Stub()
+
+    def __iter__(self):
+        return iter(())
+
+    def __getitem__(self, key):
+        return _Stub()
+
+
+def _is_decorated(obj):
+    return inspect.isfunction(obj) or isinstance(obj, type)
+
+
+def _stub_class(name):
+    return _StubMeta(name, (_Stub,), {})
+
+
+class _StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = _stub_class(name)
+        setattr(self, name, value)
+        return value
+
+
+class _StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """为 STUB_PACKAGES 及其子模块创建占位模块."""
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname.split(".")[0] in STUB_PACKAGES:
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+        return None
+
+    def create_module(self, spec):
+        module = _StubModule(spec.name)
+        module.__path__ = []
+        return module
+
+    def exec_module(self, module):
+        pass
+
+
+def _failure_location(error, tb_dir):
+    """异常在测试平台中发生的位置 (文件, 行号): 取最深的一个 tb 文件中的帧."""
+    if isinstance(error, SyntaxError) and error.filename:
+        return error.filename, error.lineno or 0
+    location = (None, 0)
+    for frame in traceback.extract_tb(error.__traceback__):
+        if Path(frame.filename).resolve().parent == tb_dir:
+            location = (frame.filename, frame.lineno)
+    return location
+
+
+def _import_modules(tb_dir, module_names):
+    """
+    依次导入 tb_dir 中的模块, 返回 [(模块, 文件, 行号, 错误信息)].
+    检查结束后恢复 sys.path, sys.meta_path 和 sys.modules.
+    """
+    saved_path = list(sys.path)
+    saved_modules = set(sys.modules)
+    saved_bytecode = sys.dont_write_bytecode
+    # 不在 uvm_tb/ 中留下 __pycache__
+    sys.dont_write_bytecode = True
+    finder = _StubFinder()
+    sys.path.insert(0, str(tb_dir))
+    sys.meta_path.insert(0, finder)
+    # 与 tb 模块同名的已加载模块 (例如标准库的 'coverage' 包) 暂时移开
+    shadowed = {
+        name: sys.modules.pop(name) for name in module_names if name in sys.modules
+    }
+    failures = []
+    try:
+        for name in module_names:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                file, line = _failure_location(e, tb_dir)
+                message = e.msg if isinstance(e, SyntaxError) else e
+                failures.append((name, file, line, f"{type(e).__name__}: {message}"))
+    finally:
+        sys.path[:] = saved_path
+        sys.dont_write_bytecode = saved_bytecode
+        sys.meta_path.remove(finder)
+        for name in set(sys.modules) - saved_modules:
+            del sys.modules[name]
+        sys.modules.update(shadowed)
+    return failures
+
+
+# --------------------------------------------------
+# 2. 静态检查: 符号索引, 未定义的名字, 跨文件的属性引用
+# --------------------------------------------------
+
+
+def _walk_scope(nodes):
+    """遍历同一作用域中的节点, 不进入嵌套的函数/类/lambda 的主体."""
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # 装饰器, 默认值和注解在外层作用域中求值
+            stack.extend(node.decorator_list)
+            stack.extend(node.args.defaults)
+            stack.extend(d for d in node.args.kw_defaults if d is not None)
+        elif isinstance(node, ast.ClassDef):
+            stack.extend(node.decorator_list)
+            stack.extend(node.bases)
+            stack.extend(k.value for k in node.keywords)
+        elif isinstance(node, ast.Lambda):
+            stack.extend(node.args.defaults)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def _bindings(nodes):
+    """作用域中绑定的名字 (包括推导式的变量, 宽松处理以避免误报)."""
+    names = set()
+    for node in _walk_scope(nodes):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update(
+                (a.asname or a.name).split(".")[0] for a in node.names if a.name != "*"
+            )
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+    return names
+
+
+def _arguments(args):
+    names = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    names += [a.arg for a in (args.vararg, args.kwarg) if a is not None]
+    return set(names)
+
+
+class _Module:
+    """一个 tb 模块的符号: 顶层名字, 导入的 tb 模块别名, 引用的 tb 类."""
+
+    def __init__(self, name, relative_file, tree):
+        self.name = name
+        self.relative_file = relative_file
+        self.tree = tree
+        self.names = _bindings(tree.body)
+        self.star_import = any(
+            isinstance(node, ast.ImportFrom) and any(a.name == "*" for a in node.names)
+            for node in _walk_scope(tree.body)
+        )
+        self.aliases = {}
+        self.imported = {}
+
+
+class _Class:
+    def __init__(self, module, node):
+        self.module = module
+        self.node = node
+        self.bases = []
+        self.external_base = False
+        # 类中定义的属性: 方法, 类属性, 以及方法中赋值的 self.X
+        self.attrs = _bindings(node.body)
+        # self.X = SomeTbClass(...) / SomeTbClass.create(...) 推断出的属性类型
+        self.types = {}
+
+
+class SymbolIndex:
+    """测试平台所有模块的符号索引 (只解析, 不执行)."""
+
+    def __init__(self, modules):
+        self.modules = {m.name: m for m in modules}
+        self.classes = {}
+        for module in modules:
+            for node in _walk_scope(module.tree.body):
+                if isinstance(node, ast.Import):
+                    for alias in node.names:
+                        if alias.name in self.modules:
+                            module.aliases[alias.asname or alias.name] = alias.name
+                elif isinstance(node, ast.ImportFrom) and node.module in self.modules:
+                    for alias in node.names:
+                        module.imported[alias.asname or alias.name] = (
+                            node.module,
+                            alias.name,
+                        )
+                elif isinstance(node, ast.ClassDef):
+                    self.classes[(module.name, node.name)] = _Class(module, node)
+        for cls in self.classes.values():
+            self._index_class(cls)
+
+    def resolve_class(self, module, name):
+        """模块中的名字 name 指向的 tb 类 (可能是从其他 tb 模块导入的)."""
+        if (module.name, name) in self.classes:
+            return self.classes[(module.name, name)]
+        if name in module.imported:
+            return self.classes.get(module.imported[name])
+        return None
+
+    def _index_class(self, cls):
+        for base in cls.node.bases:
+            resolved = (
+                self.resolve_class(cls.module, base.id)
+                if isinstance(base, ast.Name)
+                else None
+            )
+            if resolved is None:
+                cls.external_base = True
+            else:
+                cls.bases.append(resolved)
+
+        for method in cls.node.body:
+            if not isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            self_name = _self_name(method)
+            for node in ast.walk(method):
+                if not isinstance(node, ast.Assign):
+                    continue
+                for target in node.targets:
+                    if not (
+                        isinstance(target, ast.Attribute)
+                        and isinstance(target.value, ast.Name)
+                        and target.value.id == self_name
+                    ):
+                        continue
+                    cls.attrs.add(target.attr)
+                    value_type = self._value_class(cls.module, node.value)
+                    if value_type is not None:
+                        cls.types.setdefault(target.attr, value_type)
+
+    def _value_class(self, module, value):
+        if not isinstance(value, ast.Call):
+            return None
+        func = value.func
+        if isinstance(func, ast.Attribute) and func.attr == "create":
+            func = func.value
+        if isinstance(func, ast.Name):
+            return self.resolve_class(module, func.id)
+        return None
+
+    def _mro(self, cls, seen=None):
+        seen = seen or []
+        if cls not in seen:
+            seen.append(cls)
+            for base in cls.bases:
+                self._mro(base, seen)
+        return seen
+
+    def has_attr(self, cls, name):
+        return any(name in c.attrs for c in self._mro(cls))
+
+    def attr_type(self, cls, name):
+        for c in self._mro(cls):
+            if name in c.types:
+                return c.types[name]
+        return None
+
+    def fully_known(self, cls):
+        """类的所有基类都在测试平台中定义 (没有 pyuvm 等外部基类), 属性可以完整列出."""
+        return not any(c.external_base for c in self._mro(cls))
+
+
+def _self_name(function):
+    args = function.args.posonlyargs + function.args.args
+    return args[0].arg if args else None
+
+
+def _attribute_chain(node):
+    """'a.b.c' -> ('a', ['b', 'c']); 根不是名字时返回 (None, [])."""
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None, []
+    return node.id, attrs[::-1]
+
+
+class _Checker:
+    def __init__(self, index, module):
+        self.index = index
+        self.module = module
+        self.problems = []
+
+    def report(self, node, message):
+        self.problems.append((self.module.relative_file, node.lineno, message))
+
+    def check(self):
+        # 模块级和类主体的名字在导入时就会被执行, 由导入检查负责; 这里只检查函数主体
+        self._visit(self.module.tree.body, enclosing=set(), cls=None)
+        return self.problems
+
+    def _visit(self, body, enclosing, cls):
+        for node in _walk_scope(body):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self._check_function(node, enclosing, cls)
+            elif isinstance(node, ast.ClassDef):
+                self._visit(
+                    node.body,
+                    enclosing,
+                    self.index.classes.get((self.module.name, node.name)),
+                )
+
+    def _check_function(self, function, enclosing, cls):
+        local = _arguments(function.args) | _bindings(function.body)
+        visible = local | enclosing
+        if not self.module.star_import:
+            for node in _walk_scope(function.body):
+                if (
+                    isinstance(node, ast.Name)
+                    and isinstance(node.ctx, ast.Load)
+                    and node.id not in visible
+                    and node.id not in self.module.names
+                    and node.id not in BUILTIN_NAMES
+                ):
+                    self.report(node, f"NameError: 名字 '{node.id}' 没有定义")
+
+        self_name = _self_name(function) if cls else None
+        for node in _walk_scope(function.body):
+            if isinstance(node, ast.Attribute) and not isinstance(
+                getattr(node, "parent", None), ast.Attribute
+            ):
+                self._check_chain(node, self_name, cls, local)
+            elif isinstance(node, ast.Lambda):
+                self._check_lambda(node, visible)
+        # 嵌套函数可以看到外层函数的局部变量 (但看不到类作用域中的名字)
+        self._visit(function.body, visible, None)
+
+    def _check_lambda(self, node, visible):
+        names = _arguments(node.args) | visible
+        for child in ast.walk(node.body):
+            if (
+                isinstance(child, ast.Name)
+                and isinstance(child.ctx, ast.Load)
+                and child.id not in names
+                and child.id not in self.module.names
+                and child.id not in BUILTIN_NAMES
+                and not self.module.star_import
+            ):
+                self.report(child, f"NameError: 名字 '{child.id}' 没有定义")
+
+    def _check_chain(self, node, self_name, cls, local):
+        root, attrs = _attribute_chain(node)
+        if root is None or not attrs:
+            return
+        store = isinstance(node.ctx, ast.Store)
+
+        # seq_lib.X: tb 模块中必须定义了 X
+        if root in self.module.aliases and root not in local:
+            target = self.index.modules[self.module.aliases[root]]
+            if not target.star_import and attrs[0] not in target.names:
+                self.report(
+                    node,
+                    f"AttributeError: '{target.relative_file}' 中没有定义 '{attrs[0]}' "
+                    f"(引用: {root}.{attrs[0]})",
+                )
+            return
+
+        # self.env.input_agent.sequencer, self.bfm.reset(): 按推断出的属性类型逐级检查
+        if cls is None or root != self_name:
+            return
+        current = cls
+        for i, attr in enumerate(attrs):
+            last = i == len(attrs) - 1
+            if last and store:
+                return
+            if not self.index.has_attr(current, attr):
+                if self.index.fully_known(current) or (
+                    i > 0 and not last and attr not in PYUVM_ATTRIBUTES
+                ):
+                    path = ".".join([root] + attrs[: i + 1])
+                    self.report(
+                        node,
+                        f"AttributeError: '{current.node.name}' "
+                        f"({current.module.relative_file}) 没有属性 '{attr}' "
+                        f"(引用: {path})",
+                    )
+                return
+            current = self.index.attr_type(current, attr)
+            if current is None:
+                return
+
+
+def _set_parents(tree):
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            child.parent = node
+
+
+def check_testbench(tb_dir):
+    """
+    不启动仿真器, 检查 tb_dir 中的测试平台:
+      1. 用占位的 cocotb/pyuvm/cocotb_coverage 导入每个模块
+         (语法错误, ImportError, 模块级和类定义中的 NameError/TypeError);
+      2. 检查方法中未定义的名字;
+      3. 按符号索引检查跨文件的引用: tb 模块别名的属性 (seq_lib.X),
+         组件路径 (self.env.input_agent.sequencer) 和 BFM 方法 (self.bfm.X).
+
+    返回问题列表 [{"file", "line", "block", "message"}], 按文件和行号排序.
+    """
+    tb_dir = Path(tb_dir).resolve()
+    locator = BlockLocator(tb_dir)
+    problems = {}
+
+    def add(file, line, message):
+        relative_file = Path(file).name if file else "?"
+        key = (relative_file, line, message)
+        if key not in problems:
+            problems[key] = {
+                "file": relative_file,
+                "line": line,
+                "block": locator.block_at(file, line) if file else None,
+                "message": message,
+            }
+
+    modules = []
+    for path in sorted(tb_dir.glob("*.py")):
+        try:
+            tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+        except SyntaxError as e:
+            add(path.name, e.lineno or 0, f"SyntaxError: {e.msg}")
+            continue
+        _set_parents(tree)
+        modules.append(_Module(path.stem, path.name, tree))
+
+    for name, file, line, message in _import_modules(tb_dir, [m.name for m in modules]):
+        add(file or f"{name}.py", line, message)
+
+    index = SymbolIndex(modules)
+    for module in modules:
+        for file, line, message in _Checker(index, module).check():
+            add(file, line, message)
+
+    return sorted(problems.values(), key=lambda p: (p["file"], p["line"]))
@@ -0,0 +1,171 @@
+import json
+import time
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import typer
+
+from vpilot.core.llm_backends import (
+    DEFAULT_FIXTURE_DIR,
+    FixtureMissingError,
+    load_fixture,
+)
+
+# 流式响应中每个片段的字符数
+CHUNK_SIZE = 64
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI 兼容的 /chat/completions 接口, 从 fixture 目录返回录制的响应.
+    配合 VPILOT_BASE_URL=http://host:port 使用, 可以在无网络的机器上
+    测量包括 HTTP 客户端在内的完整链路.
+    """
+
+    server_version = "vpilot-replay"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, payload):
+        data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"未知接口: {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model")
+        try:
+            fixture = load_fixture(
+                self.server.fixture_dir, model, request.get("messages", [])
+            )
+        except FixtureMissingError as e:
+            self._send_json(404, {"error": {"message": str(e)}})
+            return
+
+        usage = fixture.get("usage") or {}
+        usage = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("prompt_tokens", 0)
+            + usage.get("completion_tokens", 0),
+            "prompt_cache_hit_tokens": usage.get("cached_tokens", 0),
+        }
+        base = {
+            "id": "replay",
+            "created": int(time.time()),
+            "model": model,
+        }
+
+        if not request.get("stream"):
+            time.sleep(self.server.latency)
+            self._send_json(
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": fixture["content"],
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        content = fixture["content"]
+        chunks = [
+            content[i : i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)
+        ] or [""]
+        per_chunk = (self.server.latency - self.server.ttfb) / len(chunks)
+
+        time.sleep(self.server.ttfb)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        base["object"] = "chat.completion.chunk"
+        for chunk in chunks:
+            self._send_event(
+                {
+                    **base,
+                    "choices": [
+                        {"index": 0, "delta": {"content": chunk}, "finish_reason": None}
+                    ],
+                }
+            )
+            time.sleep(per_chunk)
+        self._send_event(
+            {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        )
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event({**base, "choices": [], "usage": usage})
+        data = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+def make_server(fixture_dir, host="127.0.0.1", port=8765, latency=0.0, ttfb=0.0):
+    """创建 (但不启动) 回放服务. port=0 时由系统分配端口 (见 server.server_port)."""
+    server = ThreadingHTTPServer((host, port), _ReplayHandler)
+    server.daemon_threads = True
+    server.fixture_dir = Path(fixture_dir)
+    server.latency = latency
+    server.ttfb = min(ttfb, latency)
+    return server
+
+
+def serve(fixture_dir, host="127.0.0.1", port=8765, latency=0.0, ttfb=0.0):
+    server = make_server(fixture_dir, host, port, latency, ttfb)
+    print(
+        f"回放服务已启动: http://{host}:{server.server_port} "
+        f"(fixtures: {fixture_dir}, 延迟 {latency}s)"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(
+    fixture_dir: Path = typer.Option(
+        DEFAULT_FIXTURE_DIR, "--fixtures", help="录制文件目录"
+    ),
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(8765, "--port"),
+    latency: float = typer.Option(0.0, "--latency", help="每次响应的总延迟 (秒)"),
+    ttfb: float = typer.Option(0.0, "--ttfb", help="首个片段之前的延迟 (秒)"),
+):
+    """
+    启动 OpenAI 兼容的本地回放服务. 使用方法:
+        python -m vpilot.core.replay_server --fixtures ./vpilot_fixtures
+        VPILOT_BASE_URL=http://127.0.0.1:8765 vpilot uvm build
+    """
+    serve(fixture_dir, host, port, latency, ttfb)
+
+
+if __name__ == "__main__":
+    typer.run(main)
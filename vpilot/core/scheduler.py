@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def plan_waves(tasks):
+    """
+    将带依赖声明的任务列表拆分为若干 "波次".
+
+    每个任务是一个 dict, 至少包含 'id' 和 'after' (它依赖的任务 id 列表).
+    同一波次内的任务互不依赖, 可以并发执行; 波次内保持原列表中的相对顺序,
+    从而保证结果合并的顺序是确定的.
+    """
+    known = {task["id"] for task in tasks}
+    for task in tasks:
+        unknown = [dep for dep in task.get("after", []) if dep not in known]
+        if unknown:
+            raise ValueError(f"任务 '{task['id']}' 依赖未知任务: {unknown}")
+
+    done = set()
+    pending = list(tasks)
+    waves = []
+    while pending:
+        wave = [t for t in pending if all(d in done for d in t.get("after", []))]
+        if not wave:
+            raise ValueError(f"任务依赖存在环: {[t['id'] for t in pending]}")
+        waves.append(wave)
+        done.update(t["id"] for t in wave)
+        pending = [t for t in pending if t["id"] not in done]
+    return waves
+
+
+def run_waves(tasks, worker, merge, max_workers=4, after_wave=None):
+    """
+    按波次执行任务图.
+
+    Args:
+        tasks: 任务列表 (见 plan_waves).
+        worker: worker(task) -> result, 在线程池中并发执行, 不应修改共享状态.
+        merge: merge(task, result), 在主线程中按任务列表顺序依次调用,
+               负责把结果写回共享状态 (文件, 上下文, 对话历史).
+        max_workers: 同时执行的最大任务数. 1 表示完全串行.
+        after_wave: 可选, after_wave(wave) 在每个波次合并完成后调用
+                    (例如把内存中的修改写回磁盘).
+
+    某个任务失败时, 同一波次中已经成功的任务仍然按顺序合并 (并调用 after_wave),
+    之后重新抛出第一个失败任务的异常, 不再执行后续波次.
+    """
+    waves = plan_waves(tasks)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for wave in waves:
+            futures = [pool.submit(worker, task) for task in wave]
+            # 先等待整个波次完成, 再按确定顺序合并
+            wait(futures)
+            error = None
+            for task, future in zip(wave, futures):
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                merge(task, future.result())
+            if after_wave:
+                after_wave(wave)
+            if error is not None:
+                raise error
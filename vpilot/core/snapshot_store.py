@@ -0,0 +1,118 @@
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from vpilot.core.workspace import atomic_write_text
+
+DEFAULT_SNAPSHOT_DIR = Path("./vpilot_run/snapshots")
+
+
+class SnapshotStore:
+    """
+    uvm_tb/ 的内容寻址快照.
+
+    对象: objects/<sha[:2]>/<sha>, 文件内容的 SHA-256 寻址, 相同内容只存一份.
+    清单: manifests/<n>.json = {"id", "label", "time", "files": {相对路径: sha}}.
+    内容与最新快照相同时不创建新快照, 因此每个快照只新增变化的文件和一个小清单.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or DEFAULT_SNAPSHOT_DIR)
+        self.objects_dir = self.root / "objects"
+        self.manifests_dir = self.root / "manifests"
+
+    @staticmethod
+    def hash_content(content):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _object_path(self, sha):
+        return self.objects_dir / sha[:2] / sha
+
+    def put_object(self, content):
+        sha = self.hash_content(content)
+        path = self._object_path(sha)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(path, content)
+        return sha
+
+    def read_object(self, sha):
+        return self._object_path(sha).read_text(encoding="utf-8")
+
+    def ids(self):
+        if not self.manifests_dir.is_dir():
+            return []
+        return sorted(
+            int(path.stem)
+            for path in self.manifests_dir.glob("*.json")
+            if path.stem.isdigit()
+        )
+
+    def get(self, snapshot_id):
+        """返回快照清单. 不存在时抛出 KeyError."""
+        path = self.manifests_dir / f"{snapshot_id}.json"
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise KeyError(snapshot_id) from None
+
+    def latest(self):
+        ids = self.ids()
+        return self.get(ids[-1]) if ids else None
+
+    def commit(self, files, label):
+        """
+        记录一个快照. files: {相对路径: 内容}.
+        返回 (清单, 是否新建); 内容与最新快照相同时返回最新快照.
+        """
+        hashes = {path: self.put_object(content) for path, content in files.items()}
+        latest = self.latest()
+        if latest and latest["files"] == hashes:
+            return latest, False
+
+        manifest = {
+            "id": latest["id"] + 1 if latest else 1,
+            "label": label,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "files": dict(sorted(hashes.items())),
+        }
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(
+            self.manifests_dir / f"{manifest['id']}.json",
+            json.dumps(manifest, ensure_ascii=False, indent=2),
+        )
+        return manifest, True
+
+    def load_files(self, manifest):
+        """返回快照中所有文件的内容: {相对路径: 内容}."""
+        return {path: self.read_object(sha) for path, sha in manifest["files"].items()}
+
+    def checkout(self, snapshot_id, target_dir):
+        """
+        把 target_dir 恢复到快照 snapshot_id: 只重写内容不同的文件,
+        并删除最新快照中有, 但目标快照中没有的文件.
+        返回 (写入的文件, 删除的文件).
+        """
+        target_dir = Path(target_dir)
+        manifest = self.get(snapshot_id)
+        written = []
+        for path, sha in manifest["files"].items():
+            file_path = target_dir / path
+            try:
+                current = self.hash_content(file_path.read_text(encoding="utf-8"))
+            except (OSError, UnicodeDecodeError):
+                current = None
+            if current != sha:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_text(file_path, self.read_object(sha))
+                written.append(path)
+
+        removed = []
+        latest = self.latest()
+        for path in sorted(set(latest["files"]) - set(manifest["files"])):
+            file_path = target_dir / path
+            if file_path.exists():
+                file_path.unlink()
+                removed.append(path)
+        return written, removed
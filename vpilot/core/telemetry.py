@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+TELEMETRY_FILE = Path("./vpilot_run/telemetry.jsonl")
+
+# 价格 (美元 / 百万 tokens), 默认取 deepseek-chat 的标价, 可通过环境变量覆盖
+PRICE_INPUT = float(os.getenv("VPILOT_PRICE_INPUT", "0.27"))
+PRICE_CACHED_INPUT = float(os.getenv("VPILOT_PRICE_CACHED_INPUT", "0.07"))
+PRICE_OUTPUT = float(os.getenv("VPILOT_PRICE_OUTPUT", "1.10"))
+
+_context = {"command": None}
+_lock = threading.Lock()
+
+
+def set_command(command):
+    """设置当前命令 (例如 'uvm build'), 之后的所有记录都会带上它."""
+    _context["command"] = command
+
+
+def extract_usage(usage):
+    """
+    从 API 返回的 usage 对象中提取 token 统计.
+    兼容 DeepSeek (prompt_cache_hit_tokens) 和 OpenAI
+    (prompt_tokens_details.cached_tokens) 两种缓存命中字段.
+    """
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached or 0,
+    }
+
+
+def estimate_cost(prompt_tokens, completion_tokens, cached_tokens):
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (
+        uncached * PRICE_INPUT
+        + cached_tokens * PRICE_CACHED_INPUT
+        + completion_tokens * PRICE_OUTPUT
+    ) / 1_000_000
+
+
+def record(**fields):
+    """向 telemetry.jsonl 追加一条记录. 写入失败不影响主流程."""
+    entry = {"ts": time.time(), "command": _context["command"], **fields}
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    try:
+        with _lock:
+            TELEMETRY_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(TELEMETRY_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"WARNING: 写入 telemetry 失败: {e}")
+
+
+def load_records(path=TELEMETRY_FILE):
+    """读取所有记录, 跳过损坏的行 (例如进程中断时写了一半的行)."""
+    records = []
+    if not path.exists():
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
@@ -0,0 +1,98 @@
+import os
+import threading
+from pathlib import Path
+
+
+def atomic_write_text(path, content):
+    """原子写入: 写临时文件再替换, 中断时不会留下写了一半的文件."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class Workspace:
+    """
+    uvm_tb/ 的内存视图.
+
+    构造时把 files 指定的文本文件 (相对于 root) 一次性读入内存, 不在 files 中的文件
+    (例如 'make' 生成的 sim_build/, results.xml 和日志) 不进入工作区;
+    files 为 None 时读入目录下的所有文本文件 (__pycache__ 除外).
+    之后的读取和代码块更新都只在内存中进行,
+    由调用者在合适的时机 (例如每个波次结束时) 调用 flush() 把修改过的文件写回磁盘.
+    所有操作共用一把锁 (lock), 并发的任务不会读到更新了一半的内容.
+    """
+
+    def __init__(self, root, files=None):
+        self.root = Path(root)
+        self.lock = threading.RLock()
+        self._files = {}
+        # 每个文件的修改次数, 供 CodeManager 判断代码块索引是否过期
+        self._revisions = {}
+        self._dirty = set()
+        if files is None:
+            files = [
+                path.relative_to(self.root)
+                for path in self.root.rglob("*")
+                if path.is_file() and "__pycache__" not in path.parts
+            ]
+        for relative_file in sorted(self._key(f) for f in files):
+            try:
+                content = (self.root / relative_file).read_text(encoding="utf-8")
+            except (FileNotFoundError, UnicodeDecodeError):
+                # 不存在的文件和非文本文件不进入工作区, 保持磁盘上的原样
+                continue
+            self._files[relative_file] = content
+
+    @staticmethod
+    def _key(relative_file):
+        return Path(relative_file).as_posix()
+
+    def exists(self, relative_file):
+        return self._key(relative_file) in self._files
+
+    def read(self, relative_file):
+        with self.lock:
+            try:
+                return self._files[self._key(relative_file)]
+            except KeyError:
+                raise FileNotFoundError(self.root / relative_file) from None
+
+    def revision(self, relative_file):
+        return self._revisions.get(self._key(relative_file), 0)
+
+    def write(self, relative_file, content):
+        key = self._key(relative_file)
+        with self.lock:
+            if self._files.get(key) == content:
+                return
+            self._files[key] = content
+            self._revisions[key] = self._revisions.get(key, 0) + 1
+            self._dirty.add(key)
+
+    def snapshot(self, relative_files=None):
+        """
+        一次性取出多个文件的内容: {文件: 内容}, 不存在的文件为 None.
+        不指定 relative_files 时返回工作区中的所有文件.
+        """
+        with self.lock:
+            if relative_files is None:
+                return dict(self._files)
+            return {f: self._files.get(self._key(f)) for f in relative_files}
+
+    @property
+    def dirty(self):
+        with self.lock:
+            return sorted(self._dirty)
+
+    def flush(self):
+        """把修改过的文件逐个原子写回磁盘. 返回写入的文件列表."""
+        with self.lock:
+            written = []
+            for key in sorted(self._dirty):
+                path = self.root / key
+                path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_text(path, self._files[key])
+                written.append(key)
+            self._dirty.clear()
+            return written
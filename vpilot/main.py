@@ -1,11 +1,90 @@
+import importlib
+import os
+
 import typer
-from vpilot.commands import spec, plan, uvm
+from typer.core import TyperGroup
+
+# 子命令 -> (模块, 属性, 帮助). 模块在第一次执行该子命令时才导入,
+# 'vpilot --help' 等命令不必加载 LLM 客户端和各阶段的依赖.
+LAZY_COMMANDS = {
+    "spec": ("vpilot.commands.spec", "app", "管理<设计规范>的生成和迭代"),
+    "plan": ("vpilot.commands.plan", "app", "管理<验证计划>的生成和迭代"),
+    "uvm": ("vpilot.commands.uvm", "app", "管理 UVM 测试平台的构建和迭代"),
+    "batch": (
+        "vpilot.commands.batch",
+        "batch",
+        "批量处理 RTL 目录或清单中的多个模块 (spec -> plan -> uvm).",
+    ),
+    "stats": (
+        "vpilot.commands.stats",
+        "stats",
+        "汇总 LLM 调用的延迟, token 和成本 (telemetry.jsonl).",
+    ),
+}
+
+
+class LazyTyperGroup(TyperGroup):
+    """按需导入子命令模块的命令组."""
+
+    _listing = False
+
+    def list_commands(self, ctx):
+        return super().list_commands(ctx) + [
+            name for name in LAZY_COMMANDS if name not in self.commands
+        ]
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.commands or cmd_name not in LAZY_COMMANDS:
+            return super().get_command(ctx, cmd_name)
+
+        module_name, attr, help_text = LAZY_COMMANDS[cmd_name]
+        if self._listing:
+            # 只是列出帮助信息, 用占位命令代替, 不导入模块
+            return TyperGroup(name=cmd_name, help=help_text)
+
+        target = getattr(importlib.import_module(module_name), attr)
+        if isinstance(target, typer.Typer):
+            command = typer.main.get_group(target)
+        else:
+            wrapper = typer.Typer(add_completion=False)
+            wrapper.command(cmd_name, help=help_text)(target)
+            command = typer.main.get_command(wrapper)
+        command.name = cmd_name
+        self.commands[cmd_name] = command
+        return command
+
+    def format_help(self, ctx, formatter):
+        self._listing = True
+        try:
+            return super().format_help(ctx, formatter)
+        finally:
+            self._listing = False
+
+
+app = typer.Typer(
+    cls=LazyTyperGroup, help="v-pilot: Simulation Testing Assisted Generation Tool."
+)
+
 
-app = typer.Typer(help="v-pilot: Simulation Testing Assisted Generation Tool.")
+@app.callback()
+def main(
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="不读写 LLM 响应缓存, 每次都调用 API."
+    ),
+    refresh: bool = typer.Option(
+        False, "--refresh", help="忽略已缓存的响应, 重新调用 API 并更新缓存."
+    ),
+):
+    """
+    全局选项, 作用于所有子命令 (例如: 'vpilot --refresh uvm build').
+    """
+    # 通过环境变量传给 llm_handler (首次调用 API 时读取), 不调用 LLM 的子命令
+    # 不需要导入它. 没有指定时保留已有的设置 (例如用户导出的 VPILOT_LLM_CACHE)
+    if no_cache:
+        os.environ["VPILOT_LLM_CACHE"] = "off"
+    elif refresh:
+        os.environ["VPILOT_LLM_CACHE"] = "refresh"
 
-app.add_typer(spec.app, name="spec")
-app.add_typer(plan.app, name="plan")
-app.add_typer(uvm.app, name="uvm")
 
 if __name__ == "__main__":
     app()